@@ -0,0 +1,229 @@
+"""
+Benchmark the session and statistics hot paths
+
+Runs headless on Qt's offscreen platform with a synthetic station whose
+queue and history hold 10, 1k, 100k and 1M sessions. The results are
+compared to the saved baseline, a result slower than the baseline by more
+than the tolerance is reported as a regression (exit code 1).
+
+Usage: python benchmark.py [--sizes 10,1000] [--tolerance 0.25] [--save-baseline]
+The data is saved to a temporary folder (set before the application is
+imported), the real data file is not touched
+"""
+# pylint: disable=no-name-in-module
+import os
+import tempfile
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+from src.data.data_manager import FILE_ENV_VAR
+# Keep the real data file untouched, the application loads its data on import
+SAVE_FOLDER = tempfile.mkdtemp(prefix='gsm_benchmark_')
+os.environ[FILE_ENV_VAR] = os.path.join(SAVE_FOLDER, 'data.pkl')
+from src import app
+from src.core import Session
+from src.clock import clock
+from src.data.data_manager import DataManager
+from src.occupancy import OccupancyTimeline
+import test_main
+import datetime as dt
+import argparse
+import json
+import time
+import sys
+# Code annotation
+from typing import (Callable, Dict, List, Tuple)
+SIZES = [10, 1_000, 100_000, 1_000_000]
+TOLERANCE = 0.25
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+SESSIONS_PER_DAY = 10
+CUSTOMER_NAMES = 5000
+OCCUPANCY_STATIONS = 24
+
+
+def history_sessions(n: int, end_date: dt.datetime) -> List[Session]:
+    """
+    Tracked sessions of the days before the end date,
+    one hour long each, oldest first
+    """
+    sessions = []
+    first_day = end_date.date() - dt.timedelta(days=n // SESSIONS_PER_DAY + 1)
+    for i in range(n):
+        day, slot = divmod(i, SESSIONS_PER_DAY)
+        start_date = dt.datetime.combine(first_day + dt.timedelta(days=day), dt.time(9 + slot))
+        sessions.append(Session(customerName=f'Customer {i % CUSTOMER_NAMES}',
+                                start_date=start_date,
+                                duration=dt.time(1, 0)))
+    return sessions
+
+
+def queue_sessions(n: int, start_date: dt.datetime) -> List[Session]:
+    """
+    Back to back queued sessions from the start date on,
+    half an hour long each
+    """
+    return [Session(customerName=f'Customer {i % CUSTOMER_NAMES}',
+                    start_date=start_date + dt.timedelta(minutes=30 * i),
+                    duration=dt.time(0, 30))
+            for i in range(n)]
+
+
+def measure(run: Callable, setup: Callable = None, repeat: int = 5) -> float:
+    """
+    Returns(float):
+        Fastest of the repeated runs in seconds
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_size(n: int, station, save_folder: str) -> Dict[str, float]:
+    """
+    Time all hot paths with n sessions
+
+    Returns(dict):
+        Seconds by benchmark name
+    """
+    repeat = 5 if n <= 1_000 else 1
+    tracker = station.sessionTracker
+    windows = app.winManager.windows
+    datetime_now = clock.now()
+    queue = queue_sessions(n, datetime_now + dt.timedelta(hours=1))
+    history = history_sessions(n, datetime_now)
+    results = {}
+
+    # -Session queue-
+    def setup_queue():
+        station.update(sessions=queue)
+
+    results['Station.add_session'] = measure(
+        lambda: station.add_session(customerName='Benchmark', start_date=None, duration=dt.time(0, 30)),
+        setup_queue, repeat)
+    results['Station._update_sessions'] = measure(station._update_sessions, setup_queue, repeat)
+    station.update(sessions=[])
+
+    # -Session history-
+    def setup_history():
+        tracker.update(history, override=True)
+        tracker._update_index()
+
+    setup_history()
+    results['SessionTracker.calculate_stats'] = measure(lambda: tracker.calculate_stats(tracker.tracked_sessions),
+                                                        repeat=repeat)
+    results['SessionTracker.add_session_to_history'] = measure(
+        lambda: tracker.add_session_to_history(Session(customerName='Benchmark',
+                                                       start_date=datetime_now - dt.timedelta(minutes=30),
+                                                       duration=dt.time(0, 30))),
+        setup_history, repeat)
+
+    def setup_outdated_index():
+        tracker._index_outdated = True
+
+    results['SessionTracker._update_index'] = measure(tracker._update_index, setup_outdated_index, repeat)
+
+    # -Occupancy-
+    # The history spread over the stations, one of them changed before every run
+    histories = {f'Benchmark {i}': history[i::OCCUPANCY_STATIONS] for i in range(OCCUPANCY_STATIONS)}
+    timeline = OccupancyTimeline()
+
+    def setup_occupancy():
+        timeline.invalidate_device('Benchmark 0')
+
+    results['OccupancyTimeline.occupancy'] = measure(
+        lambda: timeline.occupancy(histories, history[0].start_date, datetime_now), setup_occupancy, repeat)
+
+    # -History table-
+    windows['history'].setProperty('stationID', station.stationID)
+    windows['history'].lineEdit_search.setText('')
+    proxyModel = windows['history'].tableView_history.model()
+
+    def setup_table():
+        proxyModel.set_rows([])
+
+    results['history table fill'] = measure(tracker._historyWindow_updateTable, setup_table, repeat)
+
+    # -Persistence-
+    dataManager = DataManager(default_data={'tracked_sessions': {station.device.deviceID: history}},
+                              file_path=os.path.join(save_folder, f'benchmark_{n}.pkl'))
+    results['DataManager.save_file'] = measure(dataManager.save_file, repeat=repeat)
+    results['DataManager._load_file'] = measure(dataManager._load_file, repeat=repeat)
+    os.remove(dataManager.file_path)
+
+    # -Export-
+    export_path = os.path.join(save_folder, f'benchmark_{n}.xlsx')
+    results['export'] = measure(
+        lambda: app.winManager.write_history_export(export_path, {station.device.deviceID: history}),
+        repeat=repeat)
+    os.remove(export_path)
+    tracker.update([], override=True)
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[Tuple[str, float, float]]:
+    """
+    Print the results next to the baseline
+
+    Returns(list):
+        (name, seconds, baseline seconds) of the regressions
+    """
+    regressions = []
+    print(f"{'Benchmark':<52}{'Time':>12}{'Baseline':>12}{'Change':>10}")
+    for name, seconds in results.items():
+        line = f'{name:<52}{seconds * 1000:>10.3f}ms'
+        if name in baseline:
+            change = seconds / baseline[name] - 1 if baseline[name] else 0.0
+            line += f'{baseline[name] * 1000:>10.3f}ms{change:>+10.0%}'
+            if change > tolerance:
+                line += '  REGRESSION'
+                regressions.append((name, seconds, baseline[name]))
+        print(line)
+    return regressions
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the session and statistics hot paths')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in SIZES),
+                        help='Comma separated numbers of sessions')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='Allowed slowdown compared to the baseline (0.25 = 25%%)')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Save the results as the new baseline')
+    args = parser.parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    # New data file without a login -> never searches for real plugs
+    app.run()
+    app.winManager._update_stations([app.Device(device=test_main.HS100Device(0),
+                                                deviceID='benchmark',
+                                                deviceName='Benchmark Device')])
+    station = app.winManager.stations[0]
+    station.is_activated = True
+
+    results = {}
+    for n in sizes:
+        for name, seconds in benchmark_size(n, station, SAVE_FOLDER).items():
+            results[f'{name} [{n}]'] = seconds
+
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+    regressions = compare(results, baseline, args.tolerance)
+    if args.save_baseline:
+        baseline.update(results)
+        with open(BASELINE_FILE, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=4, sort_keys=True)
+        print(f'Baseline saved to {BASELINE_FILE}')
+        return 0
+    if regressions:
+        print(f'{len(regressions)} regression(s) over {args.tolerance:.0%}')
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -3,7 +3,6 @@ block_cipher = None
 import os
 
 files = [
-    ('../src/data/data/generated_ui_files/*.ui', 'data/generated_ui_files'),
     ('../src/resources/images/*', 'resources/images'),
     ('../src/resources/ui_files/*', 'resources/ui_files'),
 ]
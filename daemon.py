@@ -0,0 +1,222 @@
+"""
+Run the stations as a background service without a window
+
+The daemon searches the plugs of the Kasa account, runs the session queues
+and switches the plugs, and serves the local HTTP/JSON API of src/api.py.
+The application becomes a client of it with GSM_DAEMON_URL=http://127.0.0.1:8765.
+
+The data is saved to daemon.pkl next to the data file of the application
+(on the first start the login, histories, recurring and queued sessions of
+the application are taken over), every minute if something changed and on exit.
+
+Usage: python daemon.py [--host 127.0.0.1] [--port 8765] [--data PATH] [--fake N] [--activate]
+    --fake N     Run N fake plugs instead of searching the Kasa account (testing on localhost)
+    --activate   Activate all stations on start
+"""
+from src.service import StationService
+from src.api import (ApiServer, DEFAULT_HOST, DEFAULT_PORT)
+from src.data import data_manager
+from src.data.data_manager import DataManager
+from src.diagnostics import diagnostics
+from src.billing import revenue
+from src import constants as const
+import argparse
+import asyncio
+import datetime as dt
+import os
+import signal
+import sys
+import threading
+import time
+# Code annotation
+from typing import (List, Tuple)
+TICK_INTERVAL = 1  # Seconds
+PERSIST_INTERVAL = 60  # Seconds
+DISCOVERY_INTERVAL = const.DEVICE_DISCOVERY_INTERVAL / 1000  # Seconds
+DATA_FILE = 'daemon.pkl'
+APP_DATA_FILE = 'data.pkl'
+DEFAULT_DATA = {'username': '',
+                'password': '',
+                'tracked_sessions': {},
+                'recurring_sessions': {},
+                'queued_sessions': {},
+                }
+
+
+class FakePlug:
+    """Plug of the --fake mode, prints its power commands"""
+
+    def __init__(self, deviceName: str):
+        self.deviceName = deviceName
+
+    def power_on(self):
+        print(f"[{dt.datetime.now().strftime('%H:%M:%S')}] {self.deviceName}: ON")
+
+    def power_off(self):
+        print(f"[{dt.datetime.now().strftime('%H:%M:%S')}] {self.deviceName}: OFF")
+
+
+def find_plugs(username: str, password: str) -> List[Tuple[str, str, object]]:
+    """
+    Search the plugs of the Kasa account (blocking)
+    Raises ValueError for an invalid login
+
+    Returns(list):
+        (deviceID, deviceName, plug) of the found plugs
+    """
+    # TP-Link (pulls in a whole HTTP stack)
+    from tplinkcloud import TPLinkDeviceManager
+    device_manager = TPLinkDeviceManager(username, password)
+    if device_manager._auth_token is None:
+        raise ValueError('Invalid username and/or password')
+    return [(plug.device_id, plug.get_alias(), plug) for plug in device_manager.get_devices()]
+
+
+def load_data(file_path: str) -> DataManager:
+    """
+    Load the data of the daemon, the first start takes
+    over the saved data of the application
+    """
+    first_start = not os.path.exists(file_path)
+    dataManager = DataManager(default_data=DEFAULT_DATA, file_path=file_path)
+    app_data_path = os.path.join(dataManager.save_folder, APP_DATA_FILE)
+    if first_start and os.path.exists(app_data_path):
+        app_data = DataManager(default_data={}, file_path=app_data_path).data
+        dataManager.data = dict(dataManager.data, **{key: app_data[key] for key in DEFAULT_DATA if key in app_data})
+    return dataManager
+
+
+class Daemon:
+    """
+    Event loop of the service: ticks, API requests, saving and plug searches
+
+    Paramaters:
+        args(argparse.Namespace):
+            Command line arguments
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.dataManager = load_data(args.data)
+        diagnostics.log_folder = self.dataManager.save_folder
+        try:
+            revenue.load_rates(self.dataManager.save_folder)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            diagnostics.log(f'Rate table not loaded ({e!r}), using the example rates')
+        self.service = StationService(run_command=self.run_command)
+        self.service.load(self.dataManager.data)
+        self.server = ApiServer(self.service, args.host, args.port)
+        self._threads: List[threading.Thread] = []
+        self._stop = None
+
+    def run_command(self, command):
+        """
+        Run a plug command on its own daemon thread
+        (A hung plug can not keep the daemon from exiting)
+        """
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        thread = threading.Thread(target=command, name='PlugCommand', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    async def search_plugs(self):
+        """
+        Update the stations with the found plugs
+        (A failed search keeps the current stations)
+        """
+        if self.args.fake:
+            plugs = [(f'fake-{x}', f'Device {x:04d}', FakePlug(f'Device {x:04d}')) for x in range(self.args.fake)]
+        else:
+            data = self.dataManager.data
+            if not (data.get('username') and data.get('password')):
+                diagnostics.log('Daemon: no login data, start the application once to log in')
+                return
+            try:
+                plugs = await asyncio.get_running_loop().run_in_executor(None, find_plugs, data['username'],
+                                                                         data['password'])
+            except Exception as e:
+                diagnostics.log(f'Daemon: plug search failed: {e!r}')
+                return
+        self.service.set_plugs(plugs)
+
+    async def persist(self):
+        """Save the data (written on a worker thread)"""
+        snapshot = self.service.snapshot()
+        data = dict(self.dataManager.data, **snapshot)
+
+        def write():
+            self.dataManager.data = data
+        await asyncio.get_running_loop().run_in_executor(None, write)
+
+    async def _every(self, seconds: float, callback):
+        while True:
+            await asyncio.sleep(seconds)
+            try:
+                await callback()
+            except Exception as e:
+                # Keep the loop running
+                diagnostics.log(f'Daemon: {callback.__name__} failed: {e!r}')
+
+    async def _tick(self):
+        self.service.tick()
+
+    async def _persist_changes(self):
+        if self.service.changed:
+            await self.persist()
+
+    async def run(self):
+        self._stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._stop.set)
+            except (NotImplementedError, AttributeError):
+                # Windows: KeyboardInterrupt ends asyncio.run
+                pass
+        await self.search_plugs()
+        if self.args.activate:
+            for stationID in self.service.stations:
+                self.service.set_activated(stationID, True)
+        await self.server.start()
+        print(f'Serving {len(self.service.stations)} station(s) on http://{self.server.host}:{self.server.port}',
+              flush=True)
+        tasks = [asyncio.ensure_future(self._every(TICK_INTERVAL, self._tick)),
+                 asyncio.ensure_future(self._every(PERSIST_INTERVAL, self._persist_changes)),
+                 asyncio.ensure_future(self._every(DISCOVERY_INTERVAL, self.search_plugs))]
+        try:
+            await self._stop.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await self.server.stop()
+            await self.shutdown()
+
+    async def shutdown(self):
+        """Turn off all plugs and save the data"""
+        self.service.power_off_all()
+        await self.persist()
+        deadline = time.perf_counter() + const.SHUTDOWN_TIMEOUT
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.perf_counter()))
+        if any(thread.is_alive() for thread in self._threads):
+            text = 'Daemon: plugs not confirmed turned off on exit'
+            print(text, file=sys.stderr)
+            diagnostics.log(text)
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Run the stations without a window and serve the local API')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='Address to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on (0 = any free port)')
+    parser.add_argument('--data', default=os.path.join(data_manager.abs_path, 'data', DATA_FILE),
+                        help='Data file of the daemon')
+    parser.add_argument('--fake', type=int, default=0, metavar='N', help='Run N fake plugs')
+    parser.add_argument('--activate', action='store_true', help='Activate all stations on start')
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(Daemon(parse_args(sys.argv[1:])).run())
+    except KeyboardInterrupt:
+        pass
@@ -1,7 +1,9 @@
 """
 Run the application
 """
-from src import app
+from src.startup_profiler import profiler
+with profiler.phase('imports'):
+    from src import app
 import sys
 
 if __name__ == "__main__":
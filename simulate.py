@@ -0,0 +1,180 @@
+"""
+Simulate a day of operation at an accelerated speed
+
+Plays a scripted day of bookings for a number of stations against the
+fake plugs of test_main, while the application clock runs SPEED times
+faster than real time. Used to load test the station refresh, the device
+dispatch and the persistence under peak traffic.
+
+Usage: python simulate.py [number of stations] [speed]
+The data is saved to a temporary folder (set before the application is
+imported), the real data file is not touched
+"""
+# pylint: disable=no-name-in-module
+import os
+import tempfile
+from src.data.data_manager import FILE_ENV_VAR
+# Keep the real data file untouched, the application loads its data on import
+os.environ[FILE_ENV_VAR] = os.path.join(tempfile.mkdtemp(prefix='gsm_simulation_'), 'data.pkl')
+from src import app
+from src.clock import clock
+import test_main
+from PySide2.QtCore import (QTimer)
+from collections import deque
+import datetime as dt
+import random
+import statistics
+import time
+import sys
+NUM_STATIONS = 9
+SPEED = 1000
+SEED = 0
+OPENING_TIME = dt.time(8, 0)
+CLOSING_TIME = dt.time(23, 0)
+PEAK_HOURS = range(17, 21)
+DURATIONS = [dt.time(0, 30), dt.time(1, 0), dt.time(1, 30), dt.time(2, 0)]
+TICK_INTERVAL = 10  # Real milliseconds between two checks of the script
+PERSIST_INTERVAL = dt.timedelta(hours=1)
+
+
+class CountingDevice(test_main.HS100Device):
+    """Fake plug counting its power commands"""
+    power_ons = 0
+    power_offs = 0
+
+    def power_on(self):
+        CountingDevice.power_ons += 1
+        super().power_on()
+
+    def power_off(self):
+        CountingDevice.power_offs += 1
+        super().power_off()
+
+
+def create_script(num_stations: int, day: dt.date, rng: random.Random) -> list:
+    """
+    Create the bookings of a day, sorted by the time they are made at
+
+    Returns(list):
+        (booked_at, stationID, customerName, start_date, duration) tuples
+    """
+    script = []
+    opening = dt.datetime.combine(day, OPENING_TIME)
+    closing = dt.datetime.combine(day, CLOSING_TIME)
+    for stationID in range(num_stations):
+        start_date = opening
+        while True:
+            # Bookings follow each other closely in the peak hours
+            if start_date.hour in PEAK_HOURS:
+                gap = rng.choice([0, 0, 0, 15])
+            else:
+                gap = rng.choice([0, 15, 30, 60])
+            start_date += dt.timedelta(minutes=gap)
+            duration = rng.choice(DURATIONS)
+            end_date = start_date + dt.timedelta(hours=duration.hour, minutes=duration.minute)
+            if end_date > closing:
+                break
+            # Booked in advance or as walk-in
+            booked_at = max(opening - dt.timedelta(minutes=30),
+                            start_date - dt.timedelta(minutes=rng.choice([0, 0, 15, 60, 120])))
+            script.append((booked_at, stationID, f'Customer {rng.randrange(1, 500)}', start_date, duration))
+            start_date = end_date
+    script.sort(key=lambda booking: booking[0])
+    return script
+
+
+class Simulation:
+    """
+    Drive the application through a scripted day
+
+    Paramaters:
+        num_stations(int):
+            Number of fake plugs
+        speed(float):
+            Simulated seconds passing per real second
+    """
+
+    def __init__(self, num_stations: int, speed: float):
+        self.num_stations = num_stations
+        self.speed = speed
+        self.day = dt.date.today()
+        self.script = deque(create_script(num_stations, self.day, random.Random(SEED)))
+        self.end_date = dt.datetime.combine(self.day, CLOSING_TIME) + dt.timedelta(minutes=30)
+        # Statistics
+        self.booked = 0
+        self.refresh_durations = []
+        self.persist_durations = []
+        self._next_persist = None
+        self._real_start = 0.0
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.tick)
+
+    def start(self):
+        start_date = dt.datetime.combine(self.day, OPENING_TIME) - dt.timedelta(minutes=30)
+        clock.simulate(start_date, self.speed)
+        self._real_start = time.perf_counter()
+        self._next_persist = start_date + PERSIST_INTERVAL
+        devices = [app.Device(device=CountingDevice(x),
+                              deviceID=x,
+                              deviceName=f'Device {x:04d}')
+                   for x in range(self.num_stations)]
+        app.winManager._update_stations(devices)
+        for station in app.winManager.stations.values():
+            station.is_activated = True
+        self.timer.start(TICK_INTERVAL)
+
+    def tick(self):
+        datetime_now = clock.now()
+        # Make the bookings that are due
+        while self.script and self.script[0][0] <= datetime_now:
+            _, stationID, customerName, start_date, duration = self.script.popleft()
+            app.winManager.stations[stationID].add_session(customerName=customerName,
+                                                           start_date=start_date,
+                                                           duration=duration)
+            self.booked += 1
+        # Refresh all stations once per tick, on top of their own timers
+        app.winManager.refresh()
+        self.refresh_durations.append(app.winManager.refresh_duration)
+        if datetime_now >= self._next_persist:
+            self._next_persist += PERSIST_INTERVAL
+            self.persist()
+        if datetime_now >= self.end_date:
+            self.finish()
+
+    def persist(self):
+        """Save the tracked sessions the way the application does on exit"""
+        start = time.perf_counter()
+        new_tracked_sessions = app.settingsManager.value('tracked_sessions')
+        for station in app.winManager.stations.values():
+            if station.device is not None:
+                new_tracked_sessions[station.device.deviceID] = station.sessionTracker.tracked_sessions
+        app.settingsManager.setValue('tracked_sessions', new_tracked_sessions)
+        self.persist_durations.append(time.perf_counter() - start)
+
+    def finish(self):
+        self.timer.stop()
+        real_duration = time.perf_counter() - self._real_start
+        tracked = sum(len(station.sessionTracker.tracked_sessions) for station in app.winManager.stations.values())
+
+        def ms(values: list) -> str:
+            if not values:
+                return '-'
+            return f'mean {statistics.mean(values) * 1000:.2f} ms, max {max(values) * 1000:.2f} ms'
+
+        print(f'Simulated {self.num_stations} station(s) at {self.speed:g}x in {real_duration:.1f} s')
+        print(f'  Bookings made:    {self.booked}')
+        print(f'  Sessions tracked: {tracked}')
+        print(f'  Refresh:          {ms(self.refresh_durations)}')
+        print(f'  Persist:          {ms(self.persist_durations)}')
+        print(f'  Device commands:  {CountingDevice.power_ons} on, {CountingDevice.power_offs} off')
+        app.app.quit()
+
+
+if __name__ == "__main__":
+    num_stations = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_STATIONS
+    speed = float(sys.argv[2]) if len(sys.argv) > 2 else SPEED
+    # New data file without a login -> never searches for real plugs
+    app.run()
+    simulation = Simulation(num_stations, speed)
+    QTimer.singleShot(0, simulation.start)
+    sys.exit(app.app.exec_())
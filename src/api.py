@@ -0,0 +1,327 @@
+"""
+Local HTTP/JSON API of the station service
+
+Served by the daemon (daemon.py) on http://127.0.0.1:<port>, every
+request and response body is a JSON object. Sessions are written as
+
+    {"sessionID": 12, "customerName": "Team A", "start": "2021-06-04T18:00:00",
+     "end": "2021-06-04T19:30:00", "length": 5400}
+
+(dates are local time, the length is in seconds). New sessions take
+either a "length" or an "end". Queued occurrences of a recurring session
+also have the "ruleID" of their recurring session.
+
+    GET    /stations                                List the stations
+    GET    /stations/<id>?history_since=<n>         Station with its queue (and the history from entry n on)
+    PUT    /stations/<id>                           {"is_activated": bool}
+    GET    /stations/<id>/sessions?day=<date>       Queued sessions (of the day)
+    POST   /stations/<id>/sessions                  Add a session
+    POST   /stations/<id>/sessions/import           {"sessions": [...]}, add many sessions at once
+    PATCH  /stations/<id>/sessions/<sessionID>      Change the customerName, start, end and/or length
+    DELETE /stations/<id>/sessions/<sessionID>      Delete a session
+    DELETE /stations/<id>/sessions                  {"sessionIDs": [...]}, delete many sessions at once
+    POST   /stations/<id>/recurrences               {..., "rrule": "FREQ=WEEKLY;INTERVAL=1"}
+    DELETE /stations/<id>/recurrences/<ruleID>      Delete a recurring session and its queued occurrences
+    GET    /stations/<id>/history?since=<n>         History from entry n on
+    GET    /stations/<id>/stats                     Stats and revenue of the history
+    GET    /stats?start=<date>&end=<date>           Occupancy and revenue of all stations
+
+Adding or changing a session that overlaps queued sessions fails with
+409 and the conflicting sessions, unless "replace": true is sent.
+Errors are {"error": "<message>"} with the HTTP status
+"""
+# -Root imports-
+from .diagnostics import diagnostics
+from .core import (InvalidSessionError, Session, to_seconds)
+from .api_json import (ApiError, format_date, parse_date, parse_length, session_from_json, session_to_json,
+                       stats_to_json)
+from .service import (ConflictError, StationService)
+from .billing import revenue
+from .occupancy import occupancy
+# -Other-
+from http import HTTPStatus
+from urllib.parse import (parse_qs, urlsplit)
+import asyncio
+import datetime as dt
+import json
+import re
+# Code annotation
+from typing import (Callable, Dict, List, Tuple, Union)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+MAX_BODY = 10 * 1024 * 1024  # Bytes
+
+
+# -Server-
+class ApiServer:
+    """
+    asyncio HTTP server of the API
+
+    Every connection is handled by its own task, the service is only
+    used from the event loop, so the requests need no locks
+
+    Paramaters:
+        service(StationService):
+            Stations to serve
+        host(str):
+            Address to listen on (local only by default)
+        port(int):
+            Port to listen on, 0 for any free port
+    """
+
+    def __init__(self, service: StationService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        self.service = service
+        self.host = host
+        self.port = port
+        self.server: Union[asyncio.AbstractServer, None] = None
+        # (method, path pattern, handler)
+        self.routes: List[Tuple[str, 're.Pattern', Callable]] = [
+            ('GET', r'/stations', self.get_stations),
+            ('GET', r'/stations/(\d+)', self.get_station),
+            ('PUT', r'/stations/(\d+)', self.put_station),
+            ('GET', r'/stations/(\d+)/sessions', self.get_sessions),
+            ('POST', r'/stations/(\d+)/sessions', self.post_session),
+            ('DELETE', r'/stations/(\d+)/sessions', self.delete_sessions),
+            ('POST', r'/stations/(\d+)/sessions/import', self.post_import),
+            ('PATCH', r'/stations/(\d+)/sessions/(\d+)', self.patch_session),
+            ('DELETE', r'/stations/(\d+)/sessions/(\d+)', self.delete_session),
+            ('POST', r'/stations/(\d+)/recurrences', self.post_recurrence),
+            ('DELETE', r'/stations/(\d+)/recurrences/(\d+)', self.delete_recurrence),
+            ('GET', r'/stations/(\d+)/history', self.get_history),
+            ('GET', r'/stations/(\d+)/stats', self.get_stats),
+            ('GET', r'/stats', self.get_venue_stats),
+        ]
+        self.routes = [(method, re.compile(pattern + '/?'), handler) for method, pattern, handler in self.routes]
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # Port chosen by the system for port 0
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Answer one request (the connection is closed afterwards)
+        """
+        try:
+            try:
+                method, target, headers = await self._read_head(reader)
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY:
+                    raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'Request body too large')
+                body = await reader.readexactly(length) if length else b''
+                status, payload = self.dispatch(method, target, body)
+            except ApiError as e:
+                status, payload = e.status, dict(e.data, error=e.message)
+            except (ValueError, asyncio.IncompleteReadError):
+                status, payload = HTTPStatus.BAD_REQUEST, {'error': 'Malformed request'}
+            except Exception as e:
+                # Keep serving the other requests
+                diagnostics.log(f'API request failed: {e!r}')
+                status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': repr(e)}
+            content = json.dumps(payload).encode('utf-8')
+            status = HTTPStatus(status)
+            writer.write(f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                         'Content-Type: application/json\r\n'
+                         f'Content-Length: {len(content)}\r\n'
+                         'Connection: close\r\n\r\n'.encode('latin-1') + content)
+            await writer.drain()
+        except ConnectionError:
+            # Client went away
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_head(reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str]]:
+        request_line = (await reader.readline()).decode('latin-1').strip()
+        method, target, _ = request_line.split(' ', 2)
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1')
+            if line in ('\r\n', '\n', ''):
+                return method.upper(), target, headers
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    def dispatch(self, method: str, target: str, body: bytes) -> Tuple[int, dict]:
+        """
+        Run the handler of the request
+
+        Returns(tuple):
+            HTTP status and the response object
+        """
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            payload = json.loads(body) if body else {}
+        except json.JSONDecodeError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'Body is not valid JSON') from None
+        if not isinstance(payload, dict):
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'Body has to be a JSON object')
+        path_found = False
+        for route_method, pattern, handler in self.routes:
+            match = pattern.fullmatch(url.path)
+            if match is None:
+                continue
+            path_found = True
+            if route_method != method:
+                continue
+            try:
+                return handler(query, payload, *(int(group) for group in match.groups()))
+            except ConflictError as e:
+                raise ApiError(HTTPStatus.CONFLICT, str(e), {
+                    'conflicting': [session_to_json(session) for session in e.conflicting],
+                    'accepted': [session_to_json(session) for session in e.accepted],
+                    'rejected': [session_to_json(session) for session in e.rejected],
+                }) from None
+            except KeyError as e:
+                raise ApiError(HTTPStatus.NOT_FOUND, ' '.join(str(arg) for arg in e.args)) from None
+            except (InvalidSessionError, ValueError, TypeError) as e:
+                raise ApiError(HTTPStatus.BAD_REQUEST, str(e)) from None
+        if path_found:
+            raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, f'{method} is not allowed on {url.path}')
+        raise ApiError(HTTPStatus.NOT_FOUND, f'Unknown path {url.path}')
+
+    # -Handlers-
+    # Called with (query, body, path values), return (status, response object)
+    def _station_to_json(self, stationID: int) -> dict:
+        station = self.service.station(stationID)
+        running_session = station.running_session()
+        return {
+            'stationID': station.stationID,
+            'deviceID': station.deviceID,
+            'deviceName': station.deviceName,
+            'is_activated': station.core.is_activated,
+            'running_sessionID': running_session.sessionID if running_session is not None else None,
+            'queued_sessions': len(station.core.sessions),
+            'history_length': len(station.history_log),
+        }
+
+    @staticmethod
+    def _queue_to_json(sessions: List[Session], core) -> List[dict]:
+        """Return the queued sessions with the ruleIDs of the occurrences"""
+        rule_of = core.recurrences.rule_of
+        return [session_to_json(session, getattr(rule_of(session), 'ruleID', None)) for session in sessions]
+
+    def get_stations(self, query: dict, body: dict):
+        return HTTPStatus.OK, {'stations': [self._station_to_json(stationID)
+                                            for stationID in sorted(self.service.stations)]}
+
+    def get_station(self, query: dict, body: dict, stationID: int):
+        station = self.service.station(stationID)
+        data = self._station_to_json(stationID)
+        data['sessions'] = self._queue_to_json(station.core.sessions, station.core)
+        if 'history_since' in query:
+            data['history'] = self.get_history({'since': query['history_since']}, {}, stationID)[1]
+        return HTTPStatus.OK, data
+
+    def put_station(self, query: dict, body: dict, stationID: int):
+        if not isinstance(body.get('is_activated'), bool):
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'is_activated has to be true or false')
+        self.service.set_activated(stationID, body['is_activated'])
+        return self.get_station({}, {}, stationID)
+
+    def get_sessions(self, query: dict, body: dict, stationID: int):
+        core = self.service.station(stationID).core
+        sessions = core.sessions_on(parse_date(query['day']).date()) if 'day' in query else core.sessions
+        return HTTPStatus.OK, {'sessions': self._queue_to_json(sessions, core)}
+
+    def post_session(self, query: dict, body: dict, stationID: int):
+        if not isinstance(body.get('customerName'), str):
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'A session needs a customerName')
+        start_date = parse_date(body['start']) if body.get('start') is not None else None
+        if 'length' in body:
+            duration = parse_length(body['length'])
+        elif 'end' in body and start_date is not None:
+            duration = parse_length(to_seconds(parse_date(body['end']) - start_date))
+        else:
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'A session needs a length or a start and an end')
+        session = self.service.add_session(stationID, body['customerName'], start_date, duration,
+                                           replace=bool(body.get('replace')))
+        return HTTPStatus.CREATED, session_to_json(session)
+
+    def post_import(self, query: dict, body: dict, stationID: int):
+        if not isinstance(body.get('sessions'), list):
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'sessions has to be a list of sessions')
+        # New sessions, sent sessionIDs are not used
+        sessions = [session_from_json(dict(data, sessionID=None)) for data in body['sessions']]
+        added, rejected = self.service.add_sessions(stationID, sessions, replace=bool(body.get('replace')))
+        return HTTPStatus.OK, {'added': [session_to_json(session) for session in added],
+                               'rejected': [session_to_json(session) for session in rejected]}
+
+    def patch_session(self, query: dict, body: dict, stationID: int, sessionID: int):
+        changes = {}
+        if 'customerName' in body:
+            changes['new_customerName'] = str(body['customerName'])
+        if 'start' in body:
+            changes['new_start_date'] = parse_date(body['start'])
+        if 'end' in body:
+            changes['new_end_date'] = parse_date(body['end'])
+        if 'length' in body:
+            changes['new_duration'] = parse_length(body['length'])
+        session = self.service.replace_session(stationID, sessionID, replace=bool(body.get('replace')), **changes)
+        return HTTPStatus.OK, session_to_json(session)
+
+    def delete_session(self, query: dict, body: dict, stationID: int, sessionID: int):
+        self.service.delete_session(stationID, sessionID)
+        return HTTPStatus.OK, {'deleted': sessionID}
+
+    def delete_sessions(self, query: dict, body: dict, stationID: int):
+        sessionIDs = body.get('sessionIDs')
+        if (not isinstance(sessionIDs, list) or
+                not all(isinstance(sessionID, int) and not isinstance(sessionID, bool) for sessionID in sessionIDs)):
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'sessionIDs has to be a list of sessionIDs')
+        return HTTPStatus.OK, {'deleted': self.service.delete_sessions(stationID, sessionIDs)}
+
+    def post_recurrence(self, query: dict, body: dict, stationID: int):
+        session = session_from_json(dict(body, sessionID=None))
+        if not isinstance(body.get('rrule'), str):
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'A recurring session needs an rrule')
+        rule, queued, skipped = self.service.add_recurrence(stationID, session.customerName, session.start_date,
+                                                            session.length, body['rrule'],
+                                                            replace=bool(body.get('replace')))
+        return HTTPStatus.CREATED, {'ruleID': rule.ruleID,
+                                    'queued': [session_to_json(session, rule.ruleID) for session in queued],
+                                    'skipped': [session_to_json(session) for session in skipped]}
+
+    def delete_recurrence(self, query: dict, body: dict, stationID: int, ruleID: int):
+        self.service.remove_recurrence(stationID, ruleID)
+        return HTTPStatus.OK, {'deleted': ruleID}
+
+    def get_history(self, query: dict, body: dict, stationID: int):
+        history_log = self.service.station(stationID).history_log
+        since = max(0, int(query.get('since', 0)))
+        return HTTPStatus.OK, {'sessions': [session_to_json(session) for session in history_log[since:]],
+                               'next': len(history_log)}
+
+    def get_stats(self, query: dict, body: dict, stationID: int):
+        stats = stats_to_json(self.service.stats(stationID))
+        stats['currency'] = revenue.currency
+        return HTTPStatus.OK, stats
+
+    def get_venue_stats(self, query: dict, body: dict):
+        end_date = parse_date(query['end']) if 'end' in query else self.service.clock.now().replace(microsecond=0)
+        start_date = parse_date(query['start']) if 'start' in query else end_date - dt.timedelta(days=7)
+        histories = self.service.histories()
+        result = occupancy.occupancy(histories, start_date, end_date)
+        peak, peak_date = result.peak
+        report = revenue.report(histories)
+        return HTTPStatus.OK, {
+            'start': format_date(start_date),
+            'end': format_date(end_date),
+            'capacity': result.capacity,
+            'peak': peak,
+            'peak_start': format_date(peak_date) if peak_date is not None else None,
+            'average': result.average(),
+            'fully_booked': [[format_date(start), format_date(end)] for start, end in result.fully_booked()],
+            # Revenue of the days in the range
+            'revenue': sum(amount for day, amount in report['days'].items()
+                           if start_date.date() <= day <= end_date.date()),
+            'currency': revenue.currency,
+        }
@@ -0,0 +1,443 @@
+"""
+Client of the local API of the station daemon
+
+The application runs as a client of a daemon if the environment variable
+GSM_DAEMON_URL is set (e.g. http://127.0.0.1:8765): the stations are then
+the ones of the daemon, their queues, activation and histories are read
+from and changed through the API (RemoteStationCore) and the daemon
+controls the plugs
+"""
+# -Root imports-
+from .core import (InvalidSessionError, Session, StationCore, to_seconds)
+from .api_json import (ApiError, format_date, session_from_json, session_to_json)
+# -Other-
+from urllib.parse import urlencode
+import datetime as dt
+import json
+import os
+# Code annotation
+from typing import (Callable, Dict, Iterable, List, Tuple, Union)
+
+URL_ENV_VAR = 'GSM_DAEMON_URL'
+TIMEOUT = 5  # Seconds
+
+
+class ApiClient:
+    """
+    Blocking client of the API (requests to the local
+    daemon take a few milliseconds)
+
+    Paramaters:
+        base_url(str):
+            URL of the daemon, e.g. http://127.0.0.1:8765
+        timeout(float):
+            Seconds to wait for a response
+    """
+
+    def __init__(self, base_url: str, timeout: float = TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    @classmethod
+    def from_environment(cls) -> Union['ApiClient', None]:
+        """Return a client of the daemon set in GSM_DAEMON_URL, None if it is not set"""
+        url = os.environ.get(URL_ENV_VAR)
+        return cls(url) if url else None
+
+    def request(self, method: str, path: str, payload: Union[dict, None] = None, **query) -> dict:
+        """
+        Send a request
+        Raises ApiError for error responses (status 503 if the daemon can not be reached)
+
+        Returns(dict):
+            The response object
+        """
+        # HTTP client (pulls in ssl and http.client, only loaded in client mode)
+        from urllib.error import (HTTPError, URLError)
+        import urllib.request
+        url = self.base_url + path
+        query = {key: value for key, value in query.items() if value is not None}
+        if query:
+            url += '?' + urlencode(query)
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        request = urllib.request.Request(url, data=data, method=method,
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read() or b'{}')
+        except HTTPError as e:
+            try:
+                error = json.loads(e.read() or b'{}')
+            except ValueError:
+                error = {}
+            message = error.pop('error', e.reason)
+            raise ApiError(e.code, message, error) from None
+        except (URLError, OSError) as e:
+            raise ApiError(503, f'Daemon not reachable at {self.base_url} ({e})') from None
+
+    # -Stations-
+    def stations(self) -> List[dict]:
+        return self.request('GET', '/stations')['stations']
+
+    def station(self, stationID: int, history_since: Union[int, None] = None) -> dict:
+        return self.request('GET', f'/stations/{stationID}', history_since=history_since)
+
+    def set_activated(self, stationID: int, value: bool) -> dict:
+        return self.request('PUT', f'/stations/{stationID}', {'is_activated': value})
+
+    # -Sessions-
+    def sessions(self, stationID: int, day: Union[dt.date, None] = None) -> List[Session]:
+        data = self.request('GET', f'/stations/{stationID}/sessions',
+                            day=day.isoformat() if day is not None else None)
+        return [session_from_json(session) for session in data['sessions']]
+
+    def add_session(self, stationID: int, customerName: str, start_date: Union[dt.datetime, None],
+                    duration: Union[dt.time, dt.timedelta, int], replace: bool = False) -> Session:
+        payload = {'customerName': customerName, 'length': to_seconds(duration), 'replace': replace}
+        if start_date is not None:
+            payload['start'] = format_date(start_date)
+        return session_from_json(self.request('POST', f'/stations/{stationID}/sessions', payload))
+
+    def import_sessions(self, stationID: int, sessions: Iterable[Session],
+                        replace: bool = False) -> Tuple[List[Session], List[Session]]:
+        data = self.request('POST', f'/stations/{stationID}/sessions/import',
+                            {'sessions': [session_to_json(session) for session in sessions], 'replace': replace})
+        return ([session_from_json(session) for session in data['added']],
+                [session_from_json(session) for session in data['rejected']])
+
+    def replace_session(self, stationID: int, sessionID: int, replace: bool = False, customerName: str = None,
+                        start_date: dt.datetime = None, end_date: dt.datetime = None,
+                        duration: Union[dt.time, dt.timedelta, int] = None) -> Session:
+        payload = {'replace': replace}
+        if customerName is not None:
+            payload['customerName'] = customerName
+        if start_date is not None:
+            payload['start'] = format_date(start_date)
+        if end_date is not None:
+            payload['end'] = format_date(end_date)
+        if duration is not None:
+            payload['length'] = to_seconds(duration)
+        return session_from_json(self.request('PATCH', f'/stations/{stationID}/sessions/{sessionID}', payload))
+
+    def delete_session(self, stationID: int, sessionID: int):
+        self.request('DELETE', f'/stations/{stationID}/sessions/{sessionID}')
+
+    def delete_sessions(self, stationID: int, sessionIDs: List[int]) -> List[int]:
+        return self.request('DELETE', f'/stations/{stationID}/sessions', {'sessionIDs': sessionIDs})['deleted']
+
+    def add_recurrence(self, stationID: int, customerName: str, start_date: dt.datetime,
+                       duration: Union[dt.time, dt.timedelta, int], rrule: str,
+                       replace: bool = False) -> Tuple[List[Session], List[Session]]:
+        data = self.request('POST', f'/stations/{stationID}/recurrences',
+                            {'customerName': customerName, 'start': format_date(start_date),
+                             'length': to_seconds(duration), 'rrule': rrule, 'replace': replace})
+        return ([session_from_json(session) for session in data['queued']],
+                [session_from_json(session) for session in data.get('skipped', [])])
+
+    def delete_recurrence(self, stationID: int, ruleID: int):
+        self.request('DELETE', f'/stations/{stationID}/recurrences/{ruleID}')
+
+    def history(self, stationID: int, since: int = 0) -> Tuple[List[Session], int]:
+        """
+        Returns(tuple):
+            History sessions from entry since on and the entry to continue from
+        """
+        data = self.request('GET', f'/stations/{stationID}/history', since=since)
+        return [session_from_json(session) for session in data['sessions']], data['next']
+
+    # -Stats-
+    def stats(self, stationID: int) -> dict:
+        return self.request('GET', f'/stations/{stationID}/stats')
+
+    def venue_stats(self, start_date: Union[dt.datetime, None] = None,
+                    end_date: Union[dt.datetime, None] = None) -> dict:
+        return self.request('GET', '/stats',
+                            start=format_date(start_date) if start_date is not None else None,
+                            end=format_date(end_date) if end_date is not None else None)
+
+
+class RemoteDevice:
+    """
+    Plug of a daemon station (the daemon sends the power commands)
+
+    Paramaters:
+        data(dict):
+            Station of the station list of the API
+    """
+
+    def __init__(self, data: dict):
+        self.deviceID = data['deviceID']
+        self.deviceName = data['deviceName']
+        self.stationID = data['stationID']
+        self.state = 0
+
+    def refresh(self):
+        pass
+
+    def turn_on(self):
+        pass
+
+    def turn_off(self):
+        pass
+
+
+class RemoteRule:
+    """
+    Recurring session of a daemon station, the rule of its queued
+    occurrences in the mirrored schedule (RecurrenceSchedule.rule_of)
+
+    Paramaters:
+        ruleID(int):
+            ID of the rule on the daemon
+    """
+    __slots__ = ('ruleID', 'exdates')
+
+    def __init__(self, ruleID: int):
+        self.ruleID = ruleID
+        # Cancelled occurrences are kept by the daemon
+        self.exdates = set()
+
+
+def _raise_for(e: ApiError):
+    """Raise the error the station core raises for the same problem"""
+    if e.status == 404:
+        raise KeyError(e.message) from None
+    if e.status == 400:
+        raise InvalidSessionError(e.message) from None
+    raise e
+
+
+class RemoteStationCore(StationCore):
+    """Station core mirroring a station of the daemon
+
+    The queue, the activation and the new history sessions are read by
+    fetch (on a worker thread, see gui_helper.classes.StationPoller) and
+    applied on the GUI thread, updates only read this state. Changes are
+    sent to the daemon and read back.
+    Conflicts are confirmed like with the local core: the request is
+    sent again with "replace" once the confirm callback agreed
+
+    Paramaters:
+        client(ApiClient):
+            Client of the daemon
+        clock(Clock or None):
+            Source of the current time, the application clock if None
+    """
+
+    def __init__(self, client: ApiClient, clock=None):
+        self.client = client
+        # stationID of the daemon (None while no plug is assigned)
+        self.remoteID: Union[int, None] = None
+        # Next entry of the history log of the daemon
+        self.history_next = 0
+        self._activated = False
+        # ruleID -> RemoteRule of the queued occurrences
+        self._rules: Dict[int, RemoteRule] = {}
+        super().__init__(clock=clock)
+
+    @property
+    def is_activated(self) -> bool:
+        return self._activated
+
+    @is_activated.setter
+    def is_activated(self, value: bool):
+        if self.remoteID is not None and value != self._activated:
+            self.client.set_activated(self.remoteID, value)
+        self._activated = value
+
+    def attach(self, remoteID: int) -> List[Session]:
+        """
+        Mirror the station of the daemon
+
+        Returns(list):
+            History of the station
+        """
+        self.remoteID = remoteID
+        tracked_sessions, self.history_next = self.client.history(remoteID)
+        self.sync()
+        return tracked_sessions
+
+    def detach(self):
+        """Stop mirroring, nothing is sent to the daemon afterwards"""
+        self.remoteID = None
+
+    def fetch(self) -> Union[dict, None]:
+        """
+        Read the state of the station of the daemon, None while detached
+        (Only reads the core, can run on another thread)
+        Raises ApiError if the daemon is not reachable
+        """
+        remoteID, history_next = self.remoteID, self.history_next
+        if remoteID is None:
+            return None
+        data = self.client.station(remoteID, history_since=history_next)
+        data['history_since'] = history_next
+        return data
+
+    def apply(self, data: Union[dict, None]):
+        """
+        Take the queue, the activation and the new history sessions read by fetch
+        (State read for another station or before a later read is dropped)
+        """
+        if (data is None or data['stationID'] != self.remoteID or
+                data['history_since'] != self.history_next):
+            return
+        self._activated = data['is_activated']
+        sessions = []
+        occurrences = {}
+        rules = {}
+        for session_data in data['sessions']:
+            session = session_from_json(session_data)
+            sessions.append(session)
+            ruleID = session_data.get('ruleID')
+            if ruleID is not None:
+                # Mirrored schedule, the same rule object for the same ruleID
+                rules[ruleID] = rules.get(ruleID) or self._rules.get(ruleID) or RemoteRule(ruleID)
+                occurrences[session.sessionID] = (rules[ruleID], session.start)
+        self.sessions = sessions
+        self.recurrences.occurrences = occurrences
+        self._rules = rules
+        for session in data['history']['sessions']:
+            # Listeners (index, revenue) see the sessions as if they finished here
+            self.history.add(session_from_json(session))
+        self.history_next = data['history']['next']
+
+    def sync(self):
+        """
+        Read the state of the daemon at once (after a change)
+        """
+        self.apply(self.fetch())
+
+    def _send(self, send: Callable[[bool], None], confirm: Callable[[List[Session]], bool]) -> bool:
+        """
+        Send the change, confirm the conflicts and send it again replacing them
+
+        Returns(bool):
+            Change was made
+        """
+        try:
+            try:
+                send(False)
+            except ApiError as e:
+                if e.status != 409:
+                    raise
+                conflicting_sessions = [session_from_json(session) for session in e.data.get('conflicting', [])]
+                if not confirm(conflicting_sessions, e.data):
+                    return False
+                send(True)
+        except ApiError as e:
+            _raise_for(e)
+        finally:
+            try:
+                self.sync()
+            except ApiError:
+                # Read again on the next update
+                pass
+        return True
+
+    # -Queue changes-
+    def add_session(self, customerName: str, start_date: Union[dt.datetime, None], duration: Union[dt.time, dt.timedelta],
+                    sessionID: Union[int, None] = None,
+                    confirm: Union[Callable[[Session, List[Session]], bool], None] = None,
+                    now: Union[dt.datetime, None] = None) -> bool:
+        if sessionID is not None:
+            return self.replace_session(sessionID, new_customerName=customerName, new_start_date=start_date,
+                                        new_duration=duration, confirm=confirm, now=now)
+        if start_date is None:
+            start_date = self.next_free_start(now, duration)
+        new_session = Session(customerName=customerName, start_date=start_date, duration=duration)
+        return self._send(
+            lambda replace: self.client.add_session(self.remoteID, customerName, start_date, duration, replace),
+            lambda conflicting, _: confirm is not None and confirm(new_session, conflicting))
+
+    def add_sessions(self, new_sessions: Iterable[Session],
+                     confirm: Union[Callable[[List[Session], List[Session], List[Session]], bool], None] = None,
+                     now: Union[dt.datetime, None] = None) -> Tuple[List[Session], List[Session]]:
+        new_sessions = list(new_sessions)
+        result = ([], [])
+
+        def send(replace: bool):
+            nonlocal result
+            result = self.client.import_sessions(self.remoteID, new_sessions, replace)
+
+        def confirm_import(conflicting: List[Session], data: dict) -> bool:
+            accepted = [session_from_json(session) for session in data.get('accepted', [])]
+            rejected = [session_from_json(session) for session in data.get('rejected', [])]
+            result[1].extend(rejected)
+            return confirm is not None and confirm(accepted, conflicting, rejected)
+
+        self._send(send, confirm_import)
+        return result
+
+    def replace_session(self, sessionID: int, new_customerName: str = None, new_start_date: dt.datetime = None,
+                        new_end_date: dt.datetime = None, new_duration: Union[dt.time, dt.timedelta] = None,
+                        confirm: Union[Callable[[Session, List[Session]], bool], None] = None,
+                        now: Union[dt.datetime, None] = None) -> bool:
+        # Changed session for the confirmation (checked by the daemon as well)
+        session = self.find_session(sessionID).copy()
+        if new_customerName is not None:
+            session.customerName = new_customerName
+        if new_start_date is not None:
+            session.start_date = new_start_date
+        if new_end_date is not None:
+            session.end_date = new_end_date
+        if new_duration is not None:
+            session.duration = new_duration
+        return self._send(
+            lambda replace: self.client.replace_session(self.remoteID, sessionID, replace,
+                                                        customerName=new_customerName,
+                                                        start_date=new_start_date,
+                                                        end_date=new_end_date,
+                                                        duration=new_duration),
+            lambda conflicting, _: confirm is not None and confirm(session, conflicting))
+
+    def delete_session(self, session: Union[int, Session] = None, track: Union[bool, None] = None,
+                       now: Union[dt.datetime, None] = None):
+        # The daemon tracks a deleted session if it is running
+        sessionID = session if isinstance(session, int) else session.sessionID
+        self._send(lambda replace: self.client.delete_session(self.remoteID, sessionID),
+                   lambda conflicting, _: False)
+
+    def delete_sessions(self, sessions: Iterable[Session], track: Union[bool, None] = None,
+                        now: Union[dt.datetime, None] = None):
+        sessionIDs = [session.sessionID for session in sessions]
+        if not sessionIDs:
+            return
+        self._send(lambda replace: self.client.delete_sessions(self.remoteID, sessionIDs),
+                   lambda conflicting, _: False)
+
+    def add_recurrence(self, rule, now: Union[dt.datetime, None] = None) -> Tuple[List[Session], List[Session]]:
+        queued = []
+        skipped = []
+
+        def send(replace: bool):
+            sessions, skipped_sessions = self.client.add_recurrence(self.remoteID, rule.customerName,
+                                                                    rule.start_date, rule.length,
+                                                                    rule.to_rrule(), replace)
+            queued.extend(sessions)
+            skipped.extend(skipped_sessions)
+        self._send(send, lambda conflicting, _: False)
+        return queued, skipped
+
+    def remove_recurrence(self, rule: RemoteRule):
+        self._send(lambda replace: self.client.delete_recurrence(self.remoteID, rule.ruleID),
+                   lambda conflicting, _: False)
+
+    def deactivate(self, now: Union[dt.datetime, None] = None):
+        self._send(lambda replace: self.client.set_activated(self.remoteID, False),
+                   lambda conflicting, _: False)
+
+    # -Updates-
+    def update_sessions(self, now: Union[dt.datetime, None] = None) -> Union[Session, None]:
+        """
+        Return the running session of the last read state
+        (The daemon moves the finished sessions, nothing is requested here)
+
+        Returns(Session or None):
+            Currently running session
+        """
+        return self.running_session(now=now)
+
+    def expand_recurrences(self, now_seconds: int):
+        # The daemon queues the occurrences
+        pass
@@ -0,0 +1,94 @@
+"""
+JSON format of the sessions of the local API and its errors
+
+Shared by the server (api.py) and the client (api_client.py), only needs
+the standard library parts the application loads anyway, so importing it
+does not pull in the server or an HTTP client
+"""
+# -Root imports-
+from .core import (Session, to_seconds)
+# -Other-
+from http import HTTPStatus
+import datetime as dt
+# Code annotation
+from typing import Union
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+class ApiError(Exception):
+    """Error response of the API
+
+    Paramaters:
+        status(int):
+            HTTP status
+        message(str):
+            Description of the error
+        data(dict):
+            Additional values of the response (e.g. the conflicting sessions)
+    """
+
+    def __init__(self, status: int, message: str, data: dict = None):
+        super().__init__(status, message)
+        self.status = status
+        self.message = message
+        self.data = data if data is not None else {}
+
+
+# -JSON-
+def format_date(date: dt.datetime) -> str:
+    return date.strftime(DATE_FORMAT)
+
+
+def parse_date(text: str) -> dt.datetime:
+    """Return the date of an ISO text ('YYYY-MM-DD' or 'YYYY-MM-DDTHH:MM[:SS]')"""
+    try:
+        return dt.datetime.fromisoformat(str(text))
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f'Invalid date: {text}') from None
+
+
+def session_to_json(session: Session, ruleID: Union[int, None] = None) -> dict:
+    data = {
+        'sessionID': session.sessionID,
+        'customerName': session.customerName,
+        'start': format_date(session.start_date),
+        'end': format_date(session.end_date),
+        'length': session.length,
+    }
+    if ruleID is not None:
+        data['ruleID'] = ruleID
+    return data
+
+
+def parse_length(value) -> int:
+    """Return the length in seconds, raises ApiError unless it is a positive integer"""
+    # bool is an int as well (true would be a 1 second session)
+    if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+        raise ApiError(HTTPStatus.BAD_REQUEST, 'The length has to be a positive number of seconds')
+    return value
+
+
+def session_from_json(data: dict) -> Session:
+    """
+    Create a session of its JSON, the sessionID is kept if there is one
+    """
+    if not isinstance(data.get('customerName'), str) or 'start' not in data:
+        raise ApiError(HTTPStatus.BAD_REQUEST, 'A session needs a customerName and a start')
+    start_date = parse_date(data['start'])
+    if 'length' in data:
+        length = parse_length(data['length'])
+    elif 'end' in data:
+        length = parse_length(to_seconds(parse_date(data['end']) - start_date))
+    else:
+        raise ApiError(HTTPStatus.BAD_REQUEST, 'A session needs a length or an end')
+    return Session(customerName=data['customerName'],
+                   start_date=start_date,
+                   duration=length,
+                   sessionID=data.get('sessionID'))
+
+
+def stats_to_json(stats: dict) -> dict:
+    """Return the stats with the times in seconds"""
+    return {key: value.total_seconds() if isinstance(value, dt.timedelta) else value
+            for key, value in stats.items()}
@@ -3,28 +3,43 @@ Main Application
 """
 # pylint: disable=no-name-in-module, import-error
 # -GUI-
-from PySide2.QtCore import (Qt, QThreadPool, QSize, QDir)
-from PySide2.QtWidgets import (QApplication, QMainWindow, QMessageBox, QWidget, QPushButton, QFileDialog)
+from PySide2.QtCore import (Qt, QThreadPool, QSize, QDir, QTimer)
+from PySide2.QtWidgets import (QApplication, QMainWindow, QMessageBox, QWidget, QPushButton, QFileDialog,
+                               QHeaderView)
 from PySide2.QtGui import (QPixmap, QPalette)
 from PySide2.QtUiTools import QUiLoader
 # -Root imports-
+from .startup_profiler import profiler
+from .clock import clock
+from .diagnostics import (diagnostics, REFRESH_TICK, LOG_FILE as DIAGNOSTICS_LOG_FILE)
+from .metrics import start_endpoint as start_metrics_endpoint
+from .live_profiler import liveProfiler
+from .billing import revenue
+from .occupancy import occupancy
 from .resources.resources_manager import ResourcePaths
 from .data.data_manager import DataManager
-from .gui_helper.classes import (EventHandler)
-from .gui_helper.methods import reconnect
-from .kasa.kasa_device import (DeviceRetriever, Device)
-from .classes import (Station)
+from .data.session_import import (read_sessions, SessionImportError, FILE_FILTER as IMPORT_FILE_FILTER)
+from .gui_helper.classes import (EventHandler, SessionTableModel, QWidgetDelegate, HistoryTableModel,
+                                 HistoryFilterProxyModel, CustomerNameCompleter, UiTemplate, WindowStateWatcher,
+                                 OccupancyChart, StationPoller)
+from .gui_helper.methods import (reconnect, is_page_visible)
+from .kasa.kasa_device import (DeviceRetriever, Device, ParallelPowerOff)
+from .classes import (Station, SessionHistoryIndex, CustomerNameIndex)
+from .core import (StationCore, reconcile_devices, to_epoch, format_duration)
+from .recurrence import RecurrenceSchedule
+from .api_json import ApiError
+from .api_client import (ApiClient, RemoteDevice, RemoteStationCore)
+from . import constants as const
 # -Other-
 import os
 import sys
 from itertools import count
 from itertools import cycle
 from collections import defaultdict
-import subprocess  # Restarting application
+import math
+import time
 # Timer logic
 import datetime as dt
-# Excel file writing
-import xlsxwriter
 # Code annotation
 from typing import (Dict, Union)
 
@@ -42,15 +57,26 @@ else:
     base_path = os.path.dirname(os.path.abspath(__file__))
 os.chdir(base_path)  # Change the current working directory to the base path
 
-settingsManager = DataManager(default_data={'username': '',
-                                            'password': '',
-                                            'window_geometries': {},
-                                            'tracked_sessions': {},
-                                            'settings': {
-                                                'saveLogin': True,
-                                            },
-                                            'lastExportDir': QDir.homePath(),
-                                            })
+with profiler.phase('DataManager load'):
+    settingsManager = DataManager(default_data={'username': '',
+                                                'password': '',
+                                                'window_geometries': {},
+                                                'tracked_sessions': {},
+                                                'recurring_sessions': {},
+                                                'queued_sessions': {},
+                                                'settings': {
+                                                    'saveLogin': True,
+                                                },
+                                                'lastExportDir': QDir.homePath(),
+                                                })
+profiler.log_folder = settingsManager.save_folder
+diagnostics.log_folder = settingsManager.save_folder
+liveProfiler.save_folder = settingsManager.save_folder
+try:
+    revenue.load_rates(settingsManager.save_folder)
+except (OSError, ValueError, KeyError, TypeError) as e:
+    # Keep the example rates
+    diagnostics.log(f'Rate table not loaded ({e!r}), using the example rates')
 app: QApplication
 
 
@@ -60,39 +86,38 @@ class WindowManager:
         # -Variables-
         self.threadpool = QThreadPool()
         self.eventHandler = EventHandler()
-        self.gridOrder = [(0, 0),
-                          (0, 1),
-                          (1, 0),
-                          (1, 1),
-                          (0, 2),
-                          (1, 2),
-                          (2, 0),
-                          (2, 1),
-                          (2, 2),
-                          #   (0, 3),
-                          #   (1, 3),
-                          #   (2, 3),
-                          #   (3, 0),
-                          #   (3, 1),
-                          #   (3, 2),
-                          #   (3, 3), 16 Stations
-                          ]
-        self.stationIDs = range(0, len(self.gridOrder))
+        # Client of the station daemon (GSM_DAEMON_URL), None runs the stations in this process
+        self.apiClient: Union[ApiClient, None] = ApiClient.from_environment()
+        # Search index over the session histories of all devices
+        self.historyIndex = SessionHistoryIndex()
+        # Names of all past customers, for the name suggestions
+        self.customerIndex = CustomerNameIndex(session
+                                               for tracked_sessions in settingsManager.value('tracked_sessions').values()
+                                               for session in tracked_sessions)
         # -Setup-
         self.initialize_windows()
         self.initialize_threads()
         self.initialize_binds()
-        self.initialize_widgets()
+        with profiler.phase('initialize_widgets'):
+            self.initialize_widgets()
         # Key: stationID
         # Value: Station Class
-        self.stations = {x: Station(self.windows, x) for x in self.stationIDs}
+        # (Stations are added and removed as devices appear and go away)
+        self.stations: Dict[int, Station] = {}
         self.deviceID_to_stationID = {}
+        # Device search state
+        self._searching = False
+        self._background_search = False
+        self._search_failed = False
+        # Duration (seconds) of the last station layout change and refresh
+        self.layout_duration = 0.0
+        self.refresh_duration = 0.0
 
         # -Other-
         self.load_page_stations()
         # Search devices is username and password is stored
-        if (settingsManager.value('username') and
-                settingsManager.value('password')):
+        if (self.apiClient is not None or
+                (settingsManager.value('username') and settingsManager.value('password'))):
             self.search_for_devices()
         else:
             self._update_stations()
@@ -108,60 +133,167 @@ class WindowManager:
     def initialize_windows(self):
         """
         Set up all windows for this application
+        The windows are set up once they are loaded
         """
         # -Event Filter-
-        for window in self.windows.values():
-            window.installEventFilter(self.eventHandler)
-        self.eventHandler.addFilter(Qt.Key_Return, self.clicked_login_connect, parent=self.windows['login'])
-        self.eventHandler.addFilter(Qt.Key_Delete, self.keyPress_edit_deleteSession, parent=self.windows['edit'])
+        for win_name in self.windows.window_paths:
+            self.windows.add_initializer(win_name, lambda window: window.installEventFilter(self.eventHandler))
+        self.windows.add_initializer('main', self._initialize_window_main)
+        self.windows.add_initializer('login', self._initialize_window_login)
+        self.windows.add_initializer('session', self._initialize_window_session)
+        self.windows.add_initializer('edit', self._initialize_window_edit)
+        self.windows.add_initializer('history', self._initialize_window_history)
+
+    def _initialize_window_main(self, window: QWidget):
+        """
+        Set up the main window
+        """
         # -Images-
         # Refresh
         icon = QPixmap(ResourcePaths.images.refresh)
-        self.windows['main'].pushButton_refresh.setIcon(icon)
+        window.pushButton_refresh.setIcon(icon)
         # Settings
         icon = QPixmap(ResourcePaths.images.settings)
-        self.windows['main'].pushButton_settings.setIcon(icon)
-        self.windows['main'].pushButton_settings.setIconSize(QSize(18, 18))
+        window.pushButton_settings.setIcon(icon)
+        window.pushButton_settings.setIconSize(QSize(18, 18))
+        # -Rendering-
+        # Hidden widgets are not updated, catch up once the window is shown again
+        self.windowStateWatcher = WindowStateWatcher(lambda: QTimer.singleShot(0, self.refresh))
+        window.installEventFilter(self.windowStateWatcher)
+        # -Occupancy chart-
+        self.occupancyChart = OccupancyChart(parent=window.frame_statistics_occupancy)
+        # Between the title row and the summary
+        window.verticalLayout_statistics_occupancy.insertWidget(1, self.occupancyChart)
+        self._occupancy_key = None
+        # The chart moves on with the time while the statistics page is shown
+        self.occupancyTimer = QTimer()
+        self.occupancyTimer.timeout.connect(self.tick_occupancy)
+        self.occupancyTimer.start(clock.interval(const.OCCUPANCY_REFRESH_INTERVAL))
 
+    def _initialize_window_login(self, window: QWidget):
+        """
+        Set up the login window
+        """
+        self.eventHandler.addFilter(Qt.Key_Return, self.clicked_login_connect, parent=window)
+        # Disable connecting while devices are searched
+        self.device_retriever.disable_widgets.append(window.pushButton_connect)
         # -Load saved data-
         if settingsManager.value('settings')['saveLogin']:
             # Load account data
-            self.windows['login'].lineEdit_email.setText(settingsManager.value('username'))
-            self.windows['login'].lineEdit_password.setText(settingsManager.value('password'))
+            window.lineEdit_email.setText(settingsManager.value('username'))
+            window.lineEdit_password.setText(settingsManager.value('password'))
+
+    def _initialize_window_session(self, window: QWidget):
+        """
+        Set up the session window
+        """
+        self.customerNameCompleter = CustomerNameCompleter(self.customerIndex,
+                                                           window.lineEdit_customerName)
+
+    def _initialize_window_edit(self, window: QWidget):
+        """
+        Set up the edit window
+        """
+        self.eventHandler.addFilter(Qt.Key_Delete, self.keyPress_edit_deleteSession, parent=window)
+        self.eventHandler.addFilter(Qt.Key_Insert, self.keyPress_edit_importSessions, parent=window)
+        # Model and delegate are shared by all stations
+        tableView = window.tableView_queue
+        tableView.setModel(SessionTableModel(parent=tableView))
+        tableView.setItemDelegate(QWidgetDelegate(parent=tableView))
+        # Time columns share a fixed width measured once
+        header = tableView.horizontalHeader()
+        header.ensurePolished()
+        column_width = max(header.fontMetrics().horizontalAdvance(text)
+                           for text in SessionTableModel.HEADERS[1:]) + 20
+        header.setSectionResizeMode(QHeaderView.Fixed)
+        for col in range(1, len(SessionTableModel.HEADERS)):
+            tableView.setColumnWidth(col, column_width)
+        header.setSectionResizeMode(0, QHeaderView.Stretch)
+
+    def _initialize_window_history(self, window: QWidget):
+        """
+        Set up the history window
+        """
+        tableView = window.tableView_history
+        proxyModel = HistoryFilterProxyModel(parent=tableView)
+        proxyModel.setSourceModel(HistoryTableModel(self.historyIndex, parent=tableView))
+        tableView.setModel(proxyModel)
+        column_width = 90
+        header = tableView.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.Fixed)
+        tableView.setColumnWidth(0, column_width + 20)
+        tableView.setColumnWidth(1, column_width + 20)
+        header.setSectionResizeMode(2, QHeaderView.Stretch)
+        tableView.setColumnWidth(3, column_width)
+        tableView.setColumnWidth(4, column_width)
 
     def initialize_widgets(self):
-        """Load all widgets for the main window"""
-        stationTemplate_path = ResourcePaths.ui_files.stationQWidget
-        statisticsTemplate_path = ResourcePaths.ui_files.statisticsQWidget
-
-        # Load stations
-        with open(stationTemplate_path) as station_ui:
-            station_ui_lines = station_ui.read()
-        with open(statisticsTemplate_path) as statistic_ui:
-            statistic_ui_lines = statistic_ui.read()
-
-        for i, stationID in enumerate(self.stationIDs):
-            # Load station
-            new_station_path = os.path.join(settingsManager.save_folder,
-                                            'generated_ui_files', f'station_{stationID}.ui')
-            new_station_ui = open(new_station_path, 'w')
-            new_station_ui_lines = station_ui_lines.replace('_1">', f'_{stationID}">')
-            new_station_ui_lines = new_station_ui_lines.replace('<class>frame_station_1</class>', f'<class>frame_station_{stationID}</class>')  # nopep8
-            new_station_ui.write(new_station_ui_lines)
-            new_station_ui.close()
-            station = loader.load(new_station_path)
-            # Load statistic
-            new_statistic_path = os.path.join(settingsManager.save_folder,
-                                              'generated_ui_files', f'statistic_{stationID}.ui')
-            new_statistic_ui = open(new_statistic_path, 'w')
-            new_statistic_ui_lines = statistic_ui_lines.replace('_1">', f'_{stationID}">')
-            new_statistic_ui_lines = new_statistic_ui_lines.replace('<class>frame_statistic_1</class>', f'<class>frame_statistic_{stationID}</class>')  # nopep8
-            new_statistic_ui.write(new_statistic_ui_lines)
-            new_statistic_ui.close()
-            statistic = loader.load(new_statistic_path)
-
-            self.windows['main'].gridLayout_page_stations.addWidget(station, self.gridOrder[i][0], self.gridOrder[i][1], 1, 1)  # nopep8
-            self.windows['main'].gridLayout_page_statistics.addWidget(statistic, self.gridOrder[i][0], self.gridOrder[i][1], 1, 1)  # nopep8
+        """Load the widget templates for the stations of the main window"""
+        # Templates are read once and loaded from memory for every station
+        self.stationTemplate = UiTemplate(ResourcePaths.ui_files.stationQWidget, loader)
+        self.statisticsTemplate = UiTemplate(ResourcePaths.ui_files.statisticsQWidget, loader)
+
+    @staticmethod
+    def grid_position(stationID: int) -> tuple:
+        """
+        Position (row, column) of the station in the grid
+
+        The grid grows in square shells, so the positions of
+        existing stations stay the same when stations are added:
+            0 1 4
+            2 3 5
+            6 7 8
+        """
+        shell = int(math.sqrt(stationID))
+        offset = stationID - shell * shell
+        if offset < shell:
+            # Column on the right of the previous square
+            return (offset, shell)
+        # Row below the previous square
+        return (shell, offset - shell)
+
+    def add_station(self, stationID: int) -> Station:
+        """
+        Create the widgets and the station for the stationID
+        """
+        row, column = self.grid_position(stationID)
+        station_widget = self.stationTemplate.load(stationID)
+        statistic_widget = self.statisticsTemplate.load(stationID)
+        self.windows['main'].gridLayout_page_stations.addWidget(station_widget, row, column, 1, 1)
+        self.windows['main'].gridLayout_page_statistics.addWidget(statistic_widget, row, column, 1, 1)
+        core = RemoteStationCore(self.apiClient) if self.apiClient is not None else None
+        station = Station(self.windows, stationID, self.historyIndex, self.customerIndex, core=core)
+        self.stations[stationID] = station
+        return station
+
+    def remove_station(self, stationID: int, save: bool = True):
+        """
+        Remove the station and release its widgets
+        The session history of its device is kept in the saved data
+
+        Paramaters:
+            save(bool):
+                Save the data of its device (False if it is saved already)
+        """
+        station = self.stations.pop(stationID)
+        tracker_data = station.sessionTracker.extract_data()
+        if isinstance(station.core, RemoteStationCore):
+            # The daemon keeps the station, nothing is sent on the reset
+            station.core.detach()
+            if tracker_data is not None and self.deviceID_to_stationID.get(tracker_data['deviceID']) == stationID:
+                del self.deviceID_to_stationID[tracker_data['deviceID']]
+        elif tracker_data is not None and save:
+            # Keep the history of the device for when it reappears
+            new_tracked_sessions = settingsManager.value('tracked_sessions')
+            new_tracked_sessions[tracker_data['deviceID']] = tracker_data['tracked_sessions']
+            settingsManager.data['tracked_sessions'] = new_tracked_sessions
+            save_queued_sessions({tracker_data['deviceID']: station.core}, write=False)
+            save_recurrences({tracker_data['deviceID']: station.core.recurrences}, write=False)
+            # Written at once, a crash must not lose the data of the plug
+            settingsManager.save_file()
+            if self.deviceID_to_stationID.get(tracker_data['deviceID']) == stationID:
+                del self.deviceID_to_stationID[tracker_data['deviceID']]
+        station.release()
 
     def initialize_threads(self):
         """
@@ -169,67 +301,169 @@ class WindowManager:
         """
         self.device_retriever = DeviceRetriever(parent=app,
                                                 settingsManager=settingsManager,
-                                                disable_widgets=[self.windows['main'].pushButton_refresh,
-                                                                 self.windows['login'].pushButton_connect, ],
+                                                disable_widgets=[self.windows['main'].pushButton_refresh, ],
                                                 label_widget=self.windows['main'].label_info)
         # Finished Signal
-        reconnect(self.device_retriever.signals.finished, self._update_stations)  # nopep8
+        reconnect(self.device_retriever.signals.finished, self.finished_search)  # nopep8
+        # Periodic search for added, removed or renamed plugs
+        self.discoveryTimer = QTimer()
+        self.discoveryTimer.timeout.connect(lambda: self.search_for_devices(background=True))
+        self.discoveryTimer.start(const.DEVICE_DISCOVERY_INTERVAL)
         # Error Signal
         reconnect(self.device_retriever.signals.error, self.show_error)  # nopep8
+        # Client mode: the state of all daemon stations is read on a worker once per tick
+        self.stationPoller = StationPoller()
+        reconnect(self.stationPoller.signals.finished, self.finished_poll)  # nopep8
+        self.pollTimer = QTimer()
+        self.pollTimer.timeout.connect(self.poll_daemon_stations)
+        if self.apiClient is not None:
+            self.pollTimer.start(clock.interval(2500))
+        # Stall watchdog (heartbeat from the event loop)
+        self.heartbeatTimer = QTimer()
+        self.heartbeatTimer.timeout.connect(diagnostics.watchdog.beat)
+        if diagnostics.watchdog.enabled:
+            self.heartbeatTimer.start(100)
+            diagnostics.watchdog.start()
 
     def initialize_binds(self):
         """
         Bind the widgets to other methods
+        The widgets of a window are bound once it is loaded
+        """
+        self.eventHandler.addFilter(Qt.Key_F12, self.keyPress_showDiagnostics)
+        self.eventHandler.addFilter(Qt.Key_F9, self.keyPress_toggleProfiler)
+        self.windows.add_initializer('main', self._initialize_binds_main)
+        self.windows.add_initializer('login', self._initialize_binds_login)
+        self.windows.add_initializer('session', self._initialize_binds_session)
+        self.windows.add_initializer('edit', self._initialize_binds_edit)
+        self.windows.add_initializer('history', self._initialize_binds_history)
+        self.windows.add_initializer('settings', self._initialize_binds_settings)
+
+    def _initialize_binds_main(self, window: QWidget):
+        """
+        Bind the widgets of the main window
         """
-        # -Main Window-
-        reconnect(self.windows['main'].pushButton_login.clicked,
+        reconnect(window.pushButton_login.clicked,
                   lambda *args: self.clicked_main_openLoginWindow())
-        reconnect(self.windows['main'].pushButton_refresh.clicked,
+        reconnect(window.pushButton_refresh.clicked,
                   lambda *args: self.search_for_devices())
-        reconnect(self.windows['main'].pushButton_switch.clicked,
+        reconnect(window.pushButton_switch.clicked,
                   lambda *args: self.clicked_main_switchPage())
-        reconnect(self.windows['main'].pushButton_settings.clicked,
+        reconnect(window.pushButton_settings.clicked,
                   lambda *args: self.clicked_main_openSettingsWindow())
+        reconnect(window.comboBox_statistics_occupancyRange.currentIndexChanged,
+                  lambda *args: self.refresh_occupancy())
 
-        # -Login Window-
-        reconnect(self.windows['login'].pushButton_connect.clicked,
+    def _initialize_binds_login(self, window: QWidget):
+        """
+        Bind the widgets of the login window
+        """
+        reconnect(window.pushButton_connect.clicked,
                   lambda *args: self.clicked_login_connect())
 
-        # -Session Window-
-        time_buttons = [self.windows['session'].pushButton_30m,
-                        self.windows['session'].pushButton_1h,
-                        self.windows['session'].pushButton_2h,
-                        self.windows['session'].pushButton_3h, ]
+    def _initialize_binds_session(self, window: QWidget):
+        """
+        Bind the widgets of the session window
+        """
+        time_buttons = [window.pushButton_30m,
+                        window.pushButton_1h,
+                        window.pushButton_2h,
+                        window.pushButton_3h, ]
         for button in time_buttons:
             reconnect(button.clicked,
                       lambda *args, wig=button: self.clicked_session_createNewSession(wig.property('duration').toPython()))
         # Custom Button
-        timeEdit_duration = self.windows['session'].timeEdit_duration
-        reconnect(self.windows['session'].pushButton_custom.clicked,
+        timeEdit_duration = window.timeEdit_duration
+        reconnect(window.pushButton_custom.clicked,
                   lambda *args, wig=timeEdit_duration: self.clicked_session_createNewSession(timeEdit_duration.property('time').toPython()))
         # Radio Buttons
-        reconnect(self.windows['session'].radioButton_startAt.clicked,
-                  lambda: self.windows['session'].timeEdit_startAt.setEnabled(True))
-        reconnect(self.windows['session'].radioButton_append.clicked,
-                  lambda: self.windows['session'].timeEdit_startAt.setEnabled(False))
-        reconnect(self.windows['session'].radioButton_now.clicked,
-                  lambda: self.windows['session'].timeEdit_startAt.setEnabled(False))
-
-        # -Settings Window-
-        reconnect(self.windows['settings'].pushButton_apply.clicked,
+        reconnect(window.radioButton_startAt.clicked,
+                  lambda: window.dateTimeEdit_startAt.setEnabled(True))
+        reconnect(window.radioButton_append.clicked,
+                  lambda: window.dateTimeEdit_startAt.setEnabled(False))
+        reconnect(window.radioButton_now.clicked,
+                  lambda: window.dateTimeEdit_startAt.setEnabled(False))
+
+    def _initialize_binds_edit(self, window: QWidget):
+        """
+        Bind the widgets of the edit window
+        """
+        reconnect(window.dateEdit_day.dateChanged,
+                  lambda *args: self.dateChanged_edit_day())
+        reconnect(window.pushButton_import.clicked,
+                  lambda *args: self.keyPress_edit_importSessions())
+
+    def _initialize_binds_history(self, window: QWidget):
+        """
+        Bind the widgets of the history window
+        """
+        reconnect(window.lineEdit_search.textChanged,
+                  lambda *args: self.textChanged_history_search())
+
+    def _initialize_binds_settings(self, window: QWidget):
+        """
+        Bind the widgets of the settings window
+        """
+        reconnect(window.pushButton_apply.clicked,
                   lambda *args: self.clicked_settings_applySettings())
-        reconnect(self.windows['settings'].pushButton_resetAll.clicked,
+        reconnect(window.pushButton_resetAll.clicked,
                   lambda *args: self.clicked_settings_resetAllSettings())
-        reconnect(self.windows['settings'].pushButton_export.clicked,
+        reconnect(window.pushButton_export.clicked,
                   lambda *args: self.clicked_settings_export())
 
     def refresh(self):
         """
         Refresh all stations and statistics
         """
+        start = time.perf_counter()
         for station in self.stations.values():
             station.refresh()
+        if is_page_visible(self.windows['main'], const.STATISTICS_PAGE):
+            self.refresh_occupancy()
         self.update_stackedWidget_minimumSize()
+        self.refresh_duration = time.perf_counter() - start
+        diagnostics.record(REFRESH_TICK, self.refresh_duration)
+
+    def tick_occupancy(self):
+        """Refresh the occupancy chart if the statistics page is shown"""
+        if is_page_visible(self.windows['main'], const.STATISTICS_PAGE):
+            self.refresh_occupancy()
+
+    def refresh_occupancy(self):
+        """
+        Update the occupancy chart of all stations
+        (Only calculated and redrawn when the histories changed or a minute passed)
+        """
+        window = self.windows['main']
+        days = const.OCCUPANCY_RANGES[window.comboBox_statistics_occupancyRange.currentIndex()]
+        now = clock.now().replace(second=0, microsecond=0)
+        histories = {station.device.deviceID: station.sessionTracker.tracked_sessions
+                     for station in self.stations.values() if station.device is not None}
+        key = (days, now, occupancy.version, len(histories))
+        if key == self._occupancy_key:
+            return
+        if days == 1:
+            start_date = dt.datetime.combine(now.date(), dt.time())
+        else:
+            start_date = now - dt.timedelta(days=days)
+        result = occupancy.occupancy(histories, start_date, now)
+        # Taken after the calculation, encoding a new history increases the version
+        self._occupancy_key = (days, now, occupancy.version, len(histories))
+        self.occupancyChart.set_occupancy(result)
+        # -Summary-
+        peak, peak_date = result.peak
+        fully_booked = result.fully_booked()
+        if peak_date is None or peak == 0:
+            summary = 'No sessions in this time range'
+        else:
+            summary = f"Peak: {peak} of {result.capacity} on {peak_date.strftime('%d.%m.%Y %H:%M')}    " \
+                      f"Average: {result.average():.1f}    " \
+                      f"Fully booked: {format_duration(sum((end - start).total_seconds() for start, end in fully_booked))} h"  # nopep8
+        window.label_statistics_occupancySummary.setText(summary)
+        # Latest fully booked periods
+        window.label_statistics_occupancySummary.setToolTip('\n'.join(
+            f"{start.strftime('%d.%m.%Y %H:%M')} - {end.strftime('%H:%M' if end.date() == start.date() else '%d.%m.%Y %H:%M')}"  # nopep8
+            for start, end in fully_booked[-10:]))
 
     # -Page loads-
     def update_stackedWidget_minimumSize(self):
@@ -349,18 +583,24 @@ class WindowManager:
         start_date: Union[dt.datetime, None]
         # Get Start Date
         if self.windows['session'].radioButton_startAt.isChecked():
-            timeEdit = self.windows['session'].timeEdit_startAt
-            time = timeEdit.property('time').toPython()
-            start_date = dt.datetime.combine(dt.date.today(), time)
+            dateTimeEdit = self.windows['session'].dateTimeEdit_startAt
+            start_date = dateTimeEdit.property('dateTime').toPython().replace(second=0, microsecond=0)
         elif self.windows['session'].radioButton_now.isChecked():
-            start_date = dt.datetime.now()
+            start_date = clock.now()
         elif self.windows['session'].radioButton_append.isChecked():
             start_date = None
+        rrule = const.REPEAT_RULES[self.windows['session'].comboBox_repeat.currentIndex()]
         # -Add session to station-
         station = self.stations[stationID]
-        success = station.add_session(customerName=customerName,
-                                      start_date=start_date,
-                                      duration=duration,)
+        if rrule is None:
+            success = station.add_session(customerName=customerName,
+                                          start_date=start_date,
+                                          duration=duration,)
+        else:
+            success = station.add_recurring_session(customerName=customerName,
+                                                    start_date=start_date,
+                                                    duration=duration,
+                                                    rrule=rrule)
         # -Close Window-
         if success:
             self.windows['session'].setProperty('stationID', -1)
@@ -403,7 +643,9 @@ class WindowManager:
 
     def clicked_settings_export(self):
         """Export session history"""
-        collected_histories: Dict[str, Station] = {}
+        # Only needed for exports, so not imported on startup
+        import subprocess
+        collected_histories: Dict[str, list] = {}
         for station in self.stations.values():
             sessionTracker_data = station.sessionTracker.extract_data()
             if (sessionTracker_data is None or
@@ -413,7 +655,7 @@ class WindowManager:
                 continue
             collected_histories[sessionTracker_data['deviceID']] = sessionTracker_data['tracked_sessions']
         # -Get save path-
-        defaultName = 'SessionHistoryExport_%s' % dt.datetime.now().strftime(r'%d-%m-%Y')
+        defaultName = 'SessionHistoryExport_%s' % clock.now().strftime(r'%d-%m-%Y')
         filepath = QFileDialog.getSaveFileName(parent=self.windows['settings'],
                                                caption='Save File',
                                                dir=os.path.join(settingsManager.value('lastExportDir'), defaultName),
@@ -423,6 +665,23 @@ class WindowManager:
             # No name specified
             return
         settingsManager.setValue('lastExportDir', os.path.dirname(filepath))
+        self.write_history_export(filepath, collected_histories)
+
+        # TEMP
+        subprocess.Popen(filepath, shell=True)
+
+    def write_history_export(self, filepath: str, collected_histories: Dict[str, list]):
+        """
+        Write the session histories to an excel file
+
+        Paramaters:
+            filepath(str):
+                Path of the .xlsx file
+            collected_histories(dict):
+                Tracked sessions by deviceID
+        """
+        # Only needed for exports, so not imported on startup
+        import xlsxwriter
         # --Write to excel file--
         # Create a workbook and add a worksheet.
         workbook = xlsxwriter.Workbook(filepath)
@@ -434,6 +693,7 @@ class WindowManager:
         worksheet.set_column(2, 2, 20)
         worksheet.set_column(3, 5, 13.57)
         worksheet.set_column(6, 6, 50)
+        worksheet.set_column(7, 7, 13.57)
         worksheet.set_row(0, 30)
         worksheet.set_default_row(18.75)
         # Cell styles
@@ -442,12 +702,14 @@ class WindowManager:
             'default': workbook.add_format(),
             'date': workbook.add_format(),
             'time': workbook.add_format(),
+            'duration': workbook.add_format(),
             'mergedCell': workbook.add_format(),
         }
         formats_2 = {
             'default': workbook.add_format(),
             'date': workbook.add_format(),
             'time': workbook.add_format(),
+            'duration': workbook.add_format(),
             'mergedCell': workbook.add_format(),
         }
         formatCycle = cycle([formats_1, formats_2])
@@ -473,9 +735,17 @@ class WindowManager:
         formats_2['date'].set_num_format('dd.mm.yyyy')
         formats_1['time'].set_num_format('HH:MM')
         formats_2['time'].set_num_format('HH:MM')
+        # Durations can be longer than a day
+        formats_1['duration'].set_num_format('[HH]:MM')
+        formats_2['duration'].set_num_format('[HH]:MM')
+        formats_1['amount'] = workbook.add_format({'num_format': '#,##0.00', 'align': 'center', 'valign': 'vcenter',
+                                                   'bg_color': '#FFFFFF'})
+        formats_2['amount'] = workbook.add_format({'num_format': '#,##0.00', 'align': 'center', 'valign': 'vcenter',
+                                                   'bg_color': '#DCE6F1'})
         # -Cell Texts-
         # Titles
-        titles = ['Device Name', 'Date', 'Customer Name', 'Session Start', 'Session End', 'Duration', 'Device ID']
+        titles = ['Device Name', 'Date', 'Customer Name', 'Session Start', 'Session End', 'Duration', 'Device ID',
+                  f'Revenue ({revenue.currency})']
         for col, title in enumerate(titles):
             worksheet.write(0, col, title, title_format)
         # Content
@@ -497,19 +767,110 @@ class WindowManager:
                 worksheet.write(row, 6, deviceID, formats['mergedCell'])
             # -Device ID-
             # -Session Data-
+            rateTable = revenue.table(deviceID)
             for tracked_session in tracked_sessions:
                 worksheet.write(row, 1, tracked_session.start_date, formats['date'])
                 worksheet.write(row, 2, tracked_session.customerName, formats['default'])
                 worksheet.write(row, 3, tracked_session.start_date, formats['time'])
                 worksheet.write(row, 4, tracked_session.end_date, formats['time'])
-                worksheet.write(row, 5, tracked_session.duration, formats['time'])
+                worksheet.write(row, 5, tracked_session.duration, formats['duration'])
+                worksheet.write(row, 7, rateTable.price(tracked_session), formats['amount'])
                 row += 1
+        self._write_revenue_sheet(workbook, collected_histories, title_format, formats_1)
         workbook.close()
 
-        # TEMP
-        subprocess.Popen(filepath, shell=True)
+    def _write_revenue_sheet(self, workbook, collected_histories: Dict[str, list], title_format, formats: dict):
+        """
+        Add the revenue by day, device, customer and tier to the workbook
+        """
+        report = revenue.report(collected_histories)
+        worksheet = workbook.add_worksheet('Revenue')
+        worksheet.set_column(0, 10, 18)
+        worksheet.set_row(0, 30)
+        deviceNames = {deviceID: self.stations[self.deviceID_to_stationID[deviceID]].device.deviceName
+                       for deviceID in report['devices']}
+        tables = [
+            (('Date', 'Revenue'), [(day, amount) for day, amount in report['days'].items()], 'date'),
+            (('Device Name', 'Revenue'), [(deviceNames[deviceID], amount)
+                                          for deviceID, amount in report['devices'].items()], 'default'),
+            (('Customer Name', 'Revenue'), list(report['customers'].items()), 'default'),
+            (('Tier', 'Revenue'), [(tier.capitalize(), amount)
+                                   for tier, (_, amount) in sorted(report['tiers'].items())], 'default'),
+        ]
+        # Tables next to each other, separated by an empty column
+        for i, (titles, rows, key_format) in enumerate(tables):
+            col = i * 3
+            worksheet.write(0, col, titles[0], title_format)
+            worksheet.write(0, col + 1, f'{titles[1]} ({revenue.currency})', title_format)
+            for row, (key, amount) in enumerate(rows, 1):
+                worksheet.write(row, col, key, formats[key_format])
+                worksheet.write(row, col + 1, amount, formats['amount'])
+
+    # -Text changes-
+    def textChanged_history_search(self):
+        """
+        Filter the history table by the search text
+        """
+        stationID = self.windows['history'].property('stationID')
+        if stationID in self.stations:
+            self.stations[stationID].sessionTracker._historyWindow_updateTable()
 
     # -Key presses-
+    def keyPress_toggleProfiler(self):
+        """
+        Start a profile capture, or stop the running one
+        (A capture is stopped automatically after liveProfiler.duration seconds)
+        """
+        if liveProfiler.is_running:
+            self.stop_profiler()
+            return
+        liveProfiler.start()
+        self.windows['main'].label_info.setText('Profiling... (F9 to stop)')
+        self.profilerTimer = QTimer()
+        self.profilerTimer.setSingleShot(True)
+        self.profilerTimer.timeout.connect(self.stop_profiler)
+        self.profilerTimer.start(liveProfiler.duration * 1000)
+
+    def stop_profiler(self):
+        """
+        Stop the profile capture and show where it was saved
+        """
+        if not liveProfiler.is_running:
+            return
+        self.profilerTimer.stop()
+        prof_path, collapsed_path = liveProfiler.stop()
+        self.windows['main'].label_info.setText('')
+        msg = QMessageBox()
+        msg.setWindowTitle('Profile Saved')
+        msg.setIcon(QMessageBox.Icon.Information)
+        msg.setText(f'The profile was saved to:\n{prof_path}\n{collapsed_path}')
+        msg.setStandardButtons(QMessageBox.Ok)
+        msg.setWindowFlag(Qt.WindowStaysOnTopHint)
+        msg.exec_()
+
+    def keyPress_showDiagnostics(self):
+        """
+        Show the latency percentiles and event loop stalls
+        (and write them to the diagnostics log)
+        """
+        report = diagnostics.dump()
+        msg = QMessageBox()
+        msg.setWindowTitle('Diagnostics')
+        msg.setIcon(QMessageBox.Icon.Information)
+        msg.setText(f'The diagnostics were written to {os.path.join(diagnostics.log_folder, DIAGNOSTICS_LOG_FILE)}')
+        msg.setDetailedText(report)
+        msg.setStandardButtons(QMessageBox.Ok)
+        msg.setWindowFlag(Qt.WindowStaysOnTopHint)
+        msg.exec_()
+
+    def dateChanged_edit_day(self):
+        """
+        Show the sessions of the selected day in the edit window
+        """
+        stationID = self.windows['edit'].property('stationID')
+        if stationID in self.stations:
+            self.stations[stationID].refresh()
+
     def keyPress_edit_deleteSession(self):
         """
         Delete selected queues
@@ -519,20 +880,63 @@ class WindowManager:
         # Perform deletion on selection
         station.delete_selection()
 
+    def keyPress_edit_importSessions(self):
+        """
+        Import sessions of a CSV or JSON file into the queue
+        of the station open in the edit window
+        """
+        station = self.stations[self.windows['edit'].property('stationID')]
+        # The export folder is used until the first import
+        import_dir = settingsManager.data.get('lastImportDir', settingsManager.value('lastExportDir'))
+        filepath = QFileDialog.getOpenFileName(parent=self.windows['edit'],
+                                               caption='Import Sessions',
+                                               dir=import_dir,
+                                               filter=IMPORT_FILE_FILTER,
+                                               )[0]
+        if not filepath:
+            # No file selected
+            return
+        try:
+            sessions, skipped_rows = read_sessions(filepath, clock.today())
+        except SessionImportError as e:
+            msg = QMessageBox()
+            msg.setWindowTitle("Import Sessions")
+            msg.setIcon(QMessageBox.Warning)
+            msg.setText(f"The file could not be read:\n{e}")
+            msg.setStandardButtons(QMessageBox.Ok)
+            msg.setWindowFlag(Qt.WindowStaysOnTopHint)
+            msg.exec_()
+            return
+        station.add_sessions(sessions, skipped_rows)
+        settingsManager.setValue('lastImportDir', os.path.dirname(filepath))
+
     def reset_application(self):
         """Delete data file and restart the application"""
         del settingsManager.data
         os.execl(sys.executable, sys.executable, *sys.argv)
 
-    def search_for_devices(self):
+    def search_for_devices(self, background: bool = False):
         """
         Refresh the main window by researching for
         devices and setting up the stations
+
+        Paramaters:
+            background(bool):
+                Periodic search, errors are only logged and
+                a failed search keeps the current stations
         """
+        if self._searching:
+            # Search already running
+            return False
+        if self.apiClient is not None:
+            # The daemon searches the plugs, its stations are listed
+            return self.list_daemon_stations(background)
         if not (settingsManager.value('username') and
                 settingsManager.value('password')):
             # No current device manager and username/password
             # was not changed
+            if background:
+                return False
             msg = QMessageBox()
             msg.setWindowTitle('No Login Information')
             msg.setIcon(QMessageBox.Icon.Warning)
@@ -541,64 +945,163 @@ class WindowManager:
             msg.setWindowFlag(Qt.WindowStaysOnTopHint)
             msg.exec_()
             return False
+        self._searching = True
+        self._background_search = background
+        self._search_failed = False
+        self.device_retriever.background = background
         self.threadpool.start(self.device_retriever)
         return True
 
+    def list_daemon_stations(self, background: bool = False) -> bool:
+        """
+        Set up the stations of the daemon
+
+        Paramaters:
+            background(bool):
+                Periodic search, errors are only logged and
+                a failed request keeps the current stations
+        """
+        try:
+            devices = [RemoteDevice(data) for data in self.apiClient.stations()]
+        except ApiError as e:
+            diagnostics.log(f'Station daemon not reachable: {e}')
+            if not background:
+                msg = QMessageBox()
+                msg.setWindowTitle('Station Daemon')
+                msg.setIcon(QMessageBox.Icon.Warning)
+                msg.setText(f'The station daemon at {self.apiClient.base_url} is not reachable!')
+                msg.setDetailedText(str(e))
+                msg.setStandardButtons(QMessageBox.Ok)
+                msg.setWindowFlag(Qt.WindowStaysOnTopHint)
+                msg.exec_()
+            return False
+        self._update_stations(devices)
+        return True
+
+    def poll_daemon_stations(self):
+        """
+        Read the state of the daemon stations on a worker
+        (Skipped while the last poll is still running)
+        """
+        if self.stationPoller.running:
+            return
+        self.stationPoller.cores = {stationID: station.core for stationID, station in self.stations.items()
+                                    if isinstance(station.core, RemoteStationCore)}
+        self.stationPoller.running = True
+        self.threadpool.start(self.stationPoller)
+
+    def finished_poll(self, states: dict):
+        """
+        Apply the states read by the station poller
+        """
+        for stationID, state in states.items():
+            station = self.stations.get(stationID)
+            if station is not None and isinstance(station.core, RemoteStationCore):
+                station.core.apply(state)
+                station.refresh()
+
+    def finished_search(self, devices: list):
+        """
+        Apply the devices found by the device retriever
+        """
+        self._searching = False
+        if self._background_search and self._search_failed:
+            # Keep the stations through a temporary connection problem
+            return
+        self._update_stations(devices)
+
     def _update_stations(self, devices: list = []):
         """
-        Checks if all plugs are still connected, and adds new ones
-        if there have been detected new plugs.
+        Reconcile the stations with the found devices by their deviceID
+        Only the stations of added, removed or renamed devices are updated
+        (A device keeps its station, new devices take the free grid positions)
 
         Paramaters:
             devices(list):
                 List of devices found
         """
-        if not devices:
-            # No device registered on account (or no devices on remote control)
-            pass
-        # Sort devices by name
-        devices = sorted(devices, key=lambda s: s.deviceName)
-        tracked_sessions = settingsManager.value('tracked_sessions')
-        for i, stationID in enumerate(self.stationIDs):
-            station = self.stations[stationID]
-            if i < len(devices):
-                device = devices[i]
-                try:
-                    if self.deviceID_to_stationID[device.deviceID] == stationID:
-                        # Station at the place same place as before update -> no need for action
-                        # Update, in case the plug name was changed
-                        new_data = {'device': device}
-                    else:
-                        raise KeyError('Plug at the same position')
-                except KeyError:
-                    # See if the plug already existed
-                    try:
-                        old_stationID = self.deviceID_to_stationID[device.deviceID]
-                        # Plug has changed position
-                        new_data = self.stations[old_stationID].extract_data()
-                    except KeyError:
-                        # Plug is completely new
-                        new_data = {'device': device,
-                                    'state': 'deactivated', }
-                        if device.deviceID in tracked_sessions.keys():
-                            # Set tracked sessions to the saved ones
-                            station.sessionTracker.update(
-                                tracked_sessions=tracked_sessions[device.deviceID],
-                                override=True
-                            )
-
-                self.deviceID_to_stationID[device.deviceID] = stationID
-                station.show(**new_data)
-            else:
-                station.reset(hide=True)
+        with profiler.phase('_update_stations'):
+            start = time.perf_counter()
+            found = {device.deviceID: device for device in devices}
+            placed = {deviceID: (stationID, self.stations[stationID].device.deviceName)
+                      for deviceID, stationID in self.deviceID_to_stationID.items()}
+            changes = reconcile_devices(placed, [(device.deviceID, device.deviceName) for device in devices])
+            tracked_sessions = settingsManager.value('tracked_sessions')
+            recurring_sessions = settingsManager.data.get('recurring_sessions', {})
+            queued_sessions = settingsManager.data.get('queued_sessions', {})
+            # Stations of the daemon (its history and queue are mirrored)
+            remote = self.apiClient is not None
+            # -Removed devices-
+            for deviceID, stationID in changes['remove']:
+                if not remote:
+                    # Keep the history of the device for when it reappears
+                    tracked_sessions[deviceID] = self.stations[stationID].sessionTracker.tracked_sessions
+                self.historyIndex.remove_device(deviceID)
+                del self.deviceID_to_stationID[deviceID]
+            if changes['remove'] and not remote:
+                settingsManager.data['tracked_sessions'] = tracked_sessions
+                save_queued_sessions({deviceID: self.stations[stationID].core
+                                      for deviceID, stationID in changes['remove']}, write=False)
+                save_recurrences({deviceID: self.stations[stationID].core.recurrences
+                                  for deviceID, stationID in changes['remove']}, write=False)
+                # Written at once, a crash must not lose the data of the plugs that went away
+                settingsManager.save_file()
+            # -Remove stations of devices that went away- (their stationIDs are free again)
+            for deviceID, stationID in changes['remove']:
+                self.remove_station(stationID, save=False)
+            # -New devices-
+            for deviceID, stationID in changes['add']:
+                station = self.add_station(stationID)
+                if remote:
+                    self._attach_remote_station(station, found[deviceID])
+                    self.deviceID_to_stationID[deviceID] = stationID
+                    continue
+                # Set tracked sessions to the saved ones
+                station.sessionTracker.update(tracked_sessions=tracked_sessions.get(deviceID, []),
+                                              override=True)
+                # Saved queue, before the recurrence rules are expanded
+                station.sessions = []
+                station.core.restore_sessions(queued_sessions.get(deviceID, []))
+                station.show(device=found[deviceID],
+                             customerName=Station.DEFAULT_CUSTOMERNAME,
+                             is_activated=Station.DEFAULT_ACTIVATION,
+                             recurrences=RecurrenceSchedule.from_data(recurring_sessions.get(deviceID, [])))
+                self.deviceID_to_stationID[deviceID] = stationID
+            # -Renamed devices-
+            for deviceID, stationID in changes['rename']:
+                self.stations[stationID].update(device=found[deviceID])
+            # -Unchanged devices- (new device instance, nothing to redraw)
+            for deviceID, stationID in changes['keep']:
+                self.stations[stationID].device = found[deviceID]
+                if remote:
+                    self.stations[stationID].core.remoteID = found[deviceID].stationID
+            if changes['remove'] or changes['add']:
+                self.update_stackedWidget_minimumSize()
+            self.layout_duration = time.perf_counter() - start
+        profiler.milestone('first _update_stations')
 
-        self.refresh()
+    def _attach_remote_station(self, station: Station, device: RemoteDevice):
+        """
+        Mirror the station of the daemon the device is plugged into
+        """
+        try:
+            remote_tracked_sessions = station.core.attach(device.stationID)
+        except ApiError as e:
+            diagnostics.log(f'Station {device.stationID} of the daemon not loaded: {e}')
+            remote_tracked_sessions = []
+        station.sessionTracker.update(tracked_sessions=remote_tracked_sessions, override=True)
+        station.show(device=device, customerName=Station.DEFAULT_CUSTOMERNAME)
 
     def show_error(self, data):
         """
         Show the QMessagebox on this thread
         (Used for threads returning errors)
         """
+        self._search_failed = True
+        if self._background_search:
+            # Do not interrupt the user for a periodic search
+            diagnostics.log(f'Background device search failed: {data}')
+            return
         msg = QMessageBox()
         msg.setWindowFlag(Qt.WindowStaysOnTopHint)
         contact_creator = '\n\nPlease contact the creator and attach a screenshot of this error (+ expanded details)'
@@ -620,53 +1123,152 @@ class WindowManager:
         msg.exec_()
 
 
+def save_queued_sessions(cores: Dict[str, StationCore], write: bool = True):
+    """
+    Save the booked sessions of the queues by deviceID
+
+    Paramaters:
+        cores(dict):
+            Station core of each deviceID
+        write(bool):
+            Write the data file
+    """
+    queued_sessions = settingsManager.data.get('queued_sessions', {})
+    for deviceID, core in cores.items():
+        queued_sessions[deviceID] = core.booked_sessions()
+    settingsManager.data['queued_sessions'] = queued_sessions
+    if write:
+        settingsManager.save_file()
+
+
+def save_recurrences(schedules: Dict[str, RecurrenceSchedule], write: bool = True):
+    """
+    Save the recurring sessions by deviceID
+
+    Paramaters:
+        schedules(dict):
+            Recurrence schedule of each deviceID
+        write(bool):
+            Write the data file
+    """
+    recurring_sessions = settingsManager.data.get('recurring_sessions', {})
+    now_seconds = to_epoch(clock.now())
+    for deviceID, schedule in schedules.items():
+        recurring_sessions[deviceID] = schedule.to_data(now_seconds)
+    settingsManager.data['recurring_sessions'] = recurring_sessions
+    if write:
+        settingsManager.save_file()
+
+
 @atexit.register
 def closeEvent():
     """Run this method before closing the application"""
-    # Turn off all plugs
+    powerOff = None
     if 'winManager' in globals():
-        new_tracked_sessions = settingsManager.value('tracked_sessions')
-        for station in winManager.stations.values():
-            if station.device is not None:
-                # Turn off device
-                station.device._device.power_off()
-                # Save history by deviceID
-                deviceID = station.device.deviceID
-                new_tracked_sessions[deviceID] = station.sessionTracker.tracked_sessions
-        settingsManager.setValue('tracked_sessions', new_tracked_sessions)
+        if winManager.apiClient is None:
+            # Turn off all plugs at once, the data is saved meanwhile
+            devices = [station.device for station in winManager.stations.values() if station.device is not None]
+            powerOff = ParallelPowerOff(devices)
+            powerOff.start()
+            # Save history by deviceID
+            new_tracked_sessions = settingsManager.value('tracked_sessions')
+            for station in winManager.stations.values():
+                if station.device is not None:
+                    new_tracked_sessions[station.device.deviceID] = station.sessionTracker.tracked_sessions
+            settingsManager.data['tracked_sessions'] = new_tracked_sessions
+            save_queued_sessions({station.device.deviceID: station.core
+                                  for station in winManager.stations.values() if station.device is not None},
+                                 write=False)
+            save_recurrences({station.device.deviceID: station.core.recurrences
+                              for station in winManager.stations.values() if station.device is not None},
+                             write=False)
+        # (The daemon keeps running the stations and saves their data)
 
         new_geometries = settingsManager.value('window_geometries')
+        # Windows never opened keep their saved geometry
         for win_name, window in winManager.windows.items():
             geometry = window.saveGeometry()
             new_geometries[win_name] = geometry
-        settingsManager.setValue('window_geometries', new_geometries)
+        settingsManager.data['window_geometries'] = new_geometries
 
     if not settingsManager.value('settings')['saveLogin']:
         # Do not save login
-        settingsManager.setValue('username', '')
-        settingsManager.setValue('password', '')
+        settingsManager.data['username'] = ''
+        settingsManager.data['password'] = ''
+    # Write everything at once
+    settingsManager.save_file()
+
+    if powerOff is not None:
+        unconfirmed = powerOff.wait(const.SHUTDOWN_TIMEOUT)
+        if unconfirmed:
+            text = 'Plugs not confirmed turned off on exit: %s' % ', '.join(device.deviceName for device in unconfirmed)
+            print(text, file=sys.stderr)
+            diagnostics.log(text)
 
 
-def load_windows() -> dict:
+class WindowRegistry(dict):
     """
-    Load all windows of this application and return
-    a dictionary with their instances
+    Dictionary of the application windows
+    A window is loaded on its first access, its geometry is
+    restored and the initializers added for it are run
+
+    Paramaters:
+        window_paths(dict):
+            Path of the .ui file of each window name
     """
-    def load_geometries():
-        """Load saved geometries"""
-        for win_name, window in windows.items():
-            if win_name in settingsManager.value('window_geometries'):
-                # Geometry saved -> load saved geometry
-                geometry = settingsManager.value('window_geometries')[win_name]
-                window.restoreGeometry(geometry)
-            else:
-                # Geometry not saved -> center window
-                geometry = window.geometry()
-                screen = app.desktop().screenNumber(app.desktop().cursor().pos())
-                centerPoint = app.desktop().screenGeometry(screen).center()
-                geometry.moveCenter(centerPoint)
-                window.move(geometry.topLeft())
 
+    def __init__(self, window_paths: Dict[str, str]):
+        super(WindowRegistry, self).__init__()
+        self.window_paths = window_paths
+        self._initializers: Dict[str, list] = defaultdict(list)
+
+    def __missing__(self, win_name: str) -> QWidget:
+        window = loader.load(self.window_paths[win_name], None)
+        if win_name != 'main':
+            # Window is not main
+            window.setWindowFlag(Qt.WindowStaysOnTopHint)
+        self[win_name] = window
+        load_geometry(win_name, window)
+        for initializer in self._initializers[win_name]:
+            initializer(window)
+        return window
+
+    def is_loaded(self, win_name: str) -> bool:
+        """
+        Return whether the window was already loaded
+        """
+        return dict.__contains__(self, win_name)
+
+    def add_initializer(self, win_name: str, initializer):
+        """
+        Add a method called with the window once it is loaded
+        (Called immediately if it is already loaded)
+        """
+        self._initializers[win_name].append(initializer)
+        if self.is_loaded(win_name):
+            initializer(self[win_name])
+
+
+def load_geometry(win_name: str, window: QWidget):
+    """Load the saved geometry of the window"""
+    if win_name in settingsManager.value('window_geometries'):
+        # Geometry saved -> load saved geometry
+        geometry = settingsManager.value('window_geometries')[win_name]
+        window.restoreGeometry(geometry)
+    else:
+        # Geometry not saved -> center window
+        geometry = window.geometry()
+        screen = app.desktop().screenNumber(app.desktop().cursor().pos())
+        centerPoint = app.desktop().screenGeometry(screen).center()
+        geometry.moveCenter(centerPoint)
+        window.move(geometry.topLeft())
+
+
+def load_windows() -> WindowRegistry:
+    """
+    Load the main window of this application and return
+    the registry of all windows (loaded on first access)
+    """
     global loader
     loader = QUiLoader()
     window_paths = {'main': ResourcePaths.ui_files.mainwindow,
@@ -676,14 +1278,8 @@ def load_windows() -> dict:
                     'history': ResourcePaths.ui_files.historywindow,
                     'settings': ResourcePaths.ui_files.settingswindow,
                     }
-    windows: Dict[str, QWidget] = {}
-    for win_name, path in window_paths.items():
-        window = loader.load(path, None)
-        if win_name != 'main':
-            # Window is not main
-            window.setWindowFlag(Qt.WindowStaysOnTopHint)
-        windows[win_name] = window
-    load_geometries()
+    windows = WindowRegistry(window_paths)
+    windows['main']  # Only the main window is needed for the first paint
 
     return windows
 
@@ -694,10 +1290,17 @@ def run():
     """
     global app
     global winManager
+    global metricsServer
     app = QApplication
     app.setAttribute(Qt.AA_UseHighDpiPixmaps)
     # ...Application settings here...
     app = app(sys.argv)
-    windows = load_windows()
+    with profiler.phase('load_windows'):
+        windows = load_windows()
+    # Metrics endpoint (only if a port is configured)
+    metricsServer = start_metrics_endpoint()
     # Create Manager
-    winManager = WindowManager(windows)
+    with profiler.phase('WindowManager'):
+        winManager = WindowManager(windows)
+    # Runs once the event loop painted the main window
+    QTimer.singleShot(0, lambda: profiler.milestone('first paint'))
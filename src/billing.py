@@ -0,0 +1,332 @@
+"""
+Revenue of the tracked sessions
+
+Every station (by deviceID, or the 'default' entry) has a rate table: an
+hourly rate for the times outside of all bands and bands of weekdays and
+times with their own hourly rate and tier (peak/off-peak). The rate tables
+are read from rates.json in the data folder, which is created with example
+rates on the first start:
+
+    {
+        "currency": "€",
+        "stations": {
+            "default": {
+                "rate": 30.0,
+                "tier": "off-peak",
+                "bands": [
+                    {"days": ["MO", "TU", "WE", "TH", "FR"], "start": "17:00", "end": "22:00",
+                     "rate": 45.0, "tier": "peak"}
+                ]
+            }
+        }
+    }
+
+Sessions are split at the band boundaries. The revenue is kept per history
+partition (device and day), only partitions with changed sessions are
+calculated again
+"""
+# -Root imports-
+from .core import (Session, DAY)
+from .recurrence import (WEEKDAYS, EPOCH_WEEKDAY)
+# -Other-
+from bisect import bisect_right
+import datetime as dt
+import json
+import os
+# Code annotation
+from typing import (Dict, Iterable, List, Set, Tuple, Union)
+
+RATES_FILE = 'rates.json'
+DEFAULT_KEY = 'default'
+PEAK = 'peak'
+OFF_PEAK = 'off-peak'
+WEEK = 7 * DAY
+DEFAULT_RATES = {
+    'currency': '€',
+    'stations': {
+        DEFAULT_KEY: {
+            'rate': 30.0,
+            'tier': OFF_PEAK,
+            'bands': [
+                {'days': ['MO', 'TU', 'WE', 'TH', 'FR'], 'start': '17:00', 'end': '22:00', 'rate': 45.0, 'tier': PEAK},
+                {'days': ['SA', 'SU'], 'start': '10:00', 'end': '22:00', 'rate': 45.0, 'tier': PEAK},
+            ],
+        },
+    },
+}
+
+
+def _parse_time(text: str) -> int:
+    """Return the seconds of the day of 'HH:MM' ('24:00' is the end of the day)"""
+    hours, minutes = (int(value) for value in text.split(':'))
+    if not (0 <= hours <= 24 and 0 <= minutes < 60) or hours * 60 + minutes > 24 * 60:
+        raise ValueError('Invalid time', text)
+    return hours * 3600 + minutes * 60
+
+
+class RateTable:
+    """Hourly rates of a station by time of the week
+
+    Paramaters:
+        rate(float):
+            Hourly rate outside of all bands
+        tier(str):
+            Tier of the times outside of all bands
+        bands(Iterable[dict]):
+            days (weekday codes), start and end ('HH:MM', an end before the
+            start is on the next day), rate and tier of each band.
+            Later bands take precedence over earlier ones
+    """
+
+    def __init__(self, rate: float, tier: str = OFF_PEAK, bands: Iterable[dict] = ()):
+        # Intervals (start, end, rate, tier) in seconds since Monday 00:00
+        intervals: List[Tuple[int, int, float, str]] = []
+        for band in bands:
+            start, end = _parse_time(band['start']), _parse_time(band['end'])
+            if end <= start:
+                # Band past midnight
+                end += DAY
+            for day in band['days']:
+                week_start = WEEKDAYS.index(day.upper()) * DAY + start
+                week_end = week_start + end - start
+                intervals.append((week_start, min(week_end, WEEK), float(band['rate']), band.get('tier', PEAK)))
+                if week_end > WEEK:
+                    # Sunday night into Monday
+                    intervals.append((0, week_end - WEEK, float(band['rate']), band.get('tier', PEAK)))
+        bounds = sorted({0, WEEK}.union(*((start, end) for start, end, _, _ in intervals)))
+        # Rate and tier of each segment between two bounds, equal neighbours are merged
+        self._bounds: List[int] = []
+        self._segments: List[Tuple[float, str]] = []
+        for segment_start in bounds[:-1]:
+            segment = (float(rate), tier)
+            for start, end, band_rate, band_tier in intervals:
+                if start <= segment_start < end:
+                    segment = (band_rate, band_tier)
+            if not self._segments or self._segments[-1] != segment:
+                self._bounds.append(segment_start)
+                self._segments.append(segment)
+        self._bounds.append(WEEK)
+
+    def split(self, start: int, end: int) -> Dict[str, List[float]]:
+        """
+        Split the time range (seconds since the EPOCH) at the band boundaries
+
+        Returns(dict):
+            [seconds, amount] by tier
+        """
+        tiers: Dict[str, List[float]] = {}
+        position = start
+        offset = ((start // DAY + EPOCH_WEEKDAY) % 7) * DAY + start % DAY
+        i = bisect_right(self._bounds, offset) - 1
+        while position < end:
+            step = min(end - position, self._bounds[i + 1] - offset)
+            rate, tier = self._segments[i]
+            values = tiers.setdefault(tier, [0, 0.0])
+            values[0] += step
+            values[1] += rate * step / 3600
+            position += step
+            offset += step
+            i += 1
+            if i == len(self._segments):
+                # Next week
+                offset, i = 0, 0
+        return tiers
+
+    def price(self, session: Session) -> float:
+        """Return the amount of the session"""
+        return sum(amount for _, amount in self.split(session.start, session.end).values())
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'RateTable':
+        return cls(rate=data['rate'], tier=data.get('tier', OFF_PEAK), bands=data.get('bands', ()))
+
+
+class DayRevenue:
+    """Revenue of the sessions of a device that started on one day"""
+    __slots__ = ('amount', 'tiers', 'customers', 'sessions')
+
+    def __init__(self):
+        self.amount = 0.0
+        # tier -> [seconds, amount]
+        self.tiers: Dict[str, List[float]] = {}
+        # customerName -> amount
+        self.customers: Dict[str, float] = {}
+        self.sessions = 0
+
+    def add(self, session: Session, table: RateTable):
+        amount = 0.0
+        for tier, (seconds, tier_amount) in table.split(session.start, session.end).items():
+            values = self.tiers.setdefault(tier, [0, 0.0])
+            values[0] += seconds
+            values[1] += tier_amount
+            amount += tier_amount
+        self.amount += amount
+        self.customers[session.customerName] = self.customers.get(session.customerName, 0.0) + amount
+        self.sessions += 1
+
+
+class RevenueEngine:
+    """
+    Revenue of the session histories, kept per device and day
+
+    The partitions of a device are brought up to date when its revenue is
+    read: days marked by invalidate are calculated again, everything if the
+    whole history of the device was replaced
+    """
+
+    def __init__(self):
+        self.currency = DEFAULT_RATES['currency']
+        self.tables: Dict[str, RateTable] = {}
+        self.default_table = RateTable.from_dict(DEFAULT_RATES['stations'][DEFAULT_KEY])
+        # deviceID -> day (days since the EPOCH) -> revenue
+        self._partitions: Dict[str, Dict[int, DayRevenue]] = {}
+        # deviceID -> days to calculate again (None = all)
+        self._dirty: Dict[str, Union[Set[int], None]] = {}
+        # deviceID -> (amount, tiers) of all days
+        self._totals: Dict[str, Tuple[float, Dict[str, List[float]]]] = {}
+
+    # -Rate tables-
+    def configure(self, data: dict):
+        """
+        Apply the rate tables (content of rates.json)
+        Raises ValueError/KeyError for invalid data
+        """
+        tables = {key: RateTable.from_dict(table_data) for key, table_data in data['stations'].items()}
+        self.currency = data.get('currency', '')
+        self.default_table = tables.pop(DEFAULT_KEY, self.default_table)
+        self.tables = tables
+        # All amounts change
+        self._partitions.clear()
+        self._dirty.clear()
+        self._totals.clear()
+
+    def load_rates(self, folder: str):
+        """
+        Read the rate tables of the folder, the example
+        rates are written if there is no rate file yet
+        """
+        path = os.path.join(folder, RATES_FILE)
+        if not os.path.exists(path):
+            os.makedirs(folder, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as rates_file:
+                json.dump(DEFAULT_RATES, rates_file, indent=4, ensure_ascii=False)
+        with open(path, 'r', encoding='utf-8') as rates_file:
+            self.configure(json.load(rates_file))
+
+    def table(self, deviceID: str) -> RateTable:
+        """Return the rate table of the device"""
+        return self.tables.get(deviceID, self.default_table)
+
+    def format_amount(self, amount: float) -> str:
+        return f'{amount:,.2f} {self.currency}'.strip()
+
+    # -Partitions-
+    def invalidate(self, deviceID: str, sessions: Iterable[Session]):
+        """
+        Mark the days of the added or removed sessions
+        """
+        dirty = self._dirty.setdefault(deviceID, set())
+        if dirty is not None:
+            dirty.update(session.start // DAY for session in sessions)
+
+    def invalidate_device(self, deviceID: str):
+        """
+        Mark the whole history of the device (e.g. replaced history)
+        """
+        self._dirty[deviceID] = None
+
+    def days(self, deviceID: str, sessions: Iterable[Session]) -> Dict[int, DayRevenue]:
+        """
+        Return the revenue of the device by day
+
+        Paramaters:
+            deviceID(str):
+                ID of the device
+            sessions(Iterable[Session]):
+                Tracked sessions of the device
+        """
+        partitions = self._partitions.get(deviceID)
+        dirty = self._dirty.pop(deviceID, set())
+        if partitions is not None and dirty is not None and not dirty:
+            # Nothing changed
+            return partitions
+        if partitions is None or dirty is None:
+            # Calculate all days
+            partitions = self._partitions[deviceID] = {}
+            dirty = None
+        else:
+            for day in dirty:
+                partitions.pop(day, None)
+        table = self.table(deviceID)
+        for session in sessions:
+            day = session.start // DAY
+            if dirty is None or day in dirty:
+                day_revenue = partitions.get(day)
+                if day_revenue is None:
+                    day_revenue = partitions[day] = DayRevenue()
+                day_revenue.add(session, table)
+        self._totals.pop(deviceID, None)
+        return partitions
+
+    def total(self, deviceID: str, sessions: Iterable[Session]) -> Tuple[float, Dict[str, List[float]]]:
+        """
+        Return the revenue of the device
+
+        Returns(tuple):
+            Amount and [seconds, amount] by tier
+        """
+        partitions = self.days(deviceID, sessions)
+        if deviceID not in self._totals:
+            amount = 0.0
+            tiers: Dict[str, List[float]] = {}
+            for day_revenue in partitions.values():
+                amount += day_revenue.amount
+                for tier, (seconds, tier_amount) in day_revenue.tiers.items():
+                    values = tiers.setdefault(tier, [0, 0.0])
+                    values[0] += seconds
+                    values[1] += tier_amount
+            self._totals[deviceID] = (amount, tiers)
+        return self._totals[deviceID]
+
+    def report(self, histories: Dict[str, List[Session]]) -> Dict[str, dict]:
+        """
+        Return the revenue of the devices by day, device, customer and tier
+
+        Paramaters:
+            histories(dict):
+                Tracked sessions by deviceID
+        Returns(dict):
+            'days' (dt.date -> amount), 'devices' (deviceID -> amount),
+            'customers' (name -> amount) and 'tiers' (tier -> [seconds, amount])
+        """
+        days: Dict[int, float] = {}
+        devices: Dict[str, float] = {}
+        customers: Dict[str, float] = {}
+        for deviceID, sessions in histories.items():
+            devices[deviceID] = self.total(deviceID, sessions)[0]
+            for day, day_revenue in self.days(deviceID, sessions).items():
+                days[day] = days.get(day, 0.0) + day_revenue.amount
+                for customerName, amount in day_revenue.customers.items():
+                    customers[customerName] = customers.get(customerName, 0.0) + amount
+        tiers: Dict[str, List[float]] = {}
+        for deviceID, sessions in histories.items():
+            for tier, (seconds, amount) in self.total(deviceID, sessions)[1].items():
+                values = tiers.setdefault(tier, [0, 0.0])
+                values[0] += seconds
+                values[1] += amount
+        epoch_date = dt.date(1970, 1, 1)
+        return {
+            'days': {epoch_date + dt.timedelta(days=day): amount for day, amount in sorted(days.items())},
+            'devices': devices,
+            'customers': dict(sorted(customers.items(), key=lambda item: -item[1])),
+            'tiers': tiers,
+        }
+
+    def forget(self, deviceID: str):
+        """Drop the partitions of the device"""
+        self._partitions.pop(deviceID, None)
+        self._dirty.pop(deviceID, None)
+        self._totals.pop(deviceID, None)
+
+
+revenue = RevenueEngine()
@@ -4,118 +4,69 @@ Classes
 # pylint: disable=no-name-in-module, import-error
 # -GUI-
 from PySide2.QtCore import (Qt, QTimer)
-from PySide2.QtWidgets import (QMessageBox, QTableWidgetItem, QHeaderView, QPushButton,
-                               QFrame, QLabel, QWidget)
+from PySide2.QtWidgets import (QMessageBox, QPushButton, QFrame, QLabel, QWidget)
 # -Root imports-
-from .gui_helper.classes import (EventHandler, QWidgetDelegate)
-from .gui_helper.methods import (reconnect)
+from .gui_helper.methods import (reconnect, is_page_visible)
 from .kasa.kasa_device import (Device)
+from .api_client import (RemoteDevice)
+from .api_json import ApiError
+from .clock import (Clock)
+from .diagnostics import (diagnostics, STATION_REFRESH, QUEUE_TABLE_FILL, HISTORY_TABLE_FILL)
+from .metrics import metrics
+from .core import (InvalidSessionError, Session, SessionHistoryIndex, CustomerNameIndex, SessionHistory,
+                   StationCore, format_duration)
+from .recurrence import (RecurrenceRule, RecurrenceSchedule)
+from .billing import revenue
+from .occupancy import occupancy
 from . import constants as const
 # -Other-
-from itertools import count
 import datetime as dt
 from string import Template
 # Code annotation
-from typing import (Dict, List, Union)
-
-
-class Session:
-    _id_counter = count()
-
-    def __init__(self, customerName: str, start_date: dt.datetime, duration: dt.time, sessionID: Union[int, None] = None):
-        if sessionID is None:
-            sessionID = next(self._id_counter)
-        self.sessionID = sessionID
-        self.customerName = customerName
-        self.start_date = start_date
-        self.duration = duration
-
-    @property
-    def end_date(self):
-        return self.start_date + dt.timedelta(hours=self.duration.hour,
-                                              minutes=self.duration.minute)
-
-    @end_date.setter
-    def end_date(self, value: dt.datetime):
-        assert isinstance(value, dt.datetime), "end_date has to be dt.datetime"
-        new_duration = value - self.start_date
-
-        if value <= self.start_date:
-            # Invalid new end_date
-            msg = QMessageBox()
-            msg.setWindowTitle("Invalid Input")
-            msg.setIcon(QMessageBox.Icon.Information)
-            msg.setText("Please set a valid end time!\nYour end time is before your start time.")  # nopep8
-            msg.setStandardButtons(QMessageBox.Ok)
-            msg.setWindowFlags(Qt.WindowStaysOnTopHint)
-            msg.exec_()
-            return
-
-        self.duration = (dt.datetime.min + new_duration).time()
-
-    def range_contains(self, datetime: dt.datetime) -> bool:
-        """
-        Returns whether the given datetime is contained inside the
-        range of this session
-        """
-        return self.start_date <= datetime <= self.end_date
-
-    def range_conflicts(self, start_date: dt.datetime, end_date: dt.datetime) -> bool:
-        """
-        Returns whether the given range conflicts with the range
-        of this session
-        """
-        return (self.start_date < end_date) and (start_date < self.end_date)
-
-    def extract_data(self) -> dict:
-        """
-        Extract the data of this session
-
-        Returns(dict):
-            Full data of the session
-        """
-        data = {
-            'sessionID': self.sessionID,
-            'customerName': self.customerName,
-            'start_date': self.start_date,
-            'duration': self.duration,
-        }
-        return data
-
-    def copy(self):
-        """Create a copy of this session"""
-        return Session(**self.extract_data())
+from typing import (List, Sequence, Union)
 
 
 class Station:
     """Station class containing the necessary data to control
     a single station
+    (Qt view over the StationCore holding the session logic)
 
     Paramaters:
         stationID(int):
             ID identifier for the station and suffix for
             all widget names
+        historyIndex(SessionHistoryIndex):
+            Search index shared by the session trackers of all stations
+        customerIndex(CustomerNameIndex):
+            Customer names shared by the session trackers of all stations
+        clock(Clock or None):
+            Source of the current time, the application clock if None
+        core(StationCore or None):
+            Session logic of the station, a new StationCore if None
+            (A RemoteStationCore mirrors a station of the daemon)
     """
     DEFAULT_DEVICE = None
     DEFAULT_CUSTOMERNAME = ''
     DEFAULT_ACTIVATION = False
     DEFAULT_SESSIONS = []
 
-    def __init__(self, windows, stationID: int, tracked_sessions: List[Session] = []):
+    def __init__(self, windows, stationID: int, historyIndex: SessionHistoryIndex,
+                 customerIndex: CustomerNameIndex, tracked_sessions: List[Session] = [],
+                 clock: Union[Clock, None] = None, core: Union[StationCore, None] = None):
         self.windows = windows
         # -Main Variables-
         # Static Paramaters
         self.stationID = stationID
-        self.device: Union[Device, None] = self.DEFAULT_DEVICE
+        self.device: Union[Device, RemoteDevice, None] = self.DEFAULT_DEVICE
+        self.core = StationCore(tracked_sessions, clock=clock) if core is None else core
+        self.clock = self.core.clock
         self.sessionTracker = SessionTracker(self,
-                                             tracked_sessions)
+                                             historyIndex,
+                                             customerIndex)
         # Dynamic Paramaters
         self._customerName: str = self.DEFAULT_CUSTOMERNAME
-        self._is_activated: bool = self.DEFAULT_ACTIVATION
-        self.sessions: List[Session] = self.DEFAULT_SESSIONS
-        # Helper Variables
-        self._editWindow_shownSessions: List[Session] = []
-        self.rowTranslator: Dict[int, int] = {}  # Connect edit row to sessionID
+        # Labels of the station gauges on the metrics endpoint
+        self._metricLabels: Union[dict, None] = None
 
         # -Setup-
         self._initialize_timers()
@@ -125,12 +76,12 @@ class Station:
 
     @property
     def is_activated(self):
-        return self._is_activated
+        return self.core.is_activated
 
     @is_activated.setter
     def is_activated(self, value: bool):
         assert isinstance(value, bool), "is_activated has to be bool"
-        self._is_activated = value
+        self.core.is_activated = value
 
         if not self.is_activated:
             # Deactivate station
@@ -139,6 +90,14 @@ class Station:
                 self.device.turn_off()
         self.refresh()
 
+    @property
+    def sessions(self) -> List[Session]:
+        return self.core.sessions
+
+    @sessions.setter
+    def sessions(self, value: List[Session]):
+        self.core.sessions = value
+
     @property
     def customerName(self):
         return self._customerName
@@ -157,7 +116,7 @@ class Station:
         # Refresh timer
         self.timer = QTimer()
         self.timer.timeout.connect(self.refresh)
-        self.timer.start(2500)
+        self.timer.start(self.clock.interval(2500))
 
     def _initialize_binds(self):
         """
@@ -176,12 +135,16 @@ class Station:
             - Update colors
             - Update Edit Window
             - Update Statistics Tracker
+        The widgets are only updated while they are visible,
+        the sessions and the device are always updated
         """
-        self._update_sessions()
-        self._update_texts()
-        self._update_colors()
-        self._editWindow_refresh()
-        self.sessionTracker.refresh()
+        with diagnostics.measure(STATION_REFRESH):
+            self._update_sessions()
+            self._update_texts()
+            self._update_colors()
+            self._editWindow_refresh()
+            self.sessionTracker.refresh()
+            self._update_metrics()
 
     def update(self, **kwargs):
         """Update the data of this station
@@ -191,17 +154,20 @@ class Station:
                 Data to update the station on
         """
         if 'device' in kwargs:
-            assert (isinstance(kwargs['device'], Device) or kwargs['device'] is None)
+            assert (isinstance(kwargs['device'], (Device, RemoteDevice)) or kwargs['device'] is None)
             self.device = kwargs['device']
         if 'customerName' in kwargs:
             assert isinstance(kwargs['customerName'], str)
             self._customerName = kwargs['customerName']
         if 'is_activated' in kwargs:
             assert isinstance(kwargs['is_activated'], bool)
-            self._is_activated = kwargs['is_activated']
+            self.core.is_activated = kwargs['is_activated']
         if 'sessions' in kwargs:
             assert isinstance(kwargs['sessions'], list)
             self.sessions = kwargs['sessions'].copy()
+        if 'recurrences' in kwargs:
+            assert isinstance(kwargs['recurrences'], RecurrenceSchedule)
+            self.core.recurrences = kwargs['recurrences']
         self.refresh()
 
     def extract_data(self) -> dict:
@@ -216,6 +182,7 @@ class Station:
             'customerName': self.customerName,
             'is_activated': self.is_activated,
             'sessions': self.sessions,
+            'recurrences': self.core.recurrences,
         }
         return data
 
@@ -236,6 +203,19 @@ class Station:
         """Hide the station"""
         self.windows['main'].findChild(QWidget, f"frame_station_{self.stationID}").setHidden(True)
 
+    def release(self):
+        """Stop the station and delete its widgets
+        (The station can not be used afterwards)
+        """
+        self.reset(hide=True)
+        self.timer.stop()
+        self.sessionTracker.release()
+        self._remove_metrics()
+        station_frame = self.windows['main'].findChild(QWidget, f"frame_station_{self.stationID}")
+        # Take the widget out of the window at once, so a new station can reuse the stationID
+        station_frame.setParent(None)
+        station_frame.deleteLater()
+
     def reset(self, hide: bool = False):
         """Reset the data of this station
 
@@ -250,18 +230,20 @@ class Station:
             'customerName': self.DEFAULT_CUSTOMERNAME,
             'is_activated': self.DEFAULT_ACTIVATION,
             'sessions': self.DEFAULT_SESSIONS,
+            'recurrences': RecurrenceSchedule(),
         })
 
     # -Session methods-
     def add_session(self, customerName: str, start_date: Union[dt.datetime, None], duration: dt.time, sessionID: Union[int, None] = None) -> bool:
         """
-        Add a new session
+        Add a new session, the user is asked before
+        overlapping sessions are deleted
 
         Paramaters:
             customerName(str):
                 Name of customer for this session
             start_date(dt.datetime or None):
-                If None, the end_date of the last queue item will be taken
+                If None, the next free start from now on will be taken
             duration(dt.time):
                 Time length of the session
             sessionID(int or None):
@@ -270,67 +252,208 @@ class Station:
         Returns(bool):
             Succesfully added session
         """
-        # -Determine session paramaters-
-        if start_date is None:
-            if self.sessions:
-                start_date = self.sessions[-1].end_date
-            else:
-                start_date = dt.datetime.now()
-        new_session = Session(customerName=customerName,
-                              start_date=start_date,
-                              duration=duration,
-                              sessionID=sessionID)
-
-        # -Check for conflicting sessions-
-        conflicting_sessions = []
-        for queued_session in self.sessions:
-            if new_session.range_conflicts(queued_session.start_date, queued_session.end_date):
-                # Ranges conflict
-                if queued_session.sessionID == new_session.sessionID:
-                    # Ignore the session as it is the one being replaced
-                    continue
-                conflicting_sessions.append(queued_session)
-        # Ask for confirmation on deletion of overlapping sessions
+        try:
+            success = self.core.add_session(customerName=customerName,
+                                            start_date=start_date,
+                                            duration=duration,
+                                            sessionID=sessionID,
+                                            confirm=self._confirm_conflicts)
+        except ApiError as e:
+            self._show_daemon_error(e)
+            return False
+        if success:
+            self.refresh()
+        return success
+
+    def _show_daemon_error(self, error: ApiError):
+        """
+        Inform about a change the station daemon did not make
+        (The station shows the last state read of the daemon)
+        """
+        diagnostics.log(f'Station {self.stationID}: change not made by the daemon: {error}')
+        self.refresh()
+        msg = QMessageBox()
+        msg.setWindowTitle("Station Daemon")
+        msg.setIcon(QMessageBox.Warning)
+        if error.status == 503:
+            msg.setText("The station daemon is not reachable!\nYour change was not made.")
+        else:
+            msg.setText(f"The station daemon did not make your change:\n{error.message}")
+        msg.setDetailedText(str(error))
+        msg.setStandardButtons(QMessageBox.Ok)
+        msg.setWindowFlag(Qt.WindowStaysOnTopHint)
+        msg.exec_()
+
+    def _confirm_conflicts(self, new_session: Session, conflicting_sessions: List[Session]) -> bool:
+        """
+        Ask for confirmation on deletion of overlapping sessions
+
+        Returns(bool):
+            User confirmed the deletion
+        """
+        # Create messagebox
+        msg = QMessageBox()
+        msg.setWindowTitle("Conflicting Sessions")
+        msg.setIcon(QMessageBox.Warning)
+        msg.setText(f"Your session is conflicting with {len(conflicting_sessions)} already registered session(s).\nDo you wish to delete the overlapping sessions?")  # nopep8
+        detailedText = f"Your sessions start: {new_session.start_date.strftime('%H:%M')}\nYour sessions end: {new_session.end_date.strftime('%H:%M')}"
+        detailedText += '\n\nConflicting session(s):\n\n'
+        for conflicting_session in conflicting_sessions:
+            detailedText += f"{conflicting_session.customerName}´s session start: {conflicting_session.start_date.strftime('%H:%M')}"
+            detailedText += f"\n{conflicting_session.customerName}´s session end: {conflicting_session.end_date.strftime('%H:%M')}"
+            detailedText += '\n\n'
+        msg.setDetailedText(detailedText)
+        msg.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
+        msg.setWindowFlag(Qt.WindowStaysOnTopHint)
+        val = msg.exec_()
+        # User pressed continue
+        return val == QMessageBox.Yes
+
+    def _confirm_recurrence(self, first_session: Session, conflicting_sessions: List[Session],
+                            skipped_sessions: List[Session]) -> bool:
+        """
+        Ask for confirmation on deletion of sessions overlapping the first occurrence
+        and on skipping the upcoming occurrences overlapping queued sessions
+
+        Returns(bool):
+            User confirmed
+        """
+        # Create messagebox
+        msg = QMessageBox()
+        msg.setWindowTitle("Conflicting Sessions")
+        msg.setIcon(QMessageBox.Warning)
+        text = ''
         if conflicting_sessions:
-            # Create messagebox
-            msg = QMessageBox()
-            msg.setWindowTitle("Conflicting Sessions")
-            msg.setIcon(QMessageBox.Warning)
-            msg.setText(f"Your session is conflicting with {len(conflicting_sessions)} already registered session(s).\nDo you wish to delete the overlapping sessions?")  # nopep8
-            detailedText = f"Your sessions start: {new_session.start_date.strftime('%H:%M')}\nYour sessions end: {new_session.end_date.strftime('%H:%M')}"
-            detailedText += '\n\nConflicting session(s):\n\n'
-            for conflicting_data in conflicting_sessions:
-                conflicting_session = conflicting_data
+            text += f"Your first session is conflicting with {len(conflicting_sessions)} already registered session(s), they will be deleted.\n"  # nopep8
+        if skipped_sessions:
+            text += f"{len(skipped_sessions)} upcoming session(s) overlap already registered sessions and will be skipped.\n"  # nopep8
+        msg.setText(text + "Do you wish to continue?")
+        detailedText = f"Your sessions start: {first_session.start_date.strftime('%d.%m.%Y %H:%M')}\nYour sessions end: {first_session.end_date.strftime('%H:%M')}"
+        if conflicting_sessions:
+            detailedText += '\n\nDeleted session(s):\n\n'
+            for conflicting_session in conflicting_sessions:
                 detailedText += f"{conflicting_session.customerName}´s session start: {conflicting_session.start_date.strftime('%H:%M')}"
                 detailedText += f"\n{conflicting_session.customerName}´s session end: {conflicting_session.end_date.strftime('%H:%M')}"
                 detailedText += '\n\n'
-            msg.setDetailedText(detailedText)
-            msg.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
-            msg.setWindowFlag(Qt.WindowStaysOnTopHint)
-            val = msg.exec_()
+        if skipped_sessions:
+            detailedText += '\n\nSkipped session(s):\n\n'
+            for skipped_session in skipped_sessions:
+                detailedText += f"{skipped_session.start_date.strftime('%d.%m.%Y %H:%M')} - {skipped_session.end_date.strftime('%H:%M')}"
+                detailedText += '\n'
+        msg.setDetailedText(detailedText)
+        msg.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
+        msg.setWindowFlag(Qt.WindowStaysOnTopHint)
+        val = msg.exec_()
+        # User pressed continue
+        return val == QMessageBox.Yes
+
+    def add_recurring_session(self, customerName: str, start_date: Union[dt.datetime, None], duration: dt.time,
+                              rrule: str) -> bool:
+        """
+        Add a recurring session, the user is asked before sessions
+        overlapping its first occurrence are deleted and before
+        upcoming occurrences overlapping queued sessions are skipped
 
-            # User pressed continue
-            if val == QMessageBox.Yes:
-                # Remove all conflicting sessions
-                for conflicting_session in conflicting_sessions:
-                    self.delete_session(session=conflicting_session,
-                                        track=None)
-                # Add the session again
-                session_data = new_session.extract_data()
-                del session_data['sessionID']
-                return self.add_session(**session_data)
-            else:
-                # User pressed cancel -> unsuccessful
-                return False
-
-        if sessionID is not None:
-            # Delete old session
-            self.delete_session(session=sessionID,
-                                track=False)
-        self.sessions.append(new_session)
+        Paramaters:
+            customerName(str):
+                Name of customer for this session
+            start_date(dt.datetime or None):
+                Start of the first occurrence, if None the next free start from now on will be taken
+            duration(dt.time):
+                Time length of every occurrence
+            rrule(str):
+                Recurrence of the session, e.g. 'FREQ=WEEKLY;INTERVAL=1'
+        Returns(bool):
+            Succesfully added session
+        """
+        if start_date is None:
+            start_date = self.core.next_free_start(duration=duration)
+        rule = RecurrenceRule.from_rrule(rrule,
+                                         customerName=customerName,
+                                         start_date=start_date,
+                                         duration=duration)
+        conflicting_sessions, skipped_sessions = self.core.recurrence_conflicts(rule)
+        try:
+            if conflicting_sessions or skipped_sessions:
+                if not self._confirm_recurrence(rule.create_session(rule.start), conflicting_sessions,
+                                                skipped_sessions):
+                    return False
+            if conflicting_sessions:
+                self.core.delete_sessions(conflicting_sessions, track=None)
+                self.core.recurrences.cancel(conflicting_sessions)
+            self.core.add_recurrence(rule)
+        except ApiError as e:
+            self._show_daemon_error(e)
+            return False
         self.refresh()
         return True
 
+    def add_sessions(self, sessions: List[Session], skipped_rows: Sequence[str] = ()) -> List[Session]:
+        """
+        Add many sessions at once, the user confirms a single
+        summary before anything is changed
+
+        Paramaters:
+            sessions(list):
+                Sessions to add
+            skipped_rows(list):
+                Descriptions of the rows of the import that could not be read
+        Returns(list):
+            Added sessions
+        """
+        def confirm(new_sessions: List[Session], conflicting_sessions: List[Session],
+                    rejected_sessions: List[Session]) -> bool:
+            return self._confirm_import(new_sessions, conflicting_sessions, rejected_sessions, skipped_rows)
+
+        try:
+            added_sessions, _ = self.core.add_sessions(sessions, confirm=confirm)
+        except ApiError as e:
+            self._show_daemon_error(e)
+            return []
+        if added_sessions:
+            self.refresh()
+        return added_sessions
+
+    def _confirm_import(self, new_sessions: List[Session], conflicting_sessions: List[Session],
+                        rejected_sessions: List[Session], skipped_rows: Sequence[str]) -> bool:
+        """
+        Ask for confirmation of an import
+
+        Returns(bool):
+            User confirmed the import
+        """
+        def session_text(session: Session) -> str:
+            return f"{session.customerName}: {session.start_date.strftime('%d.%m.%Y %H:%M')} - {session.end_date.strftime('%H:%M')}"  # nopep8
+
+        msg = QMessageBox()
+        msg.setWindowTitle("Import Sessions")
+        text = f"{len(new_sessions)} session(s) will be added to the queue."
+        if conflicting_sessions:
+            text += f"\n{len(conflicting_sessions)} queued session(s) overlap them and will be deleted."
+        if rejected_sessions or skipped_rows:
+            text += f"\n{len(rejected_sessions) + len(skipped_rows)} session(s) of the file are skipped."
+        msg.setIcon(QMessageBox.Warning if conflicting_sessions else QMessageBox.Question)
+        details = []
+        if conflicting_sessions:
+            details.append('Deleted queued session(s):\n' + '\n'.join(map(session_text, conflicting_sessions)))
+        if rejected_sessions:
+            details.append('Skipped, already over or overlapping another imported session:\n' +
+                           '\n'.join(map(session_text, rejected_sessions)))
+        if skipped_rows:
+            details.append('Skipped, invalid:\n' + '\n'.join(skipped_rows))
+        if details:
+            msg.setDetailedText('\n\n'.join(details))
+        msg.setWindowFlag(Qt.WindowStaysOnTopHint)
+        if not new_sessions:
+            # Nothing to add -> only inform
+            msg.setText(text)
+            msg.setStandardButtons(QMessageBox.Ok)
+            msg.exec_()
+            return False
+        msg.setText(text + "\nDo you wish to proceed?")
+        msg.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
+        return msg.exec_() == QMessageBox.Yes
+
     def delete_session(self, session: Union[int, Session] = None, track: Union[bool, None] = None):
         """
         Delete the session
@@ -344,22 +467,11 @@ class Station:
                 If track is None, the session is only tracked if its range is in the current date.
                 If that condition is true, the session is tracked up until the current date
         """
-        deleted_session: Session
-        if isinstance(session, int):
-            deleted_session = self._find_session(session)
-        elif isinstance(session, Session):
-            deleted_session = session
-
-        if track is None:
-            datetime_now = dt.datetime.now()
-            if deleted_session.range_contains(datetime_now):
-                deleted_session.end_date = datetime_now
-                track = True
-            else:
-                track = False
-        if track:
-            self.sessionTracker.add_session_to_history(deleted_session)
-        self.sessions.remove(deleted_session)
+        try:
+            self.core.delete_session(session=session,
+                                     track=track)
+        except ApiError as e:
+            self._show_daemon_error(e)
 
     def replace_session(self, sessionID: int, new_customerName: str = None, new_start_date: dt.datetime = None,
                         new_end_date: dt.datetime = None, new_duration: dt.time = None):
@@ -379,17 +491,28 @@ class Station:
             new_duration(dt.time):
                 New duration (end date will change)
         """
-        session = self._find_session(sessionID).copy()
-        if new_customerName is not None:
-            session.customerName = new_customerName
-        if new_start_date is not None:
-            session.start_date = new_start_date
-        if new_end_date is not None:
-            session.end_date = new_end_date
-        if new_duration is not None:
-            session.duration = new_duration
-
-        self.add_session(**session.extract_data())
+        try:
+            success = self.core.replace_session(sessionID,
+                                                new_customerName=new_customerName,
+                                                new_start_date=new_start_date,
+                                                new_end_date=new_end_date,
+                                                new_duration=new_duration,
+                                                confirm=self._confirm_conflicts)
+        except InvalidSessionError:
+            # Invalid new end_date
+            msg = QMessageBox()
+            msg.setWindowTitle("Invalid Input")
+            msg.setIcon(QMessageBox.Icon.Information)
+            msg.setText("Please set a valid end time!\nYour end time is before your start time.")  # nopep8
+            msg.setStandardButtons(QMessageBox.Ok)
+            msg.setWindowFlags(Qt.WindowStaysOnTopHint)
+            msg.exec_()
+            return
+        except ApiError as e:
+            self._show_daemon_error(e)
+            return
+        if success:
+            self.refresh()
 
     def running_session(self) -> bool:
         """
@@ -398,41 +521,29 @@ class Station:
 
             Currently running a session
         """
-        if (not self.sessions or
-                not self.is_activated):
-            return False
-        # Sort session by start date
-        self.sessions = sorted(self.sessions, key=lambda s: s.start_date)
-        first_session = self.sessions[0]
-
-        datetime_now = dt.datetime.now()
-        # Current time inside the sessions range
-        return first_session.range_contains(datetime_now)
+        return self.core.running_session() is not None
 
     def _update_sessions(self):
         """
         Update the session queue
         """
-        datetime_now = dt.datetime.now()
-        # Sort session by start date
-        self.sessions = sorted(self.sessions, key=lambda s: s.start_date)
-        # Clear out expired sessions (already past sessions; includes the most recent active session)
-        for queue_session in self.sessions:
-            if queue_session.end_date <= datetime_now:
-                # Session is done
-                self.delete_session(session=queue_session,
-                                    track=True)
+        datetime_now = self.clock.now()
+        running_session = self.core.update_sessions(now=datetime_now)
 
         # -Determine Text shown and states-
-        if not self.running_session():
+        if running_session is None:
             # No session running
             self.customerName = self.DEFAULT_CUSTOMERNAME
             # Check for an upcoming session
-            if self.sessions:
-                upcoming_session = self.sessions[0]
-                if upcoming_session.start_date > datetime_now:
-                    customerName = f"{upcoming_session.customerName}"
-                    self.customerName = customerName + f" <span style=\" font-size:8pt; font-style:italic; color:#333;\" >starts at {upcoming_session.start_date.strftime('%H:%M')}</span>"  # nopep8
+            upcoming_session = self.core.upcoming_session(now=datetime_now)
+            if upcoming_session is not None:
+                customerName = f"{upcoming_session.customerName}"
+                if upcoming_session.start_date.date() == datetime_now.date():
+                    starts = f"starts at {upcoming_session.start_date.strftime('%H:%M')}"
+                else:
+                    # Booked for a later day
+                    starts = f"starts on {upcoming_session.start_date.strftime('%d.%m. %H:%M')}"
+                self.customerName = customerName + f" <span style=\" font-size:8pt; font-style:italic; color:#333;\" >{starts}</span>"  # nopep8
             if self.is_activated:
                 # Station is activated
                 if self.device is not None:
@@ -440,28 +551,11 @@ class Station:
                     self.device.turn_off()
         else:
             # Session running
-            self.customerName = self.sessions[0].customerName
+            self.customerName = running_session.customerName
             if self.device is not None:
                 # Device is registered
                 self.device.turn_on()
 
-    def _find_session(self, sessionID: int) -> Session:
-        """
-        Find a session by its id
-
-        Paramaters:
-            sessionID(int):
-                ID of the session to delete
-
-        Returns(Session):
-            Session instance with that id
-        """
-        for session in self.sessions:
-            if session.sessionID == sessionID:
-                return session
-        else:
-            raise KeyError('No session found with id', sessionID)
-
     # -Button clicks-
     def clicked_onOff(self):
         """
@@ -480,34 +574,29 @@ class Station:
                 if val != QMessageBox.Yes:  # Not Continue
                     return
 
-            for session in self.sessions:
-                self.delete_session(session=session,
-                                    track=None)
-            self.is_activated = False
-        else:
-            self.is_activated = True
+        try:
+            if self.is_activated:
+                self.core.deactivate()
+                self.is_activated = False
+            else:
+                self.is_activated = True
+        except ApiError as e:
+            self._show_daemon_error(e)
 
     def clicked_newSession(self):
         """
         Open the session window
         """
         # -Window Setup-
-        if self.sessions:
-            time = self.sessions[-1].end_date
-        else:
-            time = dt.datetime.now()
-        time = self.ceil_dt(time,
+        # End of the sessions running from now on (not of the whole queue, it
+        # holds the recurring sessions of the next week)
+        time = self.ceil_dt(self.core.next_free_start(),
                             dt.timedelta(minutes=30))
 
-        # Time is over the current day
-        if time.day > dt.date.today().day:
-            time = dt.time(23, 59)
-        else:
-            time = time.time()
-
         # Reset variable
         self.windows['session'].lineEdit_customerName.setText('')
-        self.windows['session'].timeEdit_startAt.setTime(time)
+        self.windows['session'].dateTimeEdit_startAt.setDateTime(time)
+        self.windows['session'].comboBox_repeat.setCurrentIndex(0)
         # Set dynamic properties
         self.windows['session'].setProperty('stationID', self.stationID)
         # Reshow window
@@ -522,9 +611,10 @@ class Station:
         Open the edit sessions window
         """
         # -Window Setup-
-        # Reset variable
         # Set stationID
         self.windows['edit'].setProperty('stationID', self.stationID)
+        # Reset variable
+        self.windows['edit'].dateEdit_day.setDate(self.clock.today())
         # Reshow window
         self.windows['edit'].setWindowFlag(Qt.WindowStaysOnTopHint)
         self.windows['edit'].show()
@@ -543,26 +633,50 @@ class Station:
         assert self.windows['edit'].property('stationID') == self.stationID, "stationID in edit window does not equal stationID deletion is being performed on"  # nopep8
 
         # Get selection
-        widget = self.windows['edit'].tableWidget_queue
-        selection = widget.selectionModel().selectedRows()
+        tableView = self.windows['edit'].tableView_queue
+        model = tableView.model()
+        selection = {model.sessionID(index.row()) for index in tableView.selectionModel().selectedRows()}
         # Perform deletion
-        datetime_now = dt.datetime.now()
-        for item in selection:
-            session = self._find_session(self.rowTranslator[item.row()])
-            if session.range_contains(datetime_now):
-                # Current time inside the sessions range
-                msg = QMessageBox()
-                msg.setWindowTitle('Confirmation')
-                msg.setIcon(QMessageBox.Icon.Information)
-                msg.setText('You are deleting a session that is currently active. Do you wish to proceed?')
-                msg.setStandardButtons(QMessageBox.Yes | QMessageBox.Cancel)
-                msg.setWindowFlag(Qt.WindowStaysOnTopHint)
-                val = msg.exec_()
-                if val == QMessageBox.Cancel:
-                    # Skip this session deletion
-                    continue
-            self.delete_session(session=session,
-                                track=None)
+        datetime_now = self.clock.now()
+        # Sessions that ended since the selection are skipped
+        sessions = [session for session in self.sessions if session.sessionID in selection]
+        active_sessions = [session for session in sessions if session.range_contains(datetime_now)]
+        if active_sessions:
+            # Current time inside the range of a selected session
+            msg = QMessageBox()
+            msg.setWindowTitle('Confirmation')
+            msg.setIcon(QMessageBox.Icon.Information)
+            msg.setText('You are deleting a session that is currently active. Do you wish to proceed?')
+            msg.setStandardButtons(QMessageBox.Yes | QMessageBox.Cancel)
+            msg.setWindowFlag(Qt.WindowStaysOnTopHint)
+            val = msg.exec_()
+            if val == QMessageBox.Cancel:
+                # Skip the deletion of the active session
+                sessions = [session for session in sessions if session not in active_sessions]
+        rules = {rule for rule in map(self.core.recurrences.rule_of, sessions) if rule is not None}
+        remove_rules = False
+        if rules:
+            # Occurrences of recurring sessions selected
+            msg = QMessageBox()
+            msg.setWindowTitle('Recurring Sessions')
+            msg.setIcon(QMessageBox.Question)
+            msg.setText(f"{len(rules)} recurring session(s) selected.\nDo you wish to delete all of their upcoming sessions?\nOtherwise only the selected sessions are deleted.")  # nopep8
+            msg.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
+            msg.setWindowFlag(Qt.WindowStaysOnTopHint)
+            remove_rules = msg.exec_() == QMessageBox.Yes
+        try:
+            if remove_rules:
+                for rule in rules:
+                    self.core.remove_recurrence(rule)
+            elif rules:
+                self.core.recurrences.cancel(sessions)
+            queued_sessionIDs = {session.sessionID for session in self.sessions}
+            self.core.delete_sessions([session for session in sessions if session.sessionID in queued_sessionIDs],
+                                      track=None,
+                                      now=datetime_now)
+        except ApiError as e:
+            self._show_daemon_error(e)
+            return
         self.refresh()
 
     @staticmethod
@@ -574,60 +688,62 @@ class Station:
 
     def _editWindow_refresh(self):
         """
-        Check if the table in the edit window needs an update
-        Is being checked as a refill of the table results in an
-        unselection
+        Update the table in the edit window if it shows
+        this station
         """
-        if self.windows['edit'].property('stationID') == self.stationID:
-            if self.sessions != self._editWindow_shownSessions:
-                self._editWindow_updateTable()
+        if (self.windows.is_loaded('edit') and
+                self.windows['edit'].isVisible() and
+                self.windows['edit'].property('stationID') == self.stationID):
+            self._editWindow_updateTable()
+
+    def _update_metrics(self):
+        """
+        Update the station gauges of the metrics endpoint
+        """
+        if not metrics.enabled:
+            return
+        labels = {'station': self.stationID,
+                  'device': self.device.deviceName if self.device is not None else ''}
+        if labels != self._metricLabels:
+            # Device changed
+            self._remove_metrics()
+            self._metricLabels = labels
+        metrics.set('gsm_station_queued_sessions', len(self.sessions), **labels)
+        metrics.set('gsm_station_session_running', int(self.running_session()), **labels)
+        metrics.set('gsm_station_activated', int(self.is_activated), **labels)
+
+    def _remove_metrics(self):
+        """
+        Remove the station gauges from the metrics endpoint
+        """
+        if self._metricLabels is None:
+            return
+        for name in ('gsm_station_queued_sessions', 'gsm_station_session_running', 'gsm_station_activated'):
+            metrics.remove(name, **self._metricLabels)
+        self._metricLabels = None
 
     def _editWindow_updateTable(self):
         """
-        Fill the table in the edit sessions window
+        Apply the session queue to the table in the edit sessions window
+        Only changed rows are touched, so the selection is kept
         """
-        headers = ['Customer Name', 'Start Time', 'End Time', 'Total Time']
-        headerTranslator = {
-            'Customer Name': 'customerName',
-            'Start Time': 'start_date',
-            'End Time': 'end_date',
-            'Total Time': 'duration',
-        }
-        self.rowTranslator = {}
-
-        tableWidget = self.windows['edit'].tableWidget_queue
-        tableWidget.setRowCount(0)
-        # Base widget settings
-        tableWidget.setRowCount(len(self.sessions))
-        tableWidget.setColumnCount(len(headers))
-        tableWidget.setHorizontalHeaderLabels(headers)
-        # -Set column widths-
-        tableWidget.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
-        column_width = max(tableWidget.columnWidth(1), tableWidget.columnWidth(2), tableWidget.columnWidth(3))
-        tableWidget.horizontalHeader().setSectionResizeMode(QHeaderView.Fixed)
-        tableWidget.setColumnWidth(1, column_width)
-        tableWidget.setColumnWidth(2, column_width)
-        tableWidget.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
-        # -Fill table-
-        for row in range(tableWidget.rowCount()):
-            self.rowTranslator[row] = self.sessions[row].sessionID
-            datas = self.sessions[row].extract_data()
-            datas['end_date'] = self.sessions[row].end_date
-            for col, header_key in enumerate(headers):
-                data = datas[headerTranslator[header_key]]
-                if type(data) in (dt, dt.date, dt.datetime, dt.time):
-                    data = data.strftime('%H:%M')
-                item = QTableWidgetItem(str(data))
-                item.setTextAlignment(Qt.AlignCenter)
-
-                tableWidget.setItem(row, col, item)
-        tableWidget.setItemDelegate(QWidgetDelegate(self.windows['edit'], station=self))
-        self._editWindow_shownSessions = self.sessions.copy()
+        model = self.windows['edit'].tableView_queue.model()
+        if model.station is not self:
+            # Table shows another station
+            model.set_station(self)
+        # Only the sessions of the selected day are shown
+        day = self.windows['edit'].dateEdit_day.date().toPython()
+        with diagnostics.measure(QUEUE_TABLE_FILL):
+            model.update_sessions(self.core.sessions_on(day))
 
     def _update_texts(self):
         """
         Update the text elements of the station
         """
+        if not is_page_visible(self.windows['main'], const.STATIONS_PAGE):
+            # Not rendered, caught up once the page is shown
+            return
+
         def strfdelta(tdelta, fmt):
             """
             Stringify timedelta
@@ -651,7 +767,7 @@ class Station:
             time_left = ''
         else:
             # Stringify the time formats
-            datetime_now = dt.datetime.now()
+            datetime_now = self.clock.now()
             start_date = self.sessions[0].start_date.strftime('%H:%M')
             end_date = self.sessions[0].end_date.strftime('%H:%M')
             time_left = strfdelta(self.sessions[0].end_date - datetime_now, '%H:%M')
@@ -684,6 +800,9 @@ class Station:
         """
         Update the indicator colors of the station
         """
+        if not is_page_visible(self.windows['main'], const.STATIONS_PAGE):
+            # Not rendered, caught up once the page is shown
+            return
         if self.running_session():
             frame_labels_color = const.NOT_AVAILABLE_COLOR
         elif self.is_activated:
@@ -705,18 +824,36 @@ class SessionTracker:
     Paramaters:
         station(Station):
             Station to track the times on
+        historyIndex(SessionHistoryIndex):
+            Search index the tracked sessions are added to
+        customerIndex(CustomerNameIndex):
+            Customer names the tracked sessions are added to
     """
 
-    def __init__(self, station: Station, tracked_sessions: List[Session] = []):
+    def __init__(self, station: Station, historyIndex: SessionHistoryIndex, customerIndex: CustomerNameIndex):
         self.station = station
         self.windows = self.station.windows
         self.stationID = self.station.stationID
-        self.tracked_sessions = tracked_sessions
+        self.history: SessionHistory = self.station.core.history
+        self.history.listeners.append(self._history_added)
+        self.historyIndex = historyIndex
+        self.customerIndex = customerIndex
+        # Helper Variables
+        self._indexed_deviceID: Union[str, None] = None
+        self._index_outdated = True
         # -Setup-
         self._initialize_timers()
         self._initialize_binds()
         self.refresh()
 
+    @property
+    def tracked_sessions(self) -> List[Session]:
+        return self.history.tracked_sessions
+
+    @tracked_sessions.setter
+    def tracked_sessions(self, value: List[Session]):
+        self.history.tracked_sessions = value
+
     # -Initialize methods-
     def _initialize_timers(self):
         """
@@ -725,7 +862,7 @@ class SessionTracker:
         # Refresh timer
         self.timer = QTimer()
         self.timer.timeout.connect(self.refresh)
-        self.timer.start(2500)
+        self.timer.start(self.station.clock.interval(2500))
 
     def _initialize_binds(self):
         """
@@ -740,23 +877,32 @@ class SessionTracker:
             - Update visibility
             - Update texts
             - Update table
-        """
-        self.tracked_sessions = sorted(self.tracked_sessions, key=lambda s: s.start_date)
-        self._update_visibility()
-        self._update_texts(sessions=self.tracked_sessions)
-        if self.windows['history'].property('stationID') == self.stationID:
-            self._historyWindow_updateTable(sessions=self.tracked_sessions)
+        The widgets are only updated while they are visible
+        """
+        self.history.sort()
+        self._update_index()
+        if is_page_visible(self.windows['main'], const.STATISTICS_PAGE):
+            self._update_visibility()
+            self._update_texts(sessions=self.tracked_sessions)
+        if (self.windows.is_loaded('history') and
+                self.windows['history'].isVisible() and
+                self.windows['history'].property('stationID') == self.stationID):
+            self._historyWindow_updateTable()
 
     def update(self, tracked_sessions: list, override: bool):
         """Update the data of this sessionTracker"""
-        new_tracked_sessions = tracked_sessions
-        if not override:
-            # Do not override existing data
-            new_tracked_sessions.append(self.tracked_sessions)
-
-        self.tracked_sessions = new_tracked_sessions
+        self.history.update(tracked_sessions, override=override)
+        self._index_outdated = True
         self.refresh()
 
+    def release(self):
+        """Stop the tracker and delete its widgets"""
+        self.timer.stop()
+        self._indexed_deviceID = None
+        statistic_frame = self.windows['main'].findChild(QWidget, f"frame_statistics_{self.stationID}")
+        statistic_frame.setParent(None)
+        statistic_frame.deleteLater()
+
     def extract_data(self) -> Union[dict, None]:
         """
         Extract the data of this tracker
@@ -779,63 +925,49 @@ class SessionTracker:
         """
         Add a session to the session history of this station
         """
-        # Search for conflicting sessions
-        for tracked_session in self.tracked_sessions:
-            if tracked_session.range_conflicts(start_date=session.start_date,
-                                               end_date=session.end_date):
-                # Two tracked sessions might conflict if the user
-                # finished one session and then set up a session that
-                # happened during that previous sessions time range
-                # Action: Override old session
-                self.tracked_sessions.remove(tracked_session)
-        self.tracked_sessions.append(session)
+        self.history.add(session)
+
+    def _history_added(self, session: Session, removed_sessions: List[Session]):
+        """
+        Update the indexes after a session was added to the history
+        """
+        for removed_session in removed_sessions:
+            self.customerIndex.remove(removed_session.customerName)
+            if self._indexed_deviceID is not None:
+                self.historyIndex.remove(self._indexed_deviceID, removed_session)
+        self.customerIndex.add(session.customerName)
+        if self._indexed_deviceID is not None:
+            self.historyIndex.add(self._indexed_deviceID, session)
+            # Only the revenue of the days of these sessions changed
+            revenue.invalidate(self._indexed_deviceID, [session] + removed_sessions)
+            occupancy.invalidate_device(self._indexed_deviceID)
         self.refresh()
 
+    def _update_index(self):
+        """
+        Reindex the tracked sessions if the device of the
+        station or the tracked sessions were replaced
+        """
+        deviceID = self.station.device.deviceID if self.station.device is not None else None
+        if deviceID is not None:
+            # Device name might have been changed
+            self.historyIndex.deviceNames[deviceID] = self.station.device.deviceName
+        if deviceID == self._indexed_deviceID and not self._index_outdated:
+            return
+        # The previous device stays indexed, it either moved to another station
+        # or went away (its entries are then removed by the window manager)
+        if deviceID is not None:
+            self.historyIndex.set_sessions(deviceID, self.tracked_sessions)
+            revenue.invalidate_device(deviceID)
+            occupancy.invalidate_device(deviceID)
+        self._indexed_deviceID = deviceID
+        self._index_outdated = False
+
     def calculate_stats(self, sessions: list) -> dict:
         """
         Return the stats displayed on the application
         """
-        if not len(sessions):
-            # No tracked sessions
-            session_history = {
-                'total_time': dt.time(hour=0, minute=0),
-                'average_time': dt.time(hour=0, minute=0),
-                'total_sessions': 0,
-                'average_sessions': 0,
-            }
-            return session_history
-        session_history = {}
-        total_minutes = 0
-
-        # -Total time-
-        for session in sessions:
-            total_minutes += session.duration.hour * 60
-            total_minutes += session.duration.minute
-
-        hours, minutes = divmod(total_minutes, 60)
-        session_history['total_time'] = dt.time(hour=hours,
-                                                minute=minutes)
-        # -Average session time-
-        average_minutes = int(total_minutes / len(sessions))
-        hours, minutes = divmod(average_minutes, 60)
-        session_history['average_time'] = dt.time(hour=hours,
-                                                  minute=minutes)
-        # -Total sessions-
-        session_history['total_sessions'] = len(sessions)
-        # -Average sessions/day-
-        dates = []
-        for session in sessions:
-            start_date = session.start_date.date()
-            if start_date in dates:
-                continue
-            else:
-                dates.append(start_date)
-        average_sessions = round(len(sessions) / len(dates), 1)
-        if average_sessions.is_integer():
-            average_sessions = int(average_sessions)
-        session_history['average_sessions'] = average_sessions
-
-        return session_history
+        return SessionHistory.calculate_stats(sessions)
 
     # -Button clicks-
     def clicked_showSessions(self):
@@ -843,12 +975,8 @@ class SessionTracker:
         Show a table of the sessions history
         """
         # -Window Setup-
-        # Set variable
-        if self.station.device is not None:
-            # Device is registered
-            self.windows['history'].label.setText(f'{self.station.device.deviceName} Session History')
-        else:
-            self.windows['history'].label.setText(f'N/A Session History')
+        # Reset variable
+        self.windows['history'].lineEdit_search.setText('')
         # Set stationID
         self.windows['history'].setProperty('stationID', self.stationID)
         # Reshow window
@@ -861,47 +989,36 @@ class SessionTracker:
 
         self.refresh()
 
-    def _historyWindow_updateTable(self, sessions: list):
+    def _historyWindow_updateTable(self):
         """
         Update the history table
-        """
-        headers = ['Date', 'Customer Name', 'Start Time', 'End Time']
-        headerTranslator = {
-            'Date': 'date',
-            'Customer Name': 'customerName',
-            'Start Time': 'start_date',
-            'End Time': 'end_date',
-            'Total Time': 'duration',
-        }
-        tableWidget = self.windows['history'].tableWidget_history
-        tableWidget.setRowCount(0)
-        # Base widget settings
-        tableWidget.setRowCount(len(sessions))
-        tableWidget.setColumnCount(len(headers))
-        tableWidget.setHorizontalHeaderLabels(headers)
-        # -Set column widths-
-        column_width = 90
-        tableWidget.horizontalHeader().setSectionResizeMode(QHeaderView.Fixed)
-        tableWidget.setColumnWidth(0, column_width + 20)
-        tableWidget.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
-        tableWidget.setColumnWidth(2, column_width)
-        tableWidget.setColumnWidth(3, column_width)
+        Without a search text the sessions of this station are shown,
+        otherwise the matching sessions of all devices
+        """
+        text = self.windows['history'].lineEdit_search.text()
+        proxyModel = self.windows['history'].tableView_history.model()
+        query = (self.historyIndex.version, text, self._indexed_deviceID)
+        if proxyModel.query == query:
+            # Table is up to date
+            return
+        # -Update label-
+        if text.strip():
+            self.windows['history'].label.setText('Session History Search')
+        elif self.station.device is not None:
+            # Device is registered
+            self.windows['history'].label.setText(f'{self.station.device.deviceName} Session History')
+        else:
+            self.windows['history'].label.setText(f'N/A Session History')
         # -Fill table-
-        for row in range(tableWidget.rowCount()):
-            session = sessions[row]
-            session_data = session.extract_data()
-            session_data['end_date'] = session.end_date
-            for col, header_key in enumerate(headers):
-                key = headerTranslator[header_key]
-                if key == 'date':
-                    data = session_data['start_date'].strftime(r'%d.%m.%Y')
-                else:
-                    data = session_data[key]
-                    if type(data) in (dt, dt.date, dt.datetime, dt.time):
-                        data = data.strftime('%H:%M')
-                item = QTableWidgetItem(str(data))
-                item.setTextAlignment(Qt.AlignCenter)
-                tableWidget.setItem(row, col, item)
+        if text.strip():
+            entryKeys = self.historyIndex.search(text)
+        elif self._indexed_deviceID is not None:
+            entryKeys = self.historyIndex.search('', deviceID=self._indexed_deviceID)
+        else:
+            entryKeys = []
+        with diagnostics.measure(HISTORY_TABLE_FILL):
+            reset = proxyModel.sourceModel().sync()
+            proxyModel.set_rows(entryKeys, query=query, reset=reset)
 
     def _update_visibility(self):
         """
@@ -922,10 +1039,20 @@ class SessionTracker:
         """
         # -Get Values-
         session_history = self.calculate_stats(sessions)
-        total_time = session_history['total_time'].strftime('%H:%M')
-        average_time = session_history['average_time'].strftime('%H:%M')
+        total_time = format_duration(session_history['total_time'].total_seconds())
+        average_time = format_duration(session_history['average_time'].total_seconds())
         total_sessions = str(session_history['total_sessions'])
         average_sessions = str(session_history['average_sessions'])
+        revenue_label = self.windows['main'].findChild(QLabel, f"label_statistics_revenueValue_{self.stationID}")
+        if self.station.device is not None:
+            amount, tiers = revenue.total(self.station.device.deviceID, sessions)
+            revenue_label.setText(revenue.format_amount(amount))
+            # Split by tier
+            revenue_label.setToolTip('\n'.join(f"{tier.capitalize()}: {format_duration(seconds)} h, {revenue.format_amount(tier_amount)}"  # nopep8
+                                               for tier, (seconds, tier_amount) in sorted(tiers.items())))
+        else:
+            revenue_label.setText(revenue.format_amount(0))
+            revenue_label.setToolTip('')
         # -Update texts-
         self.windows['main'].findChild(QLabel, f"label_statistics_totalTimeValue_{self.stationID}").setText(total_time)
         self.windows['main'].findChild(QLabel, f"label_statistics_avgSessionTimeValue_{self.stationID}").setText(average_time)  # nopep8
@@ -0,0 +1,66 @@
+"""
+Source of the current time used throughout the application
+
+Runs in real time by default, 'Clock.simulate' lets the time
+run from a given start date at a multiple of the real speed
+"""
+import datetime as dt
+import time
+# Code annotation
+from typing import Union
+
+
+class Clock:
+    """
+    Wall clock of the application, replaces direct calls
+    to dt.datetime.now() and dt.date.today()
+    """
+
+    def __init__(self):
+        self.speed = 1.0
+        self._start: Union[dt.datetime, None] = None
+        self._origin = 0.0
+
+    @property
+    def is_simulated(self) -> bool:
+        return self._start is not None
+
+    def simulate(self, start: dt.datetime, speed: float = 1000.0):
+        """
+        Let the clock run from the start date at the given speed
+
+        Paramaters:
+            start(dt.datetime):
+                Date the simulated time starts at
+            speed(float):
+                Simulated seconds passing per real second
+        """
+        assert speed > 0, "speed has to be positive"
+        self.speed = float(speed)
+        self._start = start
+        self._origin = time.perf_counter()
+
+    def reset(self):
+        """Go back to real time"""
+        self.speed = 1.0
+        self._start = None
+
+    def now(self) -> dt.datetime:
+        if self._start is None:
+            return dt.datetime.now()
+        return self._start + dt.timedelta(seconds=(time.perf_counter() - self._origin) * self.speed)
+
+    def today(self) -> dt.date:
+        return self.now().date()
+
+    def interval(self, msec: int) -> int:
+        """
+        Convert a timer interval in clock time to real milliseconds
+
+        Returns(int):
+            Interval to start a QTimer with
+        """
+        return max(1, int(msec / self.speed))
+
+
+clock = Clock()
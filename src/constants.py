@@ -5,3 +5,23 @@ Static values are stored here
 AVAILABLE_COLOR = (119, 245, 112)
 NOT_AVAILABLE_COLOR = (255, 222, 99)
 DEACTIVATED_COLOR = (255, 120, 120)
+# -Main window pages-
+STATIONS_PAGE = 0
+STATISTICS_PAGE = 1
+# -Shutdown-
+SHUTDOWN_TIMEOUT = 3  # Seconds to wait for the plugs to confirm the power off
+# -Devices-
+DEVICE_DISCOVERY_INTERVAL = 5 * 60 * 1000  # Milliseconds between two background searches for plugs
+# -Recurring sessions-
+# RRULE of each entry of the repeat box in the session window (None = once)
+REPEAT_RULES = (
+    None,
+    'FREQ=WEEKLY;INTERVAL=1',
+    'FREQ=WEEKLY;INTERVAL=2',
+    'FREQ=WEEKLY;INTERVAL=1;BYDAY=MO,TU,WE,TH,FR',
+    'FREQ=DAILY;INTERVAL=1',
+)
+# -Occupancy chart-
+# Days shown by each entry of the range box on the statistics page (1 = today)
+OCCUPANCY_RANGES = (1, 7, 30, 365)
+OCCUPANCY_REFRESH_INTERVAL = 10 * 1000  # Milliseconds between two checks of the chart while it is shown
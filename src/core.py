@@ -0,0 +1,1092 @@
+"""
+Qt free core of the station logic:
+session queues, conflict resolution and history tracking
+"""
+# -Root imports-
+from .clock import (Clock, clock as app_clock)
+from .diagnostics import diagnostics
+# -Other-
+from itertools import count
+from bisect import (bisect_left, insort)
+import heapq
+import datetime as dt
+# Code annotation
+from typing import (Callable, Dict, Iterable, List, Set, Tuple, Union, TYPE_CHECKING)
+if TYPE_CHECKING:
+    from .recurrence import RecurrenceRule
+
+
+class InvalidSessionError(ValueError):
+    """Raised for session data that can not be applied"""
+
+
+EPOCH = dt.datetime(1970, 1, 1)
+ONE_SECOND = dt.timedelta(seconds=1)
+DAY = 24 * 60 * 60  # Seconds
+
+
+def to_epoch(date: dt.datetime) -> int:
+    """
+    Return the seconds of the (naive, local) date since the EPOCH
+    """
+    return (date - EPOCH) // ONE_SECOND
+
+
+def from_epoch(seconds: int) -> dt.datetime:
+    """
+    Return the date of the seconds since the EPOCH
+    """
+    return EPOCH + dt.timedelta(seconds=seconds)
+
+
+def to_seconds(duration: Union[dt.time, dt.timedelta, int]) -> int:
+    """
+    Return the duration (time of day, timedelta or seconds) in seconds
+    """
+    if isinstance(duration, dt.timedelta):
+        return duration // ONE_SECOND
+    if isinstance(duration, dt.time):
+        return duration.hour * 3600 + duration.minute * 60 + duration.second
+    return int(duration)
+
+
+def format_duration(seconds: int) -> str:
+    """
+    Return the duration as 'HH:MM', the hours are not limited to a day
+    """
+    hours, minutes = divmod(int(seconds) // 60, 60)
+    return f'{hours:02d}:{minutes:02d}'
+
+
+class Session:
+    """A customer session on a station
+
+    The start (seconds since the EPOCH) and the length (seconds) are
+    integers and the end is cached, the dates are only built for display
+    """
+    __slots__ = ('sessionID', 'customerName', '_start', '_length', '_end')
+    _id_counter = count()
+
+    def __init__(self, customerName: str, start_date: dt.datetime, duration: Union[dt.time, dt.timedelta, int],
+                 sessionID: Union[int, None] = None):
+        if sessionID is None:
+            sessionID = next(self._id_counter)
+        self.sessionID = sessionID
+        self.customerName = customerName
+        self._start = to_epoch(start_date)
+        self._length = to_seconds(duration)
+        self._end = self._start + self._length
+
+    @classmethod
+    def from_epoch(cls, customerName: str, start: int, length: int, sessionID: Union[int, None] = None) -> 'Session':
+        """
+        Create a session from its start (seconds since the EPOCH) and length (seconds)
+        """
+        session = cls.__new__(cls)
+        session.sessionID = next(cls._id_counter) if sessionID is None else sessionID
+        session.customerName = customerName
+        session._start = start
+        session._length = length
+        session._end = start + length
+        return session
+
+    # -Pickling-
+    def __getstate__(self):
+        return (self.sessionID, self.customerName, self._start, self._length)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # Pickled before the integer representation (datetime start, dt.time duration)
+            self.__init__(customerName=state['customerName'],
+                          start_date=state['start_date'],
+                          duration=state['duration'],
+                          sessionID=state['sessionID'])
+            return
+        self.sessionID, self.customerName, self._start, self._length = state
+        self._end = self._start + self._length
+
+    # -Integer representation-
+    @property
+    def start(self) -> int:
+        return self._start
+
+    @start.setter
+    def start(self, value: int):
+        self._start = value
+        self._end = value + self._length
+
+    @property
+    def length(self) -> int:
+        return self._length
+
+    @length.setter
+    def length(self, value: int):
+        if value <= 0:
+            raise InvalidSessionError("End time is before the start time")
+        self._length = value
+        self._end = self._start + value
+
+    @property
+    def end(self) -> int:
+        return self._end
+
+    # -Dates (display)-
+    @property
+    def start_date(self) -> dt.datetime:
+        return from_epoch(self._start)
+
+    @start_date.setter
+    def start_date(self, value: dt.datetime):
+        self.start = to_epoch(value)
+
+    @property
+    def end_date(self) -> dt.datetime:
+        return from_epoch(self._end)
+
+    @end_date.setter
+    def end_date(self, value: dt.datetime):
+        assert isinstance(value, dt.datetime), "end_date has to be dt.datetime"
+        self.length = to_epoch(value) - self._start
+
+    @property
+    def duration(self) -> dt.timedelta:
+        return dt.timedelta(seconds=self._length)
+
+    @duration.setter
+    def duration(self, value: Union[dt.time, dt.timedelta, int]):
+        self.length = to_seconds(value)
+
+    def range_contains(self, datetime: Union[dt.datetime, int]) -> bool:
+        """
+        Returns whether the given datetime (or seconds since the EPOCH)
+        is contained inside the range of this session
+        """
+        if isinstance(datetime, dt.datetime):
+            datetime = to_epoch(datetime)
+        return self._start <= datetime <= self._end
+
+    def range_conflicts(self, start_date: dt.datetime, end_date: dt.datetime) -> bool:
+        """
+        Returns whether the given range conflicts with the range
+        of this session
+        """
+        return (self._start < to_epoch(end_date)) and (to_epoch(start_date) < self._end)
+
+    def overlaps(self, other: 'Session') -> bool:
+        """
+        Returns whether the range of the other session conflicts
+        with the range of this session
+        """
+        return (self._start < other._end) and (other._start < self._end)
+
+    def extract_data(self) -> dict:
+        """
+        Extract the data of this session
+
+        Returns(dict):
+            Full data of the session
+        """
+        data = {
+            'sessionID': self.sessionID,
+            'customerName': self.customerName,
+            'start_date': self.start_date,
+            'duration': self.duration,
+        }
+        return data
+
+    def copy(self):
+        """Create a copy of this session"""
+        return Session.from_epoch(self.customerName, self._start, self._length, self.sessionID)
+
+
+class SessionHistoryIndex:
+    """Search index over the tracked sessions of all devices
+
+    Customer name tokens and session dates are indexed, so a search
+    does not have to go through every tracked session.
+    Each indexed session gets an entry key (its position in
+    `sessions`), which stays valid until the session is removed.
+    Removed entries are left as None until they pass COMPACT_RATIO of
+    the entries, then the index is rebuilt with new entry keys
+    (generation is increased, shown entry keys have to be read again)
+    """
+    DATE_FORMAT = r'%d.%m.%Y'
+    COMPACT_RATIO = 0.5
+    COMPACT_MINIMUM = 256  # Removed entries before the index is compacted at all
+
+    def __init__(self):
+        self.version = 0  # Increased on every change
+        self.generation = 0  # Increased whenever the entry keys change (compaction)
+        self.deviceNames: Dict[str, str] = {}
+        # Entry key -> session/deviceID (None once removed)
+        self.sessions: List[Union[Session, None]] = []
+        self.deviceIDs: List[Union[str, None]] = []
+        # Helper Variables
+        self._entryKeys: Dict[tuple, int] = {}  # (deviceID, id(session)) -> entry key
+        self._deviceEntries: Dict[str, Set[int]] = {}
+        self._tokens: Dict[str, Set[int]] = {}
+        self._sortedTokens: List[str] = []
+        # Dates as shown (DATE_FORMAT), searched by prefix like the tokens
+        self._dates: Dict[str, Set[int]] = {}
+        self._sortedDates: List[str] = []
+        self._removed = 0  # Removed entries still in sessions
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        """
+        Split a text into lowercase search tokens
+        """
+        return text.lower().split()
+
+    @staticmethod
+    def _index_key(keys: Dict[str, Set[int]], sortedKeys: List[str], key: str, entryKey: int):
+        if key not in keys:
+            keys[key] = set()
+            insort(sortedKeys, key)
+        keys[key].add(entryKey)
+
+    @staticmethod
+    def _unindex_key(keys: Dict[str, Set[int]], sortedKeys: List[str], key: str, entryKey: int):
+        entryKeys = keys[key]
+        entryKeys.discard(entryKey)
+        if not entryKeys:
+            del keys[key]
+            del sortedKeys[bisect_left(sortedKeys, key)]
+
+    @staticmethod
+    def _prefix_matches(keys: Dict[str, Set[int]], sortedKeys: List[str], prefix: str) -> Set[int]:
+        """Return the entry keys of all keys starting with the prefix"""
+        matches = set()
+        position = bisect_left(sortedKeys, prefix)
+        while position < len(sortedKeys) and sortedKeys[position].startswith(prefix):
+            matches |= keys[sortedKeys[position]]
+            position += 1
+        return matches
+
+    def add(self, deviceID: str, session: Session) -> int:
+        """
+        Index a tracked session of the device
+
+        Returns(int):
+            Entry key of the session
+        """
+        entryKey = len(self.sessions)
+        self.sessions.append(session)
+        self.deviceIDs.append(deviceID)
+        self._entryKeys[(deviceID, id(session))] = entryKey
+        self._deviceEntries.setdefault(deviceID, set()).add(entryKey)
+        for token in set(self.tokenize(session.customerName)):
+            self._index_key(self._tokens, self._sortedTokens, token, entryKey)
+        self._index_key(self._dates, self._sortedDates, session.start_date.strftime(self.DATE_FORMAT), entryKey)
+        self.version += 1
+        return entryKey
+
+    def _remove(self, deviceID: str, session: Session):
+        entryKey = self._entryKeys.pop((deviceID, id(session)), None)
+        if entryKey is None:
+            # Session is not indexed
+            return
+        self._deviceEntries[deviceID].discard(entryKey)
+        for token in set(self.tokenize(session.customerName)):
+            self._unindex_key(self._tokens, self._sortedTokens, token, entryKey)
+        self._unindex_key(self._dates, self._sortedDates, session.start_date.strftime(self.DATE_FORMAT), entryKey)
+        self.sessions[entryKey] = None
+        self.deviceIDs[entryKey] = None
+        self._removed += 1
+        self.version += 1
+
+    def remove(self, deviceID: str, session: Session):
+        """
+        Remove a tracked session of the device from the index
+        """
+        self._remove(deviceID, session)
+        self._compact_if_needed()
+
+    def remove_device(self, deviceID: str):
+        """
+        Remove all tracked sessions of the device from the index
+        """
+        for entryKey in list(self._deviceEntries.get(deviceID, ())):
+            self._remove(deviceID, self.sessions[entryKey])
+        self._compact_if_needed()
+
+    def _compact_if_needed(self):
+        """
+        Rebuild the index without the removed entries once
+        they pass COMPACT_RATIO of all entries
+        """
+        if self._removed < max(self.COMPACT_MINIMUM, len(self.sessions) * self.COMPACT_RATIO):
+            return
+        entries = [(deviceID, session) for deviceID, session in zip(self.deviceIDs, self.sessions)
+                   if session is not None]
+        self.sessions = []
+        self.deviceIDs = []
+        self._entryKeys = {}
+        self._deviceEntries = {}
+        self._tokens = {}
+        self._sortedTokens = []
+        self._dates = {}
+        self._sortedDates = []
+        self._removed = 0
+        for deviceID, session in entries:
+            self.add(deviceID, session)
+        self.generation += 1
+
+    def set_sessions(self, deviceID: str, sessions: List[Session]):
+        """
+        Replace the indexed sessions of the device
+        """
+        self.remove_device(deviceID)
+        for session in sessions:
+            self.add(deviceID, session)
+
+    def search(self, text: str, deviceID: Union[str, None] = None) -> List[int]:
+        """
+        Search the indexed sessions
+
+        Every word of the text has to match the start of a customer
+        name token, words of digits and dots may also match the
+        start of the session date (DD.MM.YYYY)
+
+        Paramaters:
+            text(str):
+                Search text, an empty text matches all sessions
+            deviceID(str or None):
+                Only search the sessions of this device
+        Returns(list):
+            Entry keys of the found sessions, newest first
+        """
+        found: Union[Set[int], None] = None
+        if deviceID is not None:
+            found = set(self._deviceEntries.get(deviceID, ()))
+        for word in self.tokenize(text):
+            # Customer name tokens
+            matches = self._prefix_matches(self._tokens, self._sortedTokens, word)
+            # Dates
+            if word.replace('.', '').isdigit():
+                matches |= self._prefix_matches(self._dates, self._sortedDates, word)
+            found = matches if found is None else found & matches
+            if not found:
+                return []
+        if found is None:
+            found = set().union(*self._deviceEntries.values())
+        return sorted(found, key=lambda entryKey: self.sessions[entryKey].start, reverse=True)
+
+
+class CustomerNameIndex:
+    """Prefix index of the distinct customer names of all session histories
+
+    Names are compared case-insensitively and suggestions are
+    ranked by the number of sessions booked under that name
+
+    Paramaters:
+        sessions(Iterable[Session]):
+            Tracked sessions the index is built from
+    """
+
+    def __init__(self, sessions: Iterable[Session] = ()):
+        self._names: Dict[str, str] = {}  # Key -> shown spelling
+        self._counts: Dict[str, int] = {}  # Key -> number of sessions
+        for session in sessions:
+            key = self._key(session.customerName)
+            if not key:
+                continue
+            self._names.setdefault(key, session.customerName.strip())
+            self._counts[key] = self._counts.get(key, 0) + 1
+        self._sortedKeys: List[str] = sorted(self._names)
+
+    @staticmethod
+    def _key(name: str) -> str:
+        """
+        Normalized form of the name used for comparisons
+        """
+        return ' '.join(name.lower().split())
+
+    def add(self, name: str):
+        """
+        Count a new session of the customer
+        """
+        key = self._key(name)
+        if not key:
+            return
+        if key not in self._names:
+            self._names[key] = name.strip()
+            self._counts[key] = 0
+            insort(self._sortedKeys, key)
+        self._counts[key] += 1
+
+    def remove(self, name: str):
+        """
+        Uncount a session of the customer
+        """
+        key = self._key(name)
+        if key not in self._counts:
+            return
+        self._counts[key] -= 1
+        if self._counts[key] <= 0:
+            del self._counts[key]
+            del self._names[key]
+            del self._sortedKeys[bisect_left(self._sortedKeys, key)]
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[str]:
+        """
+        Return the names starting with the prefix,
+        most booked customers first
+        """
+        prefix = self._key(prefix)
+        if not prefix:
+            return []
+        first = bisect_left(self._sortedKeys, prefix)
+        last = bisect_left(self._sortedKeys, prefix + chr(0x10FFFF), lo=first)
+        matches = self._sortedKeys[first:last]
+        best = heapq.nlargest(limit, matches, key=self._counts.__getitem__)
+        return [self._names[key] for key in best]
+
+
+class SessionHistory:
+    """History of the finished sessions of a station
+
+    Paramaters:
+        tracked_sessions(Iterable[Session]):
+            Already tracked sessions
+    """
+
+    def __init__(self, tracked_sessions: Iterable[Session] = ()):
+        self.tracked_sessions: List[Session] = list(tracked_sessions)
+        # Called with (added session, removed sessions) on every added session
+        self.listeners: List[Callable[[Session, List[Session]], None]] = []
+
+    def sort(self):
+        """
+        Sort the tracked sessions by start date
+        """
+        self.tracked_sessions.sort(key=lambda s: s.start)
+
+    def update(self, tracked_sessions: Iterable[Session], override: bool):
+        """
+        Replace (override) or extend the tracked sessions
+        """
+        if override:
+            self.tracked_sessions = list(tracked_sessions)
+        else:
+            # Do not override existing data
+            self.tracked_sessions.extend(tracked_sessions)
+
+    def add(self, session: Session) -> List[Session]:
+        """
+        Add a finished session to the history
+
+        Returns(list):
+            Tracked sessions overridden by the new session
+        """
+        # Search for conflicting sessions
+        removed_sessions = []
+        for tracked_session in self.tracked_sessions.copy():
+            if tracked_session.overlaps(session):
+                # Two tracked sessions might conflict if the user
+                # finished one session and then set up a session that
+                # happened during that previous sessions time range
+                # Action: Override old session
+                self.tracked_sessions.remove(tracked_session)
+                removed_sessions.append(tracked_session)
+        self.tracked_sessions.append(session)
+        for listener in self.listeners:
+            listener(session, removed_sessions)
+        return removed_sessions
+
+    @staticmethod
+    def calculate_stats(sessions: list) -> dict:
+        """
+        Return the stats displayed on the application
+        (The times are dt.timedelta, they are not limited to a day)
+        """
+        if not len(sessions):
+            # No tracked sessions
+            session_history = {
+                'total_time': dt.timedelta(0),
+                'average_time': dt.timedelta(0),
+                'total_sessions': 0,
+                'average_sessions': 0,
+            }
+            return session_history
+        session_history = {}
+        # -Total time-
+        total_seconds = sum(session.length for session in sessions)
+        # Whole minutes, as displayed
+        session_history['total_time'] = dt.timedelta(minutes=total_seconds // 60)
+        # -Average session time-
+        session_history['average_time'] = dt.timedelta(minutes=total_seconds // 60 // len(sessions))
+        # -Total sessions-
+        session_history['total_sessions'] = len(sessions)
+        # -Average sessions/day-
+        days = {session.start // 86400 for session in sessions}
+        average_sessions = round(len(sessions) / len(days), 1)
+        if average_sessions.is_integer():
+            average_sessions = int(average_sessions)
+        session_history['average_sessions'] = average_sessions
+
+        return session_history
+
+
+class StationCore:
+    """Qt free state of a station: session queue, activation
+    and session history
+
+    Conflicts are reported to the confirm callback instead of
+    being asked for, so the core runs without a display
+
+    Paramaters:
+        tracked_sessions(Iterable[Session]):
+            Already tracked sessions of the station
+        clock(Clock or None):
+            Source of the current time, the application clock if None
+    """
+
+    def __init__(self, tracked_sessions: Iterable[Session] = (), clock: Union[Clock, None] = None):
+        # Imported here, the recurrence module builds on this one
+        from .recurrence import RecurrenceSchedule
+        self.clock = app_clock if clock is None else clock
+        self.is_activated = False
+        # Session queue sorted by start date
+        self._sessions: List[Session] = []
+        # Queued sessions by day (days since the EPOCH), rebuilt once outdated
+        self._day_index: Dict[int, List[Session]] = {}
+        self._day_index_outdated = False
+        self.history = SessionHistory(tracked_sessions)
+        self.recurrences = RecurrenceSchedule()
+
+    @property
+    def sessions(self) -> List[Session]:
+        return self._sessions
+
+    @sessions.setter
+    def sessions(self, value: List[Session]):
+        self._sessions = sorted(value, key=lambda s: s.start)
+        self._queue_changed()
+
+    def _queue_changed(self):
+        """Mark the day index outdated after a change of the queue"""
+        self._day_index_outdated = True
+
+    def _update_day_index(self):
+        """
+        Rebuild the day index if the queue changed
+        (A session crossing midnight is listed on every day it covers)
+        """
+        if not self._day_index_outdated:
+            return
+        day_index: Dict[int, List[Session]] = {}
+        for session in self._sessions:
+            for day in range(session.start // DAY, (session.end - 1) // DAY + 1):
+                day_index.setdefault(day, []).append(session)
+        self._day_index = day_index
+        self._day_index_outdated = False
+
+    def sessions_on(self, date: dt.date) -> List[Session]:
+        """
+        Return the queued sessions on the day sorted by start date
+        (Includes the sessions crossing midnight into or out of the day)
+        """
+        self._update_day_index()
+        return list(self._day_index.get((date - EPOCH.date()).days, ()))
+
+    def booked_days(self) -> List[dt.date]:
+        """
+        Return the days with queued sessions
+        """
+        self._update_day_index()
+        return [EPOCH.date() + dt.timedelta(days=day) for day in sorted(self._day_index)]
+
+    def next_free_start(self, now: Union[dt.datetime, None] = None,
+                        duration: Union[dt.time, dt.timedelta, int] = 0) -> dt.datetime:
+        """
+        Return the start of the first gap from now on that is at least as long
+        as the duration (now if the station is free for that long)
+        (Occurrences queued for later days do not push a walk-in back)
+
+        Paramaters:
+            now(dt.datetime or None):
+                Current time
+            duration(dt.time, dt.timedelta or int):
+                Length of the session that has to fit into the gap
+        Returns(dt.datetime):
+            Start of the gap
+        """
+        now = self.clock.now() if now is None else now
+        length = to_seconds(duration)
+        free_seconds = to_epoch(now)
+        for session in self.sessions:
+            if session.end <= free_seconds:
+                continue
+            if session.start >= free_seconds + length and session.start > free_seconds:
+                # Gap long enough
+                break
+            free_seconds = session.end
+        return now if free_seconds == to_epoch(now) else from_epoch(free_seconds)
+
+    def find_session(self, sessionID: int) -> Session:
+        """
+        Find a session by its id
+
+        Paramaters:
+            sessionID(int):
+                ID of the session
+
+        Returns(Session):
+            Session instance with that id
+        """
+        for session in self.sessions:
+            if session.sessionID == sessionID:
+                return session
+        else:
+            raise KeyError('No session found with id', sessionID)
+
+    def conflicting_sessions(self, new_session: Session) -> List[Session]:
+        """
+        Return the queued sessions overlapping the new session
+        (A session with the same sessionID is being replaced and does not conflict)
+        """
+        conflicting_sessions = []
+        for queued_session in self.sessions:
+            if new_session.overlaps(queued_session):
+                # Ranges conflict
+                if queued_session.sessionID == new_session.sessionID:
+                    # Ignore the session as it is the one being replaced
+                    continue
+                conflicting_sessions.append(queued_session)
+        return conflicting_sessions
+
+    def add_session(self, customerName: str, start_date: Union[dt.datetime, None], duration: Union[dt.time, dt.timedelta],
+                    sessionID: Union[int, None] = None,
+                    confirm: Union[Callable[[Session, List[Session]], bool], None] = None,
+                    now: Union[dt.datetime, None] = None) -> bool:
+        """
+        Add a new session
+
+        Paramaters:
+            customerName(str):
+                Name of customer for this session
+            start_date(dt.datetime or None):
+                If None, the next free start from now on will be taken (see next_free_start)
+            duration(dt.time or dt.timedelta):
+                Time length of the session
+            sessionID(int or None):
+                ID of session, if None a new session is created, otherwise
+                it replaces the session with that sessionID
+            confirm(callable or None):
+                Called with (new session, conflicting sessions) if the new session
+                overlaps queued sessions, returns whether the conflicting sessions
+                are deleted. Without a callback conflicting sessions are never deleted
+            now(dt.datetime or None):
+                Current time
+        Returns(bool):
+            Succesfully added session
+        """
+        now = self.clock.now() if now is None else now
+        # -Determine session paramaters-
+        if start_date is None:
+            start_date = self.next_free_start(now, duration)
+        new_session = Session(customerName=customerName,
+                              start_date=start_date,
+                              duration=duration,
+                              sessionID=sessionID)
+
+        # -Check for conflicting sessions-
+        conflicting_sessions = self.conflicting_sessions(new_session)
+        if conflicting_sessions:
+            if confirm is None or not confirm(new_session, conflicting_sessions):
+                # Conflicts not resolved -> unsuccessful
+                return False
+            # Remove all conflicting sessions
+            for conflicting_session in conflicting_sessions:
+                self.delete_session(session=conflicting_session,
+                                    track=None,
+                                    now=now)
+            self.recurrences.cancel(conflicting_sessions)
+
+        if sessionID is not None:
+            # Delete old session
+            try:
+                self.delete_session(session=sessionID,
+                                    track=False,
+                                    now=now)
+            except KeyError:
+                # Session with that ID is not queued
+                pass
+        self.sessions.append(new_session)
+        self.sessions.sort(key=lambda s: s.start)
+        self._queue_changed()
+        return True
+
+    def add_sessions(self, new_sessions: Iterable[Session],
+                     confirm: Union[Callable[[List[Session], List[Session], List[Session]], bool], None] = None,
+                     now: Union[dt.datetime, None] = None) -> Tuple[List[Session], List[Session]]:
+        """
+        Add many sessions at once (e.g. an imported schedule)
+
+        The new sessions and the queue are checked in one sweep over both
+        sorted lists. New sessions that are already over or overlap an earlier
+        new session are rejected, queued sessions overlapping a new session
+        are deleted once the user confirmed
+
+        Paramaters:
+            new_sessions(Iterable[Session]):
+                Sessions to add
+            confirm(callable or None):
+                Called once with (sessions to add, conflicting queued sessions,
+                rejected sessions) before the queue is changed, returns whether
+                to proceed. Without a callback nothing is added if queued
+                sessions conflict
+            now(dt.datetime or None):
+                Current time
+        Returns(tuple):
+            Added and rejected sessions
+        """
+        now = self.clock.now() if now is None else now
+        now_seconds = to_epoch(now)
+        accepted: List[Session] = []
+        rejected: List[Session] = []
+        # Queued sessions overlapping a new session (by sessionID)
+        conflicting: Dict[int, Session] = {}
+        queue = self.sessions
+        queue.sort(key=lambda s: s.start)
+        # First queued session that may overlap the current new session
+        i = 0
+        for new_session in sorted(new_sessions, key=lambda s: s.start):
+            if (new_session.end <= now_seconds or
+                    (accepted and new_session.start < accepted[-1].end)):
+                # Already over or overlapping an earlier new session
+                rejected.append(new_session)
+                continue
+            accepted.append(new_session)
+            # Queued sessions ending before this start can not overlap later new sessions
+            while i < len(queue) and queue[i].end <= new_session.start:
+                i += 1
+            j = i
+            while j < len(queue) and queue[j].start < new_session.end:
+                conflicting[queue[j].sessionID] = queue[j]
+                j += 1
+
+        conflicting_sessions = list(conflicting.values())
+        if confirm is None:
+            if conflicting_sessions:
+                return [], rejected
+        elif not confirm(accepted, conflicting_sessions, rejected):
+            return [], rejected
+        self.delete_sessions(conflicting_sessions, track=None, now=now)
+        self.recurrences.cancel(conflicting_sessions)
+        self.sessions.extend(accepted)
+        self.sessions.sort(key=lambda s: s.start)
+        self._queue_changed()
+        return accepted, rejected
+
+    def booked_sessions(self) -> List[Session]:
+        """
+        Return the queued sessions to save, the occurrences of
+        the recurrence rules are left out (they are expanded again)
+        """
+        return [session for session in self.sessions if self.recurrences.rule_of(session) is None]
+
+    def restore_sessions(self, sessions: Iterable[Session], now: Union[dt.datetime, None] = None) -> List[Session]:
+        """
+        Queue the saved sessions again on start (before the recurrence rules are
+        expanded), sessions that are over are dropped
+
+        Returns(list):
+            Queued sessions
+        """
+        # Saved sessions take precedence, like when they were booked
+        added, _ = self.add_sessions(sessions, confirm=lambda accepted, conflicting, rejected: True, now=now)
+        return added
+
+    def delete_session(self, session: Union[int, Session] = None, track: Union[bool, None] = None,
+                       now: Union[dt.datetime, None] = None):
+        """
+        Delete the session
+
+        Paramaters:
+            session(int or Session):
+                ID of the session to delete OR
+                Session class to delete
+            track(bool):
+                Whether to track the session
+                If track is None, the session is only tracked if its range contains the current time.
+                If that condition is true, the session is tracked up until the current time
+            now(dt.datetime or None):
+                Current time
+        """
+        deleted_session: Session
+        if isinstance(session, int):
+            deleted_session = self.find_session(session)
+        elif isinstance(session, Session):
+            deleted_session = session
+
+        if track is None:
+            now_seconds = to_epoch(self.clock.now() if now is None else now)
+            if deleted_session.range_contains(now_seconds) and now_seconds > deleted_session.start:
+                deleted_session.length = now_seconds - deleted_session.start
+                track = True
+            else:
+                track = False
+        self.sessions.remove(deleted_session)
+        self._queue_changed()
+        if track:
+            self.history.add(deleted_session)
+
+    def delete_sessions(self, sessions: Iterable[Session], track: Union[bool, None] = None,
+                        now: Union[dt.datetime, None] = None):
+        """
+        Delete many sessions with one pass over the queue
+
+        Paramaters:
+            sessions(Iterable[Session]):
+                Queued sessions to delete
+            track(bool):
+                See delete_session
+            now(dt.datetime or None):
+                Current time
+        """
+        deleted_sessions = {session.sessionID: session for session in sessions}
+        if not deleted_sessions:
+            return
+        now_seconds = to_epoch(self.clock.now() if now is None else now)
+        self.sessions = [session for session in self.sessions if session.sessionID not in deleted_sessions]
+        for deleted_session in deleted_sessions.values():
+            session_track = track
+            if session_track is None:
+                session_track = deleted_session.range_contains(now_seconds) and now_seconds > deleted_session.start
+                if session_track:
+                    deleted_session.length = now_seconds - deleted_session.start
+            if session_track:
+                self.history.add(deleted_session)
+
+    def replace_session(self, sessionID: int, new_customerName: str = None, new_start_date: dt.datetime = None,
+                        new_end_date: dt.datetime = None, new_duration: Union[dt.time, dt.timedelta] = None,
+                        confirm: Union[Callable[[Session, List[Session]], bool], None] = None,
+                        now: Union[dt.datetime, None] = None) -> bool:
+        """
+        Update the session with the given session id with the
+        newly given session data
+        Raises InvalidSessionError if the new end date is not after the start date
+
+        Paramaters:
+            sessionID(int):
+                ID of the session to replace
+            new_customerName(str):
+                The new customer name
+            new_start_date(dt.datetime):
+                New start date (end date will change)
+            new_end_date(dt.datetime):
+                New end date (duration will change)
+            new_duration(dt.time or dt.timedelta):
+                New duration (end date will change)
+            confirm(callable or None):
+                See add_session
+            now(dt.datetime or None):
+                Current time
+        Returns(bool):
+            Succesfully replaced session
+        """
+        original_session = self.find_session(sessionID)
+        session = original_session.copy()
+        if new_customerName is not None:
+            session.customerName = new_customerName
+        if new_start_date is not None:
+            session.start_date = new_start_date
+        if new_end_date is not None:
+            session.end_date = new_end_date
+        if new_duration is not None:
+            session.duration = new_duration
+
+        success = self.add_session(**session.extract_data(), confirm=confirm, now=now)
+        if success:
+            # An edited occurrence is a single session from now on
+            self.recurrences.cancel([original_session])
+        return success
+
+    def running_session(self, now: Union[dt.datetime, None] = None) -> Union[Session, None]:
+        """
+        Return the currently running session
+        (None if the station is deactivated or no session is running)
+        """
+        if (not self.sessions or
+                not self.is_activated):
+            return None
+        now_seconds = to_epoch(self.clock.now() if now is None else now)
+        first_session = self.sessions[0]
+        # Current time inside the sessions range
+        if first_session.range_contains(now_seconds):
+            return first_session
+        return None
+
+    def upcoming_session(self, now: Union[dt.datetime, None] = None) -> Union[Session, None]:
+        """
+        Return the next session if it has not started yet
+        """
+        now_seconds = to_epoch(self.clock.now() if now is None else now)
+        if self.sessions and self.sessions[0].start > now_seconds:
+            return self.sessions[0]
+        return None
+
+    def update_sessions(self, now: Union[dt.datetime, None] = None) -> Union[Session, None]:
+        """
+        Move the finished sessions of the queue to the history
+
+        Returns(Session or None):
+            Currently running session
+        """
+        datetime_now = self.clock.now() if now is None else now
+        now_seconds = to_epoch(datetime_now)
+        self.expand_recurrences(now_seconds)
+        # Clear out expired sessions (already past sessions; includes the most recent active session)
+        # The queue is sorted and free of overlaps, so they are at its front
+        while self.sessions and self.sessions[0].end <= now_seconds:
+            # Session is done
+            self.delete_session(session=self.sessions[0],
+                                track=True,
+                                now=datetime_now)
+        return self.running_session(now=datetime_now)
+
+    def expand_recurrences(self, now_seconds: int):
+        """
+        Put the occurrences of the recurrence rules entering the
+        look-ahead window into the queue (once a day)
+        """
+        if self.recurrences.needs_expansion(now_seconds):
+            _, skipped = self._queue_occurrences(self.recurrences.expand(now_seconds))
+            for occurrence in skipped:
+                diagnostics.log(f"Recurring session of {occurrence.customerName} on "
+                                f"{occurrence.start_date.strftime('%d.%m.%Y %H:%M')} skipped, "
+                                f"it overlaps a queued session")
+
+    def add_recurrence(self, rule: 'RecurrenceRule',
+                       now: Union[dt.datetime, None] = None) -> Tuple[List[Session], List[Session]]:
+        """
+        Add a recurrence rule, its occurrences inside the
+        look-ahead window are queued at once
+
+        Returns(tuple):
+            Queued occurrences and the occurrences skipped as they overlap
+            queued sessions (see recurrence_conflicts)
+        """
+        now_seconds = to_epoch(self.clock.now() if now is None else now)
+        self.expand_recurrences(now_seconds)
+        return self._queue_occurrences(self.recurrences.add(rule, now_seconds))
+
+    def recurrence_conflicts(self, rule: 'RecurrenceRule',
+                             now: Union[dt.datetime, None] = None) -> Tuple[List[Session], List[Session]]:
+        """
+        Check a new recurrence rule against the queue before it is added
+
+        Returns(tuple):
+            Queued sessions overlapping its first occurrence (they have to be
+            deleted) and its later occurrences inside the look-ahead window
+            overlapping the other queued sessions (they would be skipped)
+        """
+        now_seconds = to_epoch(self.clock.now() if now is None else now)
+        first_session = rule.create_session(rule.start)
+        conflicting_sessions = self.conflicting_sessions(first_session)
+        queued_sessions = [session for session in self.sessions if session not in conflicting_sessions]
+        horizon = self.recurrences.horizon
+        if horizon is None:
+            # Not expanded yet (e.g. a mirrored queue), the window ends a look-ahead from now on
+            horizon = -(-(now_seconds + self.recurrences.lookahead) // DAY) * DAY
+        skipped = []
+        for start in rule.occurrences(now_seconds - rule.length + 1, horizon):
+            if start == rule.start:
+                continue
+            occurrence = rule.create_session(start)
+            if any(occurrence.overlaps(session) for session in queued_sessions):
+                skipped.append(occurrence)
+        return conflicting_sessions, skipped
+
+    def remove_recurrence(self, rule: 'RecurrenceRule'):
+        """
+        Remove a recurrence rule and its queued occurrences
+        (A running occurrence is kept)
+        """
+        sessionIDs = set(self.recurrences.remove(rule))
+        running_session = self.running_session()
+        self.sessions = [session for session in self.sessions
+                         if session.sessionID not in sessionIDs or session is running_session]
+
+    def _queue_occurrences(self, occurrences: List[Session]) -> Tuple[List[Session], List[Session]]:
+        """
+        Add the occurrences that do not overlap a queued session
+        (Queued sessions take precedence, the queue is sorted and free of overlaps)
+
+        Returns(tuple):
+            Queued and skipped occurrences
+        """
+        if not occurrences:
+            return [], []
+        self.sessions.sort(key=lambda s: s.start)
+        starts = [session.start for session in self.sessions]
+        ends = [session.end for session in self.sessions]
+        queued = []
+        skipped = []
+        for occurrence in sorted(occurrences, key=lambda s: s.start):
+            i = bisect_left(starts, occurrence.start)
+            if ((i > 0 and ends[i - 1] > occurrence.start) or
+                    (i < len(starts) and starts[i] < occurrence.end)):
+                # Overlaps a queued session
+                self.recurrences.occurrences.pop(occurrence.sessionID, None)
+                skipped.append(occurrence)
+                continue
+            starts.insert(i, occurrence.start)
+            ends.insert(i, occurrence.end)
+            queued.append(occurrence)
+        self.sessions.extend(queued)
+        self.sessions.sort(key=lambda s: s.start)
+        self._queue_changed()
+        return queued, skipped
+
+    def deactivate(self, now: Union[dt.datetime, None] = None):
+        """
+        Close the running session, clear the queue and
+        deactivate the station
+        """
+        for session in self.sessions.copy():
+            self.delete_session(session=session,
+                                track=None,
+                                now=now)
+        self.is_activated = False
+
+
+def reconcile_devices(placed: Dict[str, Tuple[int, str]], devices: Iterable[Tuple[str, str]]) -> Dict[str, list]:
+    """
+    Diff the devices placed on the stations against the found devices by deviceID
+    The stationIDs of the remaining devices stay the same, new devices get
+    the lowest free stationIDs in the order of their names (like
+    StationService.set_plugs), so no station moves when a device is added
+
+    Paramaters:
+        placed(dict):
+            deviceID -> (stationID, deviceName) of the current stations
+        devices(Iterable):
+            (deviceID, deviceName) of the found devices
+
+    Returns(dict):
+        'add': [(deviceID, stationID)] new devices
+        'remove': [(deviceID, stationID)] devices that went away
+        'rename': [(deviceID, stationID)] devices with a new name
+        'keep': [(deviceID, stationID)] devices without any change
+    """
+    changes = {'add': [], 'remove': [], 'rename': [], 'keep': []}
+    devices = sorted(devices, key=lambda d: (d[1], d[0]))
+    found = {deviceID for deviceID, _ in devices}
+    for deviceID, (stationID, _) in placed.items():
+        if deviceID not in found:
+            changes['remove'].append((deviceID, stationID))
+    taken = {stationID for deviceID, (stationID, _) in placed.items() if deviceID in found}
+    free_stationIDs = (stationID for stationID in count() if stationID not in taken)
+    for deviceID, deviceName in devices:
+        if deviceID not in placed:
+            changes['add'].append((deviceID, next(free_stationIDs)))
+            continue
+        stationID, old_deviceName = placed[deviceID]
+        if old_deviceName != deviceName:
+            changes['rename'].append((deviceID, stationID))
+        else:
+            changes['keep'].append((deviceID, stationID))
+    return changes
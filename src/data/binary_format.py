@@ -0,0 +1,233 @@
+"""
+Versioned binary format of the saved data
+
+All numbers are little endian.
+
+    Header      4s H H          magic b'GSMD', format version, reserved (0)
+    Sections    one after another, each starting with a tag (B)
+
+    Tag 1 - Settings
+        I           length of the JSON text
+        bytes       UTF-8 JSON object of all values except the tracked and queued sessions
+                    (bytes values are written as {"$bytes": "<base64>"}, the values by
+                    deviceID (DEVICE_KEYS) as {"$devices": [[deviceID, value], ...]},
+                    so number deviceIDs do not come back as strings)
+    Tag 2 - Tracked sessions of a device
+        H           length of the deviceID
+        bytes       UTF-8 JSON of the deviceID (string or number)
+        I           number of customer names
+        names       H length + UTF-8 text, for every customer name
+        I           number of sessions
+        records     q I I (16 bytes) for every session:
+                    start (seconds since 1970-01-01 00:00 local time),
+                    length (seconds), index into the customer names
+    Tag 3 - Queued sessions of a device (version 2)
+                    Same layout as tag 2, the booked sessions waiting in the queue
+                    (occurrences of recurring sessions are expanded again on load)
+    Tag 0 - End of file
+
+Sessions are written and read device by device (streaming), the
+sessionIDs are not saved (they are assigned again on load)
+"""
+# -Root imports-
+from ..core import Session
+# -Other-
+import base64
+import json
+import struct
+# Code annotation
+from typing import (BinaryIO, Dict, Iterator, List, Tuple, Union)
+
+MAGIC = b'GSMD'
+VERSION = 2
+HEADER = struct.Struct('<4sHH')
+TAG = struct.Struct('<B')
+LENGTH_16 = struct.Struct('<H')
+LENGTH_32 = struct.Struct('<I')
+RECORD = struct.Struct('<qII')
+TAG_END = 0
+TAG_SETTINGS = 1
+TAG_SESSIONS = 2
+TAG_QUEUE = 3
+# Key of the tracked sessions in the saved data
+SESSIONS_KEY = 'tracked_sessions'
+# Key of the queued sessions in the saved data
+QUEUE_KEY = 'queued_sessions'
+# Settings holding a value by deviceID
+DEVICE_KEYS = ('recurring_sessions',)
+
+
+class FormatError(ValueError):
+    """Raised for files that are not in this format (or a newer version)"""
+
+
+class VersionError(FormatError):
+    """Raised for files saved with a newer version of the format"""
+
+
+def _json_default(value):
+    # bytes and QByteArray (window geometries)
+    if hasattr(value, 'data') and callable(value.data):
+        value = value.data()
+    if isinstance(value, (bytes, bytearray)):
+        return {'$bytes': base64.b64encode(bytes(value)).decode('ascii')}
+    raise TypeError(f'Can not save {type(value).__name__}')
+
+
+def _json_object_hook(obj: dict):
+    if len(obj) == 1 and '$bytes' in obj:
+        return base64.b64decode(obj['$bytes'])
+    if len(obj) == 1 and '$devices' in obj:
+        return {deviceID: value for deviceID, value in obj['$devices']}
+    return obj
+
+
+def _write_text(file: BinaryIO, text: str, length: struct.Struct):
+    encoded = text.encode('utf-8')
+    file.write(length.pack(len(encoded)))
+    file.write(encoded)
+
+
+def _read_exact(file: BinaryIO, size: int) -> bytes:
+    data = file.read(size)
+    if len(data) != size:
+        raise FormatError('Unexpected end of file')
+    return data
+
+
+def _read_text(file: BinaryIO, length: struct.Struct) -> str:
+    size, = length.unpack(_read_exact(file, length.size))
+    return _read_exact(file, size).decode('utf-8')
+
+
+def is_binary_file(file: BinaryIO) -> bool:
+    """
+    Returns whether the file starts with the magic of this format
+    (The position of the file is kept)
+    """
+    position = file.tell()
+    magic = file.read(len(MAGIC))
+    file.seek(position)
+    return magic == MAGIC
+
+
+# -Encoding-
+def write_header(file: BinaryIO):
+    file.write(HEADER.pack(MAGIC, VERSION, 0))
+
+
+def write_settings(file: BinaryIO, settings: dict):
+    settings = {key: {'$devices': [[deviceID, value] for deviceID, value in value.items()]}
+                if key in DEVICE_KEYS and isinstance(value, dict) else value
+                for key, value in settings.items()}
+    file.write(TAG.pack(TAG_SETTINGS))
+    _write_text(file, json.dumps(settings, default=_json_default), LENGTH_32)
+
+
+def write_sessions(file: BinaryIO, deviceID: Union[str, int], sessions: List[Session], tag: int = TAG_SESSIONS):
+    """
+    Write the tracked sessions (or with TAG_QUEUE the queued sessions) of a device
+    """
+    file.write(TAG.pack(tag))
+    _write_text(file, json.dumps(deviceID), LENGTH_16)
+    # Customer names are written once per device
+    nameIndexes: Dict[str, int] = {}
+    for session in sessions:
+        nameIndexes.setdefault(session.customerName, len(nameIndexes))
+    file.write(LENGTH_32.pack(len(nameIndexes)))
+    for name in nameIndexes:
+        _write_text(file, name, LENGTH_16)
+    records = bytearray(RECORD.size * len(sessions))
+    pack_into = RECORD.pack_into
+    for i, session in enumerate(sessions):
+        pack_into(records, i * RECORD.size, session.start, session.length, nameIndexes[session.customerName])
+    file.write(LENGTH_32.pack(len(sessions)))
+    file.write(records)
+
+
+def write_end(file: BinaryIO):
+    file.write(TAG.pack(TAG_END))
+
+
+def encode(data: dict, file: BinaryIO):
+    """
+    Write the data (settings, the tracked and the queued sessions by deviceID)
+    """
+    write_header(file)
+    write_settings(file, {key: value for key, value in data.items() if key not in (SESSIONS_KEY, QUEUE_KEY)})
+    for deviceID, sessions in data.get(SESSIONS_KEY, {}).items():
+        write_sessions(file, deviceID, sessions)
+    for deviceID, sessions in data.get(QUEUE_KEY, {}).items():
+        write_sessions(file, deviceID, sessions, tag=TAG_QUEUE)
+    write_end(file)
+
+
+# -Decoding-
+def iter_sections(file: BinaryIO) -> Iterator[Tuple[int, tuple]]:
+    """
+    Read the file section by section
+
+    Yields(tuple):
+        (TAG_SETTINGS, (settings,)) or
+        (TAG_SESSIONS, (deviceID, sessions)) or
+        (TAG_QUEUE, (deviceID, sessions))
+    """
+    magic, version, _ = HEADER.unpack(_read_exact(file, HEADER.size))
+    if magic != MAGIC:
+        raise FormatError('Not a saved data file')
+    if version > VERSION:
+        raise VersionError(f'Saved with a newer version of the format ({version})')
+    while True:
+        tag, = TAG.unpack(_read_exact(file, TAG.size))
+        if tag == TAG_END:
+            return
+        if tag == TAG_SETTINGS:
+            settings = json.loads(_read_text(file, LENGTH_32), object_hook=_json_object_hook)
+            yield tag, (settings,)
+        elif tag in (TAG_SESSIONS, TAG_QUEUE):
+            deviceID = json.loads(_read_text(file, LENGTH_16))
+            nameCount, = LENGTH_32.unpack(_read_exact(file, LENGTH_32.size))
+            names = [_read_text(file, LENGTH_16) for _ in range(nameCount)]
+            sessionCount, = LENGTH_32.unpack(_read_exact(file, LENGTH_32.size))
+            records = _read_exact(file, sessionCount * RECORD.size)
+            yield tag, (deviceID, _decode_sessions(records, names))
+        else:
+            raise FormatError(f'Unknown section {tag}')
+
+
+def _decode_sessions(records: bytes, names: List[str]) -> List[Session]:
+    """
+    Create the sessions of the records
+    (Slots are set directly, this runs for every saved session)
+    """
+    new = Session.__new__
+    ids = Session._id_counter
+    sessions = []
+    append = sessions.append
+    for start, length, nameIndex in RECORD.iter_unpack(records):
+        session = new(Session)
+        session.sessionID = next(ids)
+        session.customerName = names[nameIndex]
+        session._start = start
+        session._length = length
+        session._end = start + length
+        append(session)
+    return sessions
+
+
+def decode(file: BinaryIO) -> dict:
+    """
+    Read the data written by encode
+    (The tracked and queued sessions are always part of the decoded data)
+    """
+    data = {}
+    sessions_by_tag = {TAG_SESSIONS: {}, TAG_QUEUE: {}}
+    for tag, values in iter_sections(file):
+        if tag == TAG_SETTINGS:
+            data.update(values[0])
+        else:
+            deviceID, sessions = values
+            sessions_by_tag[tag][deviceID] = sessions
+    data[SESSIONS_KEY] = sessions_by_tag[TAG_SESSIONS]
+    data[QUEUE_KEY] = sessions_by_tag[TAG_QUEUE]
+    return data
@@ -1,3 +1,6 @@
+from ..diagnostics import (diagnostics, append_log, DATA_WRITE)
+from ..metrics import metrics
+from . import binary_format
 import pickle
 import os
 import sys
@@ -10,6 +13,8 @@ if getattr(sys, 'frozen', False):
     abs_path = sys._MEIPASS  # pylint: disable=no-member
 else:
     abs_path = os.path.dirname(os.path.abspath(__file__))
+# Data file used instead of data/data.pkl (e.g. by simulate.py)
+FILE_ENV_VAR = 'GSM_DATA_FILE'
 
 
 class DataManager:
@@ -20,7 +25,9 @@ class DataManager:
     def __init__(self, default_data: dict = {}, file_path: str = None):
         self.default_data = default_data
         self._data = self.default_data
-        self.file_path = os.path.join(abs_path, 'data', 'data.pkl') if file_path is None else file_path
+        if file_path is None:
+            file_path = os.environ.get(FILE_ENV_VAR) or os.path.join(abs_path, 'data', 'data.pkl')
+        self.file_path = file_path
         self.save_folder = os.path.dirname(self.file_path)
         self._load_file()
 
@@ -59,21 +66,50 @@ class DataManager:
 
     def save_file(self):
         """
-        Saves given data as a .pkl (pickle) file
+        Saves given data in the binary format (see binary_format)
         """
-        # Open data file, create it if it does not exist
-        with open(self.file_path, 'wb') as data_file:
-            pickle.dump(self.data, data_file)
+        # Open data file, create it (and its folder) if it does not exist
+        os.makedirs(self.save_folder, exist_ok=True)
+        # Write to a temporary file first, an interrupted save keeps the old file
+        temp_path = self.file_path + '.tmp'
+        with diagnostics.measure(DATA_WRITE):
+            with open(temp_path, 'wb') as data_file:
+                binary_format.encode(self.data, data_file)
+                size = data_file.tell()
+            os.replace(temp_path, self.file_path)
+        metrics.inc('gsm_data_written_bytes_total', size)
+        metrics.set('gsm_data_file_bytes', size)
 
     def _load_file(self):
         """
-        Loads saved pkl file and sets it to the data variable
+        Loads saved data file and sets it to the data variable
+        (Files saved as pickle by older versions are converted)
+        Raises binary_format.VersionError for a file of a newer version,
+        it is never overwritten
         """
         try:
             with open(self.file_path, 'rb') as data_file:  # Open data file
+                if binary_format.is_binary_file(data_file):
+                    self._data = binary_format.decode(data_file)
+                    return
                 self._data = pickle.load(data_file)
-        except (ValueError, FileNotFoundError):
-            # Data File is corrupted or not found so recreate it
+            # Old pickle file -> keep a backup and save in the binary format
+            os.replace(self.file_path, self.file_path + '.bak')
+            self.save_file()
+        except binary_format.VersionError as e:
+            # Saved by a newer version of the application
+            raise binary_format.VersionError(f'{e}: {self.file_path}, update the application') from None
+        except FileNotFoundError:
+            # First start
+            self._data = self.default_data
+            self.save_file()
+            self._load_file()
+        except (ValueError, EOFError, pickle.UnpicklingError) as e:
+            # Data File is corrupted -> keep it for inspection and recreate it
+            os.replace(self.file_path, self.file_path + '.corrupt')
+            # (Logged to the data folder, the log folder is set after loading)
+            append_log(self.save_folder, f'Data file {self.file_path} unreadable ({e!r}), '
+                                         f'moved to {self.file_path}.corrupt and recreated')
             self._data = self.default_data
             self.save_file()
             self._load_file()
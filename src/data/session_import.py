@@ -0,0 +1,157 @@
+"""
+Read sessions to queue from CSV or JSON files
+
+Every row/object has a customer name, a start and either a duration or an end:
+
+    CSV (header row required, ',' or ';' separated)
+        customerName,start,duration
+        Team A,2021-06-04 18:00,1:30
+        Team B,18:00,90
+
+    JSON (a list of objects or {"sessions": [...]})
+        [{"customerName": "Team A", "start": "2021-06-04 18:00", "end": "2021-06-04 19:30"}]
+
+Starts and ends are 'YYYY-MM-DD HH:MM', 'DD.MM.YYYY HH:MM' or 'HH:MM' (on the
+given day), durations are 'H:MM' or minutes
+"""
+# -Root imports-
+from ..core import (InvalidSessionError, Session, to_seconds)
+# -Other-
+import csv
+import datetime as dt
+import json
+import math
+import os
+# Code annotation
+from typing import (Iterable, List, Tuple)
+
+DATE_FORMATS = ('%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%d.%m.%Y %H:%M')
+TIME_FORMAT = '%H:%M'
+FILE_FILTER = "Sessions (*.csv *.json)"
+# Longest session of an import (longer ones are typing errors, e.g. minutes as seconds)
+MAX_DURATION = dt.timedelta(days=7)
+
+
+class SessionImportError(ValueError):
+    """Raised for files that can not be read as sessions"""
+
+
+def parse_date(text: str, day: dt.date) -> dt.datetime:
+    """
+    Return the date of the text, a time only is on the given day
+    """
+    text = text.strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return dt.datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+    return dt.datetime.combine(day, dt.datetime.strptime(text, TIME_FORMAT).time())
+
+
+def parse_duration(value) -> dt.timedelta:
+    """
+    Return the duration of 'H:MM' or minutes
+    Raises ValueError for durations that are no finite number or too long
+    """
+    try:
+        if isinstance(value, str) and ':' in value:
+            hours, minutes = value.strip().split(':')
+            duration = dt.timedelta(hours=int(hours), minutes=int(minutes))
+        else:
+            minutes = float(value)
+            if not math.isfinite(minutes):
+                raise ValueError(f'Invalid duration: {value}')
+            duration = dt.timedelta(minutes=minutes)
+    except OverflowError:
+        raise ValueError(f'Duration too long: {value}') from None
+    if duration > MAX_DURATION:
+        raise ValueError(f'Duration too long: {value}')
+    return duration
+
+
+def parse_row(row: dict, day: dt.date) -> Session:
+    """
+    Create the session of a row/object
+    Raises ValueError (or InvalidSessionError) for invalid values
+    """
+    # Keys are matched without case ('customerName', 'customername', ...)
+    row = {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+    customerName = str(row.get('customername') or '').strip()
+    if not customerName:
+        raise ValueError('No customer name')
+    if not row.get('start'):
+        raise ValueError('No start')
+    start_date = parse_date(str(row['start']), day)
+    if row.get('duration') not in (None, ''):
+        duration = parse_duration(row['duration'])
+    elif row.get('end'):
+        end_date = parse_date(str(row['end']), start_date.date())
+        if end_date <= start_date and len(str(row['end']).strip()) <= len('HH:MM'):
+            # End time only, past midnight
+            end_date += dt.timedelta(days=1)
+        duration = end_date - start_date
+        if duration > MAX_DURATION:
+            raise ValueError(f'Duration too long: {row["end"]}')
+    else:
+        raise ValueError('No duration or end')
+    if to_seconds(duration) <= 0:
+        raise InvalidSessionError('Duration has to be positive')
+    if start_date > dt.datetime.max - duration:
+        raise ValueError('End after the year 9999')
+    return Session(customerName=customerName,
+                   start_date=start_date,
+                   duration=duration)
+
+
+def parse_rows(rows: Iterable[dict], day: dt.date, first_line: int = 1) -> Tuple[List[Session], List[str]]:
+    """
+    Create the sessions of the rows, invalid rows are skipped
+
+    Returns(tuple):
+        Sessions and the descriptions of the skipped rows
+    """
+    sessions = []
+    skipped = []
+    for line, row in enumerate(rows, first_line):
+        try:
+            sessions.append(parse_row(row, day))
+        except (ValueError, TypeError, OverflowError) as e:
+            skipped.append(f'Row {line}: {e}')
+    return sessions, skipped
+
+
+def read_sessions(file_path: str, day: dt.date) -> Tuple[List[Session], List[str]]:
+    """
+    Read the sessions of a CSV or JSON file
+    Raises SessionImportError if the file can not be read
+
+    Paramaters:
+        file_path(str):
+            Path of the .csv or .json file
+        day(dt.date):
+            Day of the starts given as a time only
+
+    Returns(tuple):
+        Sessions and the descriptions of the skipped rows
+    """
+    try:
+        with open(file_path, 'r', encoding='utf-8-sig', newline='') as import_file:
+            if os.path.splitext(file_path)[1].lower() == '.json':
+                data = json.load(import_file)
+                rows = data.get('sessions') if isinstance(data, dict) else data
+                if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+                    raise SessionImportError('Expected a list of session objects')
+                return parse_rows(rows, day)
+            text = import_file.read()
+    except (OSError, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise SessionImportError(str(e)) from e
+    try:
+        dialect = csv.Sniffer().sniff(text.partition('\n')[0], delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(text.splitlines(), dialect=dialect)
+    if not reader.fieldnames or 'start' not in [name.strip().lower() for name in reader.fieldnames]:
+        raise SessionImportError('Expected a header row with customerName, start and duration or end')
+    # Line 1 is the header
+    return parse_rows(reader, day, first_line=2)
@@ -0,0 +1,260 @@
+"""
+Runtime diagnostics: latency of the hot paths and event loop stalls
+
+The durations of refresh ticks, device commands, data file writes and
+table fills are kept in ring buffers. The watchdog logs every stall of the
+GUI event loop longer than the threshold (milliseconds, environment
+variable GSM_STALL_THRESHOLD, 0 disables it) with a stack snapshot of the
+GUI thread.
+"""
+from collections import deque
+from contextlib import contextmanager
+import datetime as dt
+import math
+import os
+import sys
+import threading
+import time
+import traceback
+# Code annotation
+from typing import (Callable, Deque, Dict, List, Union)
+
+ENV_VAR = 'GSM_STALL_THRESHOLD'
+DEFAULT_STALL_THRESHOLD = 500
+LOG_FILE = 'diagnostics.log'
+# Metric names
+REFRESH_TICK = 'refresh tick'
+STATION_REFRESH = 'station refresh'
+DEVICE_COMMAND = 'device command'
+DEVICE_DISCOVERY = 'device discovery'
+DATA_WRITE = 'data file write'
+QUEUE_TABLE_FILL = 'queue table fill'
+HISTORY_TABLE_FILL = 'history table fill'
+
+
+def append_log(log_folder: Union[str, None], text: str):
+    """
+    Append a timestamped entry to the log file in the log folder
+    (Nothing is written without a log folder)
+
+    Returns(str):
+        The entry
+    """
+    entry = f"[{dt.datetime.now().strftime('%d.%m.%Y %H:%M:%S')}] {text}"
+    if log_folder is not None:
+        os.makedirs(log_folder, exist_ok=True)
+        with open(os.path.join(log_folder, LOG_FILE), 'a') as log_file:
+            log_file.write(entry + '\n')
+    return entry
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """
+    Return the percentile of the values (nearest rank)
+    """
+    ordered = sorted(values)
+    rank = min(len(ordered), max(1, math.ceil(percent / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+class LatencyRecorder:
+    """
+    Keep the latest durations of each metric in a ring buffer
+
+    Paramaters:
+        size(int):
+            Number of durations kept per metric
+    """
+
+    def __init__(self, size: int = 1000):
+        self.size = size
+        self.samples: Dict[str, Deque[float]] = {}
+        self.counts: Dict[str, int] = {}
+
+    def record(self, name: str, seconds: float):
+        """
+        Add a duration to the metric
+        (Can be called from any thread)
+        """
+        try:
+            self.samples[name].append(seconds)
+        except KeyError:
+            self.samples.setdefault(name, deque(maxlen=self.size)).append(seconds)
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    @contextmanager
+    def measure(self, name: str):
+        """
+        Record the wall time of the code run inside this context
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def summary(self) -> Dict[str, dict]:
+        """
+        Returns(dict):
+            count, p50, p99 and max (seconds) by metric name
+        """
+        summary = {}
+        for name, samples in list(self.samples.items()):
+            values = list(samples)
+            if not values:
+                continue
+            summary[name] = {
+                'count': self.counts.get(name, len(values)),
+                'p50': percentile(values, 50),
+                'p99': percentile(values, 99),
+                'max': max(values),
+            }
+        return summary
+
+
+class StallWatchdog:
+    """
+    Background thread checking the heartbeat of the GUI thread
+
+    'beat' has to be called regularly from the GUI event loop,
+    if it is not called within the threshold the GUI thread
+    is stalled and a stack snapshot of it is logged
+
+    Paramaters:
+        threshold(int):
+            Stall duration in milliseconds that gets logged
+    """
+
+    def __init__(self, threshold: int):
+        self.threshold = threshold / 1000
+        self.log_folder: Union[str, None] = None
+        self.stalls: Deque[str] = deque(maxlen=50)
+        self.stall_count = 0
+        self._last_beat = time.perf_counter()
+        self._stalled = False
+        self._thread_id: Union[int, None] = None
+        self._thread: Union[threading.Thread, None] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def start(self):
+        """
+        Start watching the calling (GUI) thread
+        """
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread_id = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._thread = threading.Thread(target=self._watch, name='StallWatchdog', daemon=True)
+        self._thread.start()
+
+    def beat(self):
+        """
+        Report that the event loop is running
+        """
+        if self._stalled:
+            self._stalled = False
+            self.log(f'Stall ended after {(time.perf_counter() - self._last_beat) * 1000:.0f} ms')
+        self._last_beat = time.perf_counter()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.threshold / 2)
+            stalled_for = time.perf_counter() - self._last_beat
+            if self._stalled or stalled_for < self.threshold:
+                continue
+            self._stalled = True
+            self.stall_count += 1
+            frame = sys._current_frames().get(self._thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame is not None else 'No stack available\n'
+            self.log(f'Event loop stalled for over {stalled_for * 1000:.0f} ms, GUI thread stack:\n{stack}')
+
+    def log(self, text: str):
+        """
+        Keep the entry and append it to the log file
+        """
+        self.stalls.append(append_log(self.log_folder, text))
+
+
+class Diagnostics:
+    """
+    Latency recorder and stall watchdog of the application
+
+    Paramaters:
+        stall_threshold(int):
+            Stall duration in milliseconds that gets logged (0 disables the watchdog)
+    """
+
+    def __init__(self, stall_threshold: int):
+        self.latencies = LatencyRecorder()
+        self.watchdog = StallWatchdog(stall_threshold)
+        # Called with (name, seconds) on every recorded duration
+        self.observers: List[Callable[[str, float], None]] = []
+
+    @property
+    def log_folder(self) -> Union[str, None]:
+        return self.watchdog.log_folder
+
+    @log_folder.setter
+    def log_folder(self, value: str):
+        self.watchdog.log_folder = value
+
+    def log(self, text: str):
+        """Append an entry to the log file"""
+        append_log(self.log_folder, text)
+
+    def record(self, name: str, seconds: float):
+        self.latencies.record(name, seconds)
+        for observer in self.observers:
+            observer(name, seconds)
+
+    @contextmanager
+    def measure(self, name: str):
+        """
+        Record the wall time of the code run inside this context
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def report(self) -> str:
+        """
+        Return the p50/p99 of all metrics and the latest stalls as text
+        """
+        lines = [f"Diagnostics ({dt.datetime.now().strftime('%d.%m.%Y %H:%M:%S')})",
+                 f"  {'Metric':<24}{'Count':>8}{'p50':>12}{'p99':>12}{'Max':>12}"]
+        for name, stats in sorted(self.latencies.summary().items()):
+            lines.append(f"  {name:<24}{stats['count']:>8}"
+                         f"{stats['p50'] * 1000:>9.2f} ms{stats['p99'] * 1000:>9.2f} ms{stats['max'] * 1000:>9.2f} ms")
+        if self.watchdog.enabled:
+            lines.append(f'  Event loop stalls over {self.watchdog.threshold * 1000:.0f} ms: {self.watchdog.stall_count}')
+            lines.extend(f'  {entry}' for entry in list(self.watchdog.stalls)[-5:])
+        return '\n'.join(lines)
+
+    def dump(self) -> str:
+        """
+        Append the report to the log file
+
+        Returns(str):
+            The report
+        """
+        text = self.report()
+        if self.log_folder is not None:
+            os.makedirs(self.log_folder, exist_ok=True)
+            with open(os.path.join(self.log_folder, LOG_FILE), 'a') as log_file:
+                log_file.write(text + '\n\n')
+        return text
+
+
+def _stall_threshold() -> int:
+    try:
+        return int(os.environ.get(ENV_VAR, DEFAULT_STALL_THRESHOLD))
+    except ValueError:
+        return DEFAULT_STALL_THRESHOLD
+
+
+diagnostics = Diagnostics(stall_threshold=_stall_threshold())
@@ -2,15 +2,370 @@
 Custom classes helping with the gui logic are here
 """
 # pylint: disable=no-name-in-module, import-error
-from PySide2.QtWidgets import (QStyledItemDelegate, QLineEdit, QTimeEdit)
-from PySide2.QtCore import (Qt, QObject, QEvent)
+from PySide2.QtWidgets import (QStyledItemDelegate, QLineEdit, QTimeEdit, QCompleter, QWidget)
+from PySide2.QtCore import (Qt, QObject, QEvent, QAbstractTableModel, QAbstractProxyModel, QModelIndex,
+                            QStringListModel, QBuffer, QByteArray, QIODevice, QRunnable, Signal, Slot)
+from PySide2.QtGui import (QColor, QPainter, QPen)
+# -Root imports-
+from ..core import (format_duration, from_epoch, DAY)
+from ..api_json import ApiError
+from .. import constants as const
+# -Other-
+from collections import defaultdict
+from http import HTTPStatus
 import datetime as dt
+# Code annotation
+from typing import Dict
+
+
+class UiTemplate:
+    """
+    Widget template read from a .ui file once
+
+    The widget names of the template end with '_1', the template is
+    split at these suffixes once and the text of a station is joined
+    of the parts with its stationID. Qt widgets can not be cloned, so
+    QUiLoader still parses that text and builds the widgets per station
+
+    Paramaters:
+        path(str):
+            Path of the .ui template
+        loader(QUiLoader):
+            Loader creating the widgets
+    """
+    TEMPLATE_SUFFIX = '_1'
+
+    def __init__(self, path: str, loader):
+        self.loader = loader
+        with open(path, 'rb') as template_ui:
+            template = template_ui.read()
+        # The suffixes of widget and class names are cut out, no NUL byte is part of a .ui file
+        suffix = self.TEMPLATE_SUFFIX.encode('utf-8')
+        for name_end in (b'">', b'</class>'):
+            template = template.replace(suffix + name_end, b'\0' + name_end)
+        self._parts = template.split(b'\0')
+
+    def load(self, stationID: int):
+        """
+        Create the widget for the station
+        """
+        buffer = QBuffer()
+        buffer.setData(QByteArray(f'_{stationID}'.encode('utf-8').join(self._parts)))
+        buffer.open(QIODevice.ReadOnly)
+        widget = self.loader.load(buffer)
+        buffer.close()
+        return widget
+
+
+class SessionTableModel(QAbstractTableModel):
+    """
+    Table model of the session queue of a station
+
+    The queue is applied with row level inserts, removes
+    and changes, so a refresh keeps the selection of the view
+    """
+    HEADERS = ['Customer Name', 'Start Time', 'End Time', 'Total Time']
+
+    def __init__(self, parent=None):
+        super(SessionTableModel, self).__init__(parent)
+        self.station = None
+        # Displayed values of each row, the first value is the sessionID
+        self._rows = []
+
+    @staticmethod
+    def _row_values(session) -> tuple:
+        """
+        Values shown in the row of the session
+        (Ends on a later day are marked with the number of days, e.g. '01:00 +1')
+        """
+        end_text = session.end_date.strftime('%H:%M')
+        # A session ending at midnight ends on its day
+        days = (session.end - 1) // DAY - session.start // DAY
+        if days > 0:
+            end_text += f' +{days}'
+        return (session.sessionID,
+                session.customerName,
+                session.start_date.strftime('%H:%M'),
+                end_text,
+                format_duration(session.length))
+
+    def sessionID(self, row: int) -> int:
+        """
+        Return the sessionID shown in the row
+        """
+        return self._rows[row][0]
+
+    def set_station(self, station):
+        """
+        Show the (empty) queue of another station
+        """
+        self.beginResetModel()
+        self.station = station
+        self._rows = []
+        self.endResetModel()
+
+    def update_sessions(self, sessions: list):
+        """
+        Apply the differences between the shown rows and
+        the given session queue
+
+        Paramaters:
+            sessions(list):
+                Sessions of the station sorted by start date
+        """
+        new_rows = [self._row_values(session) for session in sessions]
+        new_sessionIDs = set(row_values[0] for row_values in new_rows)
+        # -Removes- (back to front so the row numbers stay valid)
+        row = len(self._rows) - 1
+        while row >= 0:
+            if self._rows[row][0] in new_sessionIDs:
+                row -= 1
+                continue
+            first = row
+            while first > 0 and self._rows[first - 1][0] not in new_sessionIDs:
+                first -= 1
+            self.beginRemoveRows(QModelIndex(), first, row)
+            del self._rows[first:row + 1]
+            self.endRemoveRows()
+            row = first - 1
+        # -Moves-
+        old_sessionIDs = [row_values[0] for row_values in self._rows]
+        kept_sessionIDs = set(old_sessionIDs)
+        new_order = [row_values[0] for row_values in new_rows if row_values[0] in kept_sessionIDs]
+        if old_sessionIDs != new_order:
+            self.layoutAboutToBeChanged.emit()
+            new_position = {sessionID: row for row, sessionID in enumerate(new_order)}
+            self._rows = sorted(self._rows, key=lambda row_values: new_position[row_values[0]])
+            old_indexes = self.persistentIndexList()
+            new_indexes = [self.index(new_position[old_sessionIDs[index.row()]], index.column())
+                           for index in old_indexes]
+            self.changePersistentIndexList(old_indexes, new_indexes)
+            self.layoutChanged.emit()
+        # -Inserts and changes-
+        row = 0
+        while row < len(new_rows):
+            if row < len(self._rows) and self._rows[row][0] == new_rows[row][0]:
+                if self._rows[row] != new_rows[row]:
+                    self._rows[row] = new_rows[row]
+                    self.dataChanged.emit(self.index(row, 0),
+                                          self.index(row, len(self.HEADERS) - 1))
+                row += 1
+                continue
+            last = row
+            while last + 1 < len(new_rows) and new_rows[last + 1][0] not in kept_sessionIDs:
+                last += 1
+            self.beginInsertRows(QModelIndex(), row, last)
+            self._rows[row:row] = new_rows[row:last + 1]
+            self.endInsertRows()
+            row = last + 1
+
+    # -Model methods-
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self._rows[index.row()][index.column() + 1]
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def flags(self, index):
+        return super(SessionTableModel, self).flags(index) | Qt.ItemIsEditable
+
+
+class HistoryTableModel(QAbstractTableModel):
+    """
+    Table model of all sessions in a SessionHistoryIndex,
+    each row is an entry key of the index
+    Removed entries stay as empty rows and are left out by
+    the HistoryFilterProxyModel (until the index is compacted)
+    """
+    HEADERS = ['Date', 'Device Name', 'Customer Name', 'Start Time', 'End Time']
+
+    def __init__(self, historyIndex, parent=None):
+        super(HistoryTableModel, self).__init__(parent)
+        self.historyIndex = historyIndex
+        self._rowCount = 0
+        self._generation = historyIndex.generation
+
+    def sync(self) -> bool:
+        """
+        Add the rows of newly indexed sessions
+
+        Returns(bool):
+            All rows changed (the index was compacted)
+        """
+        rowCount = len(self.historyIndex.sessions)
+        if self._generation != self.historyIndex.generation:
+            self.beginResetModel()
+            self._rowCount = rowCount
+            self._generation = self.historyIndex.generation
+            self.endResetModel()
+            return True
+        if rowCount > self._rowCount:
+            self.beginInsertRows(QModelIndex(), self._rowCount, rowCount - 1)
+            self._rowCount = rowCount
+            self.endInsertRows()
+        return False
+
+    # -Model methods-
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._rowCount
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        if role != Qt.DisplayRole:
+            return None
+        session = self.historyIndex.sessions[index.row()]
+        if session is None:
+            # Removed entry
+            return None
+        column = index.column()
+        if column == 0:
+            return session.start_date.strftime(self.historyIndex.DATE_FORMAT)
+        elif column == 1:
+            deviceID = self.historyIndex.deviceIDs[index.row()]
+            return self.historyIndex.deviceNames.get(deviceID, 'N/A')
+        elif column == 2:
+            return session.customerName
+        elif column == 3:
+            return session.start_date.strftime('%H:%M')
+        elif column == 4:
+            return session.end_date.strftime('%H:%M')
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+
+class HistoryFilterProxyModel(QAbstractProxyModel):
+    """
+    Proxy model showing the given source rows in the given order
+    The rows come from an index search, so no row has to be run
+    through a filter function
+    """
+
+    def __init__(self, parent=None):
+        super(HistoryFilterProxyModel, self).__init__(parent)
+        self.query = None  # Query the shown rows belong to
+        self._rows = []
+        self._proxyRows = {}  # Source row -> proxy row
+
+    def set_rows(self, rows: list, query=None, reset: bool = False):
+        """
+        Show the given source rows
+        (reset: the source rows changed, even the same rows are shown again)
+        """
+        self.query = query
+        if rows == self._rows and not reset:
+            return
+        self.beginResetModel()
+        self._rows = rows
+        self._proxyRows = {sourceRow: proxyRow for proxyRow, sourceRow in enumerate(rows)}
+        self.endResetModel()
+
+    # -Model methods-
+    def mapToSource(self, proxyIndex):
+        if not proxyIndex.isValid():
+            return QModelIndex()
+        return self.sourceModel().index(self._rows[proxyIndex.row()], proxyIndex.column())
+
+    def mapFromSource(self, sourceIndex):
+        if not sourceIndex.isValid() or sourceIndex.row() not in self._proxyRows:
+            return QModelIndex()
+        return self.index(self._proxyRows[sourceIndex.row()], sourceIndex.column())
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid():
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=None):
+        if index is None:
+            return QObject.parent(self)
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.sourceModel().columnCount()
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal:
+            return self.sourceModel().headerData(section, orientation, role)
+        return None
+
+
+class CustomerNameCompleter(QCompleter):
+    """
+    Completer of a line edit suggesting the names of past
+    customers, ranked by the CustomerNameIndex
+    """
+
+    def __init__(self, customerIndex, lineEdit: QLineEdit, maxSuggestions: int = 10):
+        super(CustomerNameCompleter, self).__init__(lineEdit)
+        self.customerIndex = customerIndex
+        self.maxSuggestions = maxSuggestions
+        # The index already filtered and ranked the suggestions
+        self.setModel(QStringListModel(self))
+        self.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.setMaxVisibleItems(maxSuggestions)
+        lineEdit.setCompleter(self)
+        lineEdit.textEdited.connect(self.update_suggestions)
+
+    def update_suggestions(self, text: str):
+        """
+        Show the suggestions for the typed text
+        """
+        suggestions = self.customerIndex.suggest(text, limit=self.maxSuggestions)
+        self.model().setStringList(suggestions)
+        if suggestions:
+            self.complete()
+        else:
+            self.popup().hide()
+
 
 class QWidgetDelegate(QStyledItemDelegate):
-    def __init__(self, parent, station):
+    """
+    Editor delegate of the session queue table,
+    the edited session is applied to the station of
+    the SessionTableModel
+    """
+
+    def __init__(self, parent):
         super(QWidgetDelegate, self).__init__(parent)
         self.parent = parent
-        self.station = station
 
     def createEditor(self, parent, option, index):
         """
@@ -22,9 +377,11 @@ class QWidgetDelegate(QStyledItemDelegate):
             cellWidget.setText(index.data())
             cellWidget.selectAll()
         else:
-            # Time Column
+            # Time Column (durations over a day are limited to 23:59)
             cellWidget = QTimeEdit(parent=parent)
-            cellWidget.setTime(dt.datetime.strptime(index.data(), '%H:%M').time())
+            hours, minutes = (int(value) for value in index.data().split(' ')[0].split(':'))
+            cellWidget.setTime(dt.time(23, 59) if hours > 23 else dt.time(hours, minutes))
+            cellWidget.setProperty('clamped', hours > 23)
 
         cellWidget.setAlignment(Qt.AlignCenter)
         return cellWidget
@@ -36,7 +393,7 @@ class QWidgetDelegate(QStyledItemDelegate):
         # -Check which option was edited and edit session accordingly-
         if index.column() == 0:
             key = 'new_customerName'
-            value = index.data()
+            value = editor.text()
         elif index.column() == 1:
             key = 'new_start_date'
             value = editor.property('time').toPython()
@@ -47,43 +404,176 @@ class QWidgetDelegate(QStyledItemDelegate):
             key = 'new_duration'
             value = editor.property('time').toPython()
 
-        if isinstance(value, dt.time):
-            # Value is start or end date
-            date_now = dt.date.today()
-            value = dt.datetime.combine(date=date_now,
-                                        time=editor.property('time').toPython())
-        self.station.replace_session(self.station.rowTranslator[index.row()],
-                                     **{key: value})
+        model = index.model()
+        if editor.property('clamped') and value == dt.time(23, 59):
+            # Duration over a day was not edited
+            editor.destroy()
+            return
+        try:
+            sessionID = model.sessionID(index.row())
+            session = model.station.core.find_session(sessionID)
+        except (IndexError, KeyError):
+            # Session ended or was removed while editing
+            editor.destroy()
+            return
+        if index.column() in (1, 2):
+            # Value is start or end date, on the day of the session
+            start_date = session.start_date
+            value = dt.datetime.combine(date=start_date.date(),
+                                        time=value)
+            if index.column() == 2 and value <= start_date:
+                # End past midnight
+                value += dt.timedelta(days=1)
+        model.station.replace_session(sessionID,
+                                      **{key: value})
         # Destroy edit widget
         editor.destroy()
 
 
+class WindowStateWatcher(QObject):
+    """
+    Event filter calling the callback whenever the watched
+    window is shown or its state changes (e.g. restored
+    after being minimised)
+    """
+
+    def __init__(self, callback):
+        super(WindowStateWatcher, self).__init__()
+        self.callback = callback
+
+    def eventFilter(self, obj, event):
+        if event.type() in (QEvent.Show, QEvent.WindowStateChange):
+            self.callback()
+        return False
+
+
+class OccupancyChart(QWidget):
+    """
+    Chart of the number of busy stations over a time range
+
+    Every pixel column shows the highest number of busy
+    stations of its time, fully booked times are red
+    """
+    MARGIN = 4
+    LABEL_HEIGHT = 16
+
+    def __init__(self, parent=None):
+        super(OccupancyChart, self).__init__(parent)
+        self.setMinimumHeight(90)
+        self.occupancy = None
+
+    def set_occupancy(self, occupancy):
+        """
+        Show the occupancy (src.occupancy.Occupancy or None)
+        """
+        self.occupancy = occupancy
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(236, 236, 236))
+        if self.occupancy is None:
+            return
+        left, top = self.MARGIN, self.MARGIN
+        width = self.width() - 2 * self.MARGIN
+        height = self.height() - 2 * self.MARGIN - self.LABEL_HEIGHT
+        if width <= 0 or height <= 0:
+            return
+        capacity = max(self.occupancy.capacity, 1)
+        bottom = top + height
+        busy_pen = QPen(QColor(*const.NOT_AVAILABLE_COLOR))
+        full_pen = QPen(QColor(*const.DEACTIVATED_COLOR))
+        for x, value in enumerate(self.occupancy.buckets(width)):
+            if value:
+                painter.setPen(full_pen if value >= capacity else busy_pen)
+                painter.drawLine(left + x, bottom, left + x, bottom - round(min(value, capacity) / capacity * height))
+        # Capacity line and time axis
+        painter.setPen(QPen(QColor(90, 90, 90), 1, Qt.DashLine))
+        painter.drawLine(left, top, left + width, top)
+        painter.setPen(QPen(QColor(90, 90, 90)))
+        painter.drawLine(left, bottom, left + width, bottom)
+        date_format = '%d.%m. %H:%M' if self.occupancy.end - self.occupancy.start <= DAY else '%d.%m.%Y'
+        label_rect = (left, bottom, width, self.LABEL_HEIGHT + self.MARGIN)
+        painter.drawText(*label_rect, Qt.AlignLeft | Qt.AlignVCenter,
+                         from_epoch(self.occupancy.start).strftime(date_format))
+        painter.drawText(*label_rect, Qt.AlignRight | Qt.AlignVCenter,
+                         from_epoch(self.occupancy.end).strftime(date_format))
+        painter.drawText(*label_rect, Qt.AlignHCenter | Qt.AlignVCenter, f'max. {capacity}')
+
+
+class PollerSignals(QObject):
+    '''
+    finished
+        `dict` state of every polled station by stationID
+    '''
+    finished = Signal(dict)
+
+
+class StationPoller(QRunnable):
+    '''
+    Worker reading the state of the daemon stations (client mode)
+
+    Set cores and start it on a thread pool, the states are emitted
+    by finished and applied on the GUI thread (RemoteStationCore.apply).
+    A station the daemon did not answer for is left out
+    '''
+
+    def __init__(self):
+        super(StationPoller, self).__init__()
+        self.signals = PollerSignals()
+        # stationID -> RemoteStationCore
+        self.cores: dict = {}
+        self.running = False
+        self.setAutoDelete(False)
+
+    @Slot()
+    def run(self):
+        states = {}
+        try:
+            for stationID, core in self.cores.items():
+                try:
+                    states[stationID] = core.fetch()
+                except ApiError as e:
+                    # The station keeps its last state
+                    if e.status == HTTPStatus.SERVICE_UNAVAILABLE:
+                        # Daemon not reachable, do not wait for every station
+                        break
+        finally:
+            self.running = False
+            self.signals.finished.emit(states)
+
+
 class EventHandler(QObject):
+    """
+    Event filter calling the callbacks of pressed keys
+
+    Callbacks are stored by (window, key), so a key press is
+    matched with one lookup instead of going through all filters
+    """
+
     def __init__(self):
         super(EventHandler, self).__init__()
-        self.filters = []
+        # (window or None, key) -> callbacks
+        self.filters: Dict[tuple, list] = defaultdict(list)
+        self._keys = set()  # Keys with at least one callback
 
     def addFilter(self, key, callback, parent=None):
         """
         Add a new key to be filered, when the key is
         found the callback funtion will be called
+        (Only in the parent window, if a parent is given)
         """
-        self.filters.append([key, callback, parent])
+        self.filters[(parent, key)].append(callback)
+        self._keys.add(key)
 
     def eventFilter(self, obj, event):
-        if event.type() == QEvent.KeyPress:
-            key = event.key()
-            for key_filter_data in self.filters:
-                if key_filter_data[2] is not None:
-                    if obj.window() != key_filter_data[2]:
-                        continue
-                if key == key_filter_data[0]:
-                    key_filter_data[1]()
-            else:
-                return True
-        else:
-            # standard event processing
-            try:
-                return QObject.eventFilter(self, obj, event)
-            except RuntimeError:
-                return True
+        if event.type() != QEvent.KeyPress:
+            # Standard event processing
+            return False
+        key = event.key()
+        if key in self._keys:
+            for callback in self.filters.get((None, key), ()):
+                callback()
+            for callback in self.filters.get((obj.window(), key), ()):
+                callback()
+        return True
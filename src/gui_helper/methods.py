@@ -14,3 +14,14 @@ def reconnect(signal, newhandler=None):
             break
     if newhandler is not None:
         signal.connect(newhandler)
+
+
+def is_page_visible(mainWindow, page_index: int) -> bool:
+    """
+    Return whether the page of the main window is currently
+    rendered (page is shown and the window is neither hidden
+    nor minimised)
+    """
+    return (mainWindow.isVisible() and
+            not mainWindow.isMinimized() and
+            mainWindow.stackedWidget_mainContents.currentIndex() == page_index)
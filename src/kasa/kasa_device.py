@@ -5,12 +5,20 @@ Classes associated with TP-Link
 # -GUI-
 from PySide2.QtCore import (QRunnable, QThread, QObject, Signal, Slot)
 from PySide2.QtWidgets import (QApplication, QLabel)
+# -Root imports-
+from ..diagnostics import (diagnostics, DEVICE_COMMAND, DEVICE_DISCOVERY)
+from ..metrics import metrics
 # -Other-
-# TP-Link
-from tplinkcloud import (hs100, TPLinkDeviceManager)
 # Debugging
 import traceback
 import sys
+import threading
+import time
+# Code annotation
+from typing import (List, TYPE_CHECKING)
+if TYPE_CHECKING:
+    # TP-Link (imported when searching for devices, it pulls in a whole HTTP stack)
+    from tplinkcloud import hs100
 
 
 class WorkerSignals(QObject):
@@ -28,9 +36,13 @@ class WorkerSignals(QObject):
     result
         `object` data returned from processing, anything
 
+    busy
+        `bool` search started/ended (widgets are updated on the GUI thread)
+
     '''
     finished = Signal(object)
     error = Signal(dict)
+    busy = Signal(bool)
 
 
 class DeviceRetriever(QRunnable):
@@ -44,6 +56,7 @@ class DeviceRetriever(QRunnable):
         label_widget:
             List of widgets to be disabled when this
             thread runs
+    (Background searches leave the widgets as they are)
     '''
 
     def __init__(self, parent: QApplication, settingsManager, disable_widgets: list = None, label_widget: QLabel = None):
@@ -54,7 +67,19 @@ class DeviceRetriever(QRunnable):
         self.disable_widgets = disable_widgets
         self.label_widget = label_widget
         self.device_manager = None
+        # Periodic search, nothing is shown while it runs
+        self.background = False
         self.setAutoDelete(False)
+        self.signals.busy.connect(self._show_busy)
+
+    def _show_busy(self, busy: bool):
+        """
+        Disable the widgets while searching (runs on the GUI thread)
+        """
+        if self.label_widget:
+            self.label_widget.setText('Searching for devices...' if busy else '')
+        for widget in self.disable_widgets:
+            widget.setEnabled(not busy)
 
     @Slot()
     def run(self):
@@ -63,13 +88,13 @@ class DeviceRetriever(QRunnable):
         devices
         """
         devices = []
+        start = time.perf_counter()
+        # Widgets are only touched on the GUI thread
+        background = self.background
+        if not background:
+            self.signals.busy.emit(True)
         try:
-            # Disable widgets
-            if self.label_widget:
-                self.label_widget.setText('Searching for devices...')
-            for widget in self.disable_widgets:
-                widget.setEnabled(False)
-
+            from tplinkcloud import TPLinkDeviceManager
             device_manager = TPLinkDeviceManager(self.settingsManager.value('username'),
                                                  self.settingsManager.value('password'))
             if device_manager._auth_token is not None:
@@ -85,11 +110,6 @@ class DeviceRetriever(QRunnable):
             else:
                 # Invalid username or password
                 self.signals.error.emit({'mode': 'invalid_login_data'})
-            # Enable widgets
-            if self.label_widget:
-                self.label_widget.setText('')
-            for widget in self.disable_widgets:
-                widget.setEnabled(True)
         except:
             # Get Variables
             value, the_traceback = sys.exc_info()[1:]
@@ -100,12 +120,15 @@ class DeviceRetriever(QRunnable):
                                      'message': [str(value), traceback_text]})
             return
         finally:
+            diagnostics.record(DEVICE_DISCOVERY, time.perf_counter() - start)
+            if not background:
+                self.signals.busy.emit(False)
             self.signals.finished.emit(devices)  # Done
             return
 
 
 class Device:
-    def __init__(self, device: hs100.HS100, deviceID: str, deviceName: str):
+    def __init__(self, device: 'hs100.HS100', deviceID: str, deviceName: str):
         # -Variables-
         self._device = device
         self.state = 0
@@ -114,8 +137,8 @@ class Device:
         # Set threads
         self._turn_on = QThread()
         self._turn_off = QThread()
-        self._turn_on.run = self._device.power_on
-        self._turn_off.run = self._device.power_off
+        self._turn_on.run = lambda: self._run_command(self._device.power_on)
+        self._turn_off.run = lambda: self._run_command(self._device.power_off)
         self.refresh()
 
     def refresh(self):
@@ -127,6 +150,15 @@ class Device:
             return
         pass
 
+    def _run_command(self, command):
+        """Run a power command of the plug (on the command thread)"""
+        with diagnostics.measure(DEVICE_COMMAND):
+            try:
+                command()
+            except Exception:
+                metrics.inc('gsm_device_command_failures_total', device=self.deviceName)
+                raise
+
     def turn_on(self):
         """Turn on the device"""
         self._turn_on.start()
@@ -134,3 +166,46 @@ class Device:
     def turn_off(self):
         """Turn off the device"""
         self._turn_off.start()
+
+
+class ParallelPowerOff:
+    """
+    Send the power off command to all devices at once,
+    each on its own daemon thread (a hung plug can not
+    keep the application from exiting)
+
+    Paramaters:
+        devices(list):
+            Devices to turn off
+    """
+
+    def __init__(self, devices: List[Device]):
+        self.devices = devices
+        self.confirmed = set()
+        self._threads = [threading.Thread(target=self._power_off, args=(device,),
+                                          name=f'PowerOff {device.deviceName}', daemon=True)
+                         for device in devices]
+
+    def _power_off(self, device: Device):
+        try:
+            device._run_command(device._device.power_off)
+        except Exception:
+            # Reported as unconfirmed
+            return
+        self.confirmed.add(device.deviceID)
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def wait(self, timeout: float) -> List[Device]:
+        """
+        Wait until all devices confirmed or the timeout passed
+
+        Returns(list):
+            Devices that did not confirm the power off
+        """
+        deadline = time.perf_counter() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.perf_counter()))
+        return [device for device in self.devices if device.deviceID not in self.confirmed]
@@ -0,0 +1,126 @@
+"""
+Profile the running application on demand
+
+A capture runs cProfile on the GUI thread and samples its stack at the
+same time. It writes a .prof file (pstats/snakeviz) and a file of collapsed
+stacks (flamegraph.pl/speedscope) to the data folder
+"""
+from collections import Counter
+import cProfile
+import datetime as dt
+import os
+import sys
+import threading
+import time
+# Code annotation
+from typing import (Tuple, Union)
+
+DEFAULT_DURATION = 60  # Seconds
+SAMPLE_INTERVAL = 0.005  # Seconds
+
+
+class StackSampler:
+    """
+    Background thread counting the stacks of another thread
+
+    Paramaters:
+        thread_id(int):
+            Identifier of the sampled thread
+        interval(float):
+            Seconds between two samples
+    """
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name='StackSampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            # Root first
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def collapsed(self) -> str:
+        """
+        Return the stacks in the collapsed format ('a;b;c count' per line)
+        """
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class LiveProfiler:
+    """
+    Start and stop profile captures of the calling (GUI) thread
+
+    Paramaters:
+        duration(int):
+            Seconds after which a capture should be stopped
+    """
+
+    def __init__(self, duration: int = DEFAULT_DURATION):
+        self.duration = duration
+        self.save_folder: Union[str, None] = None
+        self._profile: Union[cProfile.Profile, None] = None
+        self._sampler: Union[StackSampler, None] = None
+        self._start_date: Union[dt.datetime, None] = None
+        self._start_time = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return self._profile is not None
+
+    def start(self):
+        """
+        Start a capture
+        """
+        if self.is_running:
+            return
+        self._start_date = dt.datetime.now()
+        self._start_time = time.perf_counter()
+        self._sampler = StackSampler(threading.get_ident())
+        self._sampler.start()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self) -> Tuple[str, str]:
+        """
+        Stop the capture and save it
+
+        Returns(tuple):
+            Paths of the .prof file and the collapsed stacks file
+        """
+        assert self.is_running, "No capture running"
+        self._profile.disable()
+        self._sampler.stop()
+        seconds = time.perf_counter() - self._start_time
+        save_folder = self.save_folder if self.save_folder is not None else os.getcwd()
+        os.makedirs(save_folder, exist_ok=True)
+        base_path = os.path.join(save_folder,
+                                 f"profile_{self._start_date.strftime('%Y-%m-%d_%H-%M-%S')}_{seconds:.0f}s")
+        prof_path = base_path + '.prof'
+        collapsed_path = base_path + '.collapsed'
+        self._profile.dump_stats(prof_path)
+        with open(collapsed_path, 'w') as collapsed_file:
+            collapsed_file.write(self._sampler.collapsed())
+        self._profile = None
+        self._sampler = None
+        return prof_path, collapsed_path
+
+
+liveProfiler = LiveProfiler()
@@ -0,0 +1,167 @@
+"""
+Optional HTTP endpoint exposing runtime metrics in the Prometheus text format
+
+Enabled with the environment variable GSM_METRICS_PORT=<port>, served on
+http://<GSM_METRICS_HOST or 127.0.0.1>:<port>/metrics by a background thread
+(see metrics_server, only imported when the endpoint is enabled)
+"""
+# -Root imports-
+from .diagnostics import (diagnostics, REFRESH_TICK, STATION_REFRESH, DEVICE_COMMAND, DEVICE_DISCOVERY, DATA_WRITE)
+# -Other-
+import os
+import threading
+# Code annotation
+from typing import (Dict, Tuple, Union, TYPE_CHECKING)
+if TYPE_CHECKING:
+    from .metrics_server import MetricsServer
+
+PORT_ENV_VAR = 'GSM_METRICS_PORT'
+HOST_ENV_VAR = 'GSM_METRICS_HOST'
+DEFAULT_HOST = '127.0.0.1'
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+
+class MetricsRegistry:
+    """
+    Thread safe store of counters, gauges and histograms
+
+    Nothing is recorded until the registry is enabled
+    """
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        # name -> (type, help text)
+        self._descriptions: Dict[str, Tuple[str, str]] = {}
+        # name -> labels -> value (counters and gauges)
+        # or [bucket counts..., sum, count] (histograms)
+        self._values: Dict[str, Dict[tuple, Union[float, list]]] = {}
+
+    def describe(self, name: str, kind: str, text: str):
+        """
+        Register a metric with its type and help text
+        """
+        self._descriptions[name] = (kind, text)
+        self._values.setdefault(name, {})
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Increase a counter"""
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self._values[name]
+            values[key] = values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """Set a gauge"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._values[name][tuple(sorted(labels.items()))] = value
+
+    def remove(self, name: str, **labels):
+        """Remove the series with these labels (e.g. of a removed station)"""
+        with self._lock:
+            self._values[name].pop(tuple(sorted(labels.items())), None)
+
+    def observe(self, name: str, seconds: float, **labels):
+        """Add a duration to a histogram"""
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self._values[name]
+            if key not in values:
+                values[key] = [0] * len(self.BUCKETS) + [0.0, 0]
+            histogram = values[key]
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    @staticmethod
+    def _labels(labels: tuple, extra: tuple = ()) -> str:
+        labels = labels + extra
+        if not labels:
+            return ''
+        text = ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                        for key, value in labels)
+        return '{%s}' % text
+
+    def render(self) -> str:
+        """
+        Return all metrics in the Prometheus text format
+        """
+        lines = []
+        with self._lock:
+            for name, (kind, text) in self._descriptions.items():
+                lines.append(f'# HELP {name} {text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in self._values[name].items():
+                    if kind != HISTOGRAM:
+                        lines.append(f'{name}{self._labels(labels)} {value}')
+                        continue
+                    for bound, count in zip(self.BUCKETS, value):
+                        lines.append(f'{name}_bucket{self._labels(labels, (("le", bound),))} {count}')
+                    lines.append(f'{name}_bucket{self._labels(labels, (("le", "+Inf"),))} {value[-1]}')
+                    lines.append(f'{name}_sum{self._labels(labels)} {value[-2]}')
+                    lines.append(f'{name}_count{self._labels(labels)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+# -Stations-
+metrics.describe('gsm_station_queued_sessions', GAUGE, 'Sessions in the queue of the station')
+metrics.describe('gsm_station_session_running', GAUGE, 'Whether a session is running on the station (0 or 1)')
+metrics.describe('gsm_station_activated', GAUGE, 'Whether the station is controlled by the application (0 or 1)')
+metrics.describe('gsm_refresh_tick_seconds', HISTOGRAM, 'Duration of a refresh of all stations')
+metrics.describe('gsm_station_refresh_seconds', HISTOGRAM, 'Duration of the refresh of a single station')
+# -Devices-
+metrics.describe('gsm_device_command_seconds', HISTOGRAM, 'Duration of a plug power command')
+metrics.describe('gsm_device_command_failures_total', COUNTER, 'Plug power commands that raised an error')
+metrics.describe('gsm_device_discovery_seconds', HISTOGRAM, 'Duration of a search for plugs')
+# -Persistence-
+metrics.describe('gsm_data_write_seconds', HISTOGRAM, 'Duration of a data file write')
+metrics.describe('gsm_data_written_bytes_total', COUNTER, 'Bytes written to the data file')
+metrics.describe('gsm_data_file_bytes', GAUGE, 'Size of the data file after the last write')
+# Durations recorded by the diagnostics -> histogram
+DIAGNOSTICS_HISTOGRAMS = {
+    REFRESH_TICK: 'gsm_refresh_tick_seconds',
+    STATION_REFRESH: 'gsm_station_refresh_seconds',
+    DEVICE_COMMAND: 'gsm_device_command_seconds',
+    DEVICE_DISCOVERY: 'gsm_device_discovery_seconds',
+    DATA_WRITE: 'gsm_data_write_seconds',
+}
+
+
+def observe_diagnostics(name: str, seconds: float):
+    """
+    Forward a duration recorded by the diagnostics to its histogram
+    """
+    histogram = DIAGNOSTICS_HISTOGRAMS.get(name)
+    if histogram is not None:
+        metrics.observe(histogram, seconds)
+
+
+def start_endpoint() -> Union['MetricsServer', None]:
+    """
+    Start the metrics endpoint if a port is configured
+
+    Returns(MetricsServer or None):
+        The running server
+    """
+    port = os.environ.get(PORT_ENV_VAR)
+    if not port:
+        return None
+    # HTTP server, not imported without a port
+    from .metrics_server import MetricsServer
+    server = MetricsServer(metrics, int(port), os.environ.get(HOST_ENV_VAR, DEFAULT_HOST))
+    metrics.enabled = True
+    diagnostics.observers.append(observe_diagnostics)
+    server.start()
+    return server
@@ -0,0 +1,58 @@
+"""
+HTTP server of the metrics endpoint (see metrics)
+"""
+# -Root imports-
+from .metrics import (MetricsRegistry, DEFAULT_HOST)
+# -Other-
+from http.server import (BaseHTTPRequestHandler, ThreadingHTTPServer)
+import threading
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Do not print every scrape
+        pass
+
+
+class MetricsServer:
+    """
+    HTTP server of the metrics endpoint, running on a daemon thread
+
+    Paramaters:
+        registry(MetricsRegistry):
+            Metrics to serve
+        port(int):
+            Port to listen on (0 picks a free port)
+        host(str):
+            Address to listen on
+    """
+
+    def __init__(self, registry: MetricsRegistry, port: int, host: str = DEFAULT_HOST):
+        handler = type('MetricsRequestHandler', (_MetricsRequestHandler,), {'registry': registry})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='MetricsServer', daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,253 @@
+"""
+Occupancy of the whole venue over time
+
+The start and end of every tracked session of all stations are merged into
+one sorted list of events and swept once, giving the number of busy stations
+as a step function: the times the number changes and the number from each
+of these times on. The step function is kept until a history changes, any
+date range is then read from it with a binary search:
+
+    occupancy.occupancy(histories, start_date, end_date)
+
+Events are encoded as integers (2 * time, +1 for a start), so a plain sort
+puts the ends before the starts of the same second and back to back
+sessions of a station are not counted twice
+"""
+# -Root imports-
+from .core import (Session, to_epoch, from_epoch)
+# -Other-
+from bisect import (bisect_left, bisect_right)
+import datetime as dt
+# Code annotation
+from typing import (Dict, Iterable, List, Tuple, Union)
+
+
+def encode_events(sessions: Iterable[Session]) -> List[int]:
+    """
+    Return the sorted start and end events of the sessions
+    """
+    events = []
+    append = events.append
+    for session in sessions:
+        append(2 * session.start + 1)
+        append(2 * session.end)
+    # Sessions of a station do not overlap, the list is sorted already in most cases
+    events.sort()
+    return events
+
+
+class Occupancy:
+    """Number of busy stations during a time range
+
+    Paramaters:
+        start(int):
+            Start of the range (seconds since the EPOCH)
+        end(int):
+            End of the range (seconds since the EPOCH)
+        times(List[int]):
+            Times the number changes, the first one is the start
+        counts(List[int]):
+            Number of busy stations from each time on
+        capacity(int):
+            Number of stations
+    """
+    __slots__ = ('start', 'end', 'times', 'counts', 'capacity')
+
+    def __init__(self, start: int, end: int, times: List[int], counts: List[int], capacity: int):
+        self.start = start
+        self.end = end
+        self.times = times
+        self.counts = counts
+        self.capacity = capacity
+
+    def steps(self) -> List[Tuple[dt.datetime, dt.datetime, int]]:
+        """
+        Returns(list):
+            (start date, end date, number of busy stations) of every step
+        """
+        ends = self.times[1:] + [self.end]
+        return [(from_epoch(start), from_epoch(end), count)
+                for start, end, count in zip(self.times, ends, self.counts)]
+
+    def value_at(self, date: dt.datetime) -> int:
+        """Return the number of busy stations at the date"""
+        seconds = to_epoch(date)
+        if not self.start <= seconds < self.end:
+            raise ValueError('Date outside of the range', date)
+        return self.counts[bisect_right(self.times, seconds) - 1]
+
+    @property
+    def peak(self) -> Tuple[int, Union[dt.datetime, None]]:
+        """
+        Returns(tuple):
+            Highest number of busy stations and when it was first reached
+        """
+        if not self.counts:
+            return 0, None
+        peak = max(self.counts)
+        return peak, from_epoch(self.times[self.counts.index(peak)])
+
+    def durations(self) -> Dict[int, int]:
+        """
+        Returns(dict):
+            Seconds spent at each number of busy stations
+        """
+        durations: Dict[int, int] = {}
+        ends = self.times[1:] + [self.end]
+        for start, end, count in zip(self.times, ends, self.counts):
+            durations[count] = durations.get(count, 0) + end - start
+        return durations
+
+    def average(self) -> float:
+        """Return the average number of busy stations"""
+        if self.end <= self.start:
+            return 0.0
+        return sum(count * seconds for count, seconds in self.durations().items()) / (self.end - self.start)
+
+    def fully_booked(self, minimum: int = 0) -> List[Tuple[dt.datetime, dt.datetime]]:
+        """
+        Return the periods in which all stations were busy
+
+        Paramaters:
+            minimum(int):
+                Shortest period in seconds that is returned
+        """
+        periods = []
+        if self.capacity <= 0:
+            return periods
+        period_start = None
+        for time, count in zip(self.times + [self.end], self.counts + [0]):
+            if count >= self.capacity:
+                if period_start is None:
+                    period_start = time
+            elif period_start is not None:
+                if time - period_start >= minimum:
+                    periods.append((from_epoch(period_start), from_epoch(time)))
+                period_start = None
+        return periods
+
+    def buckets(self, n: int) -> List[int]:
+        """
+        Return the highest number of busy stations in each of
+        n equally long parts of the range (e.g. one per pixel of a chart)
+        """
+        values = [0] * n
+        length = self.end - self.start
+        if n <= 0 or length <= 0:
+            return values
+        ends = self.times[1:] + [self.end]
+        for start, end, count in zip(self.times, ends, self.counts):
+            if count == 0 or end <= start:
+                continue
+            first = (start - self.start) * n // length
+            last = min(n - 1, (end - 1 - self.start) * n // length)
+            for i in range(first, last + 1):
+                if values[i] < count:
+                    values[i] = count
+        return values
+
+
+class OccupancyTimeline:
+    """
+    Step function of the number of busy stations of all tracked sessions
+
+    The events are kept per device, a device marked by invalidate_device
+    is encoded again and the step function is only rebuilt after a change.
+    version tells whether a cached result is still valid without any sweep
+    """
+
+    def __init__(self):
+        # deviceID -> sorted events
+        self._events: Dict[str, List[int]] = {}
+        self._outdated: set = set()
+        # Step function: the number of busy stations from times[i] on is counts[i]
+        self._times: List[int] = []
+        self._counts: List[int] = []
+        self._changed = True
+        # Increased whenever a history changed or a new one was added
+        self.version = 0
+
+    def invalidate_device(self, deviceID: str):
+        """Mark the history of the device as changed"""
+        self._outdated.add(deviceID)
+        self.version += 1
+
+    def forget(self, deviceID: str):
+        """Drop the events of the device"""
+        if self._events.pop(deviceID, None) is not None:
+            self._changed = True
+            self.version += 1
+        self._outdated.discard(deviceID)
+
+    def _update(self, histories: Dict[str, List[Session]]):
+        """
+        Encode the new and changed histories and rebuild the step function
+        """
+        for deviceID in list(self._events):
+            if deviceID not in histories:
+                self.forget(deviceID)
+        for deviceID, sessions in histories.items():
+            if deviceID in self._outdated or deviceID not in self._events:
+                if deviceID not in self._events:
+                    self.version += 1
+                self._events[deviceID] = encode_events(sessions)
+                self._changed = True
+        self._outdated.clear()
+        if not self._changed:
+            return
+        # One sorted pass over the events of all devices
+        # (Sorting the concatenated sorted lists only merges them)
+        events = [event for device_events in self._events.values() for event in device_events]
+        events.sort()
+        times: List[int] = []
+        counts: List[int] = []
+        count = 0
+        last_count = 0
+        last_time = None
+        for event in events:
+            time = event >> 1
+            if time != last_time:
+                # All events of the last second are counted
+                if count != last_count:
+                    times.append(last_time)
+                    counts.append(count)
+                    last_count = count
+                last_time = time
+            count += 1 if event & 1 else -1
+        if count != last_count:
+            times.append(last_time)
+            counts.append(count)
+        self._times = times
+        self._counts = counts
+        self._changed = False
+
+    def occupancy(self, histories: Dict[str, List[Session]], start_date: dt.datetime, end_date: dt.datetime,
+                  capacity: Union[int, None] = None) -> Occupancy:
+        """
+        Return the number of busy stations between the dates
+
+        Paramaters:
+            histories(dict):
+                Tracked sessions by deviceID
+            start_date(dt.datetime):
+                Start of the range
+            end_date(dt.datetime):
+                End of the range
+            capacity(int or None):
+                Number of stations, the number of histories if None
+        """
+        self._update(histories)
+        start, end = to_epoch(start_date), to_epoch(end_date)
+        if end < start:
+            raise ValueError('End before the start', start_date, end_date)
+        # Number at the start of the range
+        i = bisect_right(self._times, start)
+        times = [start]
+        counts = [self._counts[i - 1] if i > 0 else 0]
+        j = bisect_left(self._times, end, lo=i)
+        times.extend(self._times[i:j])
+        counts.extend(self._counts[i:j])
+        return Occupancy(start, end, times, counts, len(histories) if capacity is None else capacity)
+
+
+occupancy = OccupancyTimeline()
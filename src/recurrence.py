@@ -0,0 +1,304 @@
+"""
+Recurring reservations (weekly leagues, regulars)
+
+A rule describes its occurrences like an iCalendar RRULE
+(FREQ=DAILY/WEEKLY, INTERVAL, BYDAY, COUNT, UNTIL). Occurrences are
+calculated on demand for a time window and only the ones inside the
+look-ahead window of a station are put into its queue
+"""
+# -Root imports-
+from .core import (Session, to_epoch, from_epoch, to_seconds, DAY)
+# -Other-
+from itertools import count
+import datetime as dt
+# Code annotation
+from typing import (Dict, Iterable, Iterator, List, Set, Tuple, Union)
+
+DAILY = 'DAILY'
+WEEKLY = 'WEEKLY'
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+# 1970-01-01 (EPOCH) was a Thursday
+EPOCH_WEEKDAY = 3
+# Occurrences are put into the queue this far ahead
+LOOKAHEAD = dt.timedelta(days=7)
+
+
+def weekday(seconds: int) -> int:
+    """Return the weekday (Monday is 0) of the seconds since the EPOCH"""
+    return (seconds // DAY + EPOCH_WEEKDAY) % 7
+
+
+class RecurrenceRule:
+    """Recurring session of a customer
+
+    Paramaters:
+        customerName(str):
+            Name of the customer
+        start_date(dt.datetime):
+            Start of the first occurrence
+        duration(dt.time, dt.timedelta or int):
+            Time length of every occurrence
+        freq(str):
+            DAILY or WEEKLY
+        interval(int):
+            Every interval days/weeks
+        byweekday(Iterable[int] or None):
+            Weekdays of a weekly rule (Monday is 0), the weekday of the start date if None
+        occurrence_count(int or None):
+            Number of occurrences, unlimited if None
+        until(dt.datetime or None):
+            Last possible start of an occurrence, unlimited if None
+        exdates(Iterable[int]):
+            Starts (seconds since the EPOCH) of cancelled occurrences
+    """
+    __slots__ = ('ruleID', 'customerName', 'start', 'length', 'freq', 'interval', 'byweekday',
+                 'occurrence_count', 'until', 'exdates')
+    _id_counter = count()
+
+    def __init__(self, customerName: str, start_date: dt.datetime, duration: Union[dt.time, dt.timedelta, int],
+                 freq: str = WEEKLY, interval: int = 1, byweekday: Union[Iterable[int], None] = None,
+                 occurrence_count: Union[int, None] = None, until: Union[dt.datetime, None] = None,
+                 exdates: Iterable[int] = ()):
+        if freq not in (DAILY, WEEKLY):
+            raise ValueError('Unsupported frequency', freq)
+        if interval < 1:
+            raise ValueError('Interval has to be positive', interval)
+        self.ruleID = next(self._id_counter)
+        self.customerName = customerName
+        self.start = to_epoch(start_date)
+        self.length = to_seconds(duration)
+        self.freq = freq
+        self.interval = interval
+        self.byweekday: Tuple[int, ...] = tuple(sorted(set(byweekday))) if byweekday else (weekday(self.start),)
+        self.occurrence_count = occurrence_count
+        self.until = to_epoch(until) if until is not None else None
+        self.exdates: Set[int] = set(exdates)
+
+    @property
+    def start_date(self) -> dt.datetime:
+        return from_epoch(self.start)
+
+    def _candidates(self, first_day: int) -> Iterator[Tuple[int, int]]:
+        """
+        Yield (ordinal, start) of the occurrences from the day on
+        (the ordinal counts all occurrences since the first one)
+        """
+        start_day, time_of_day = divmod(self.start, DAY)
+        if self.freq == DAILY:
+            k = max(0, -(-(first_day - start_day) // self.interval))
+            while True:
+                yield k, (start_day + k * self.interval) * DAY + time_of_day
+                k += 1
+        # -Weekly-
+        week_start = start_day - weekday(self.start)
+        # Occurrences in the week of the first occurrence (before its start they do not exist)
+        first_week = [wd for wd in self.byweekday if week_start + wd >= start_day]
+        per_week = len(self.byweekday)
+        n = max(0, (first_day - week_start) // (7 * self.interval))
+        while True:
+            days = first_week if n == 0 else self.byweekday
+            ordinal = 0 if n == 0 else len(first_week) + (n - 1) * per_week
+            for wd in days:
+                day = week_start + n * 7 * self.interval + wd
+                if day >= first_day:
+                    yield ordinal, day * DAY + time_of_day
+                ordinal += 1
+            n += 1
+
+    def occurrences(self, window_start: int, window_end: int) -> Iterator[int]:
+        """
+        Yield the starts (seconds since the EPOCH) of the occurrences
+        starting inside the window, cancelled occurrences are left out
+        (Calculated without going through the earlier occurrences)
+        """
+        window_start = max(window_start, self.start)
+        for ordinal, start in self._candidates(window_start // DAY):
+            if (start >= window_end or
+                    (self.occurrence_count is not None and ordinal >= self.occurrence_count) or
+                    (self.until is not None and start > self.until)):
+                return
+            if start >= window_start and start not in self.exdates:
+                yield start
+
+    def create_session(self, start: int) -> Session:
+        """Return the session of the occurrence"""
+        return Session.from_epoch(self.customerName, start, self.length)
+
+    # -RRULE text-
+    def to_rrule(self) -> str:
+        """
+        Return the rule as RRULE text, e.g. 'FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE'
+        """
+        parts = [f'FREQ={self.freq}', f'INTERVAL={self.interval}']
+        if self.freq == WEEKLY:
+            parts.append('BYDAY=' + ','.join(WEEKDAYS[wd] for wd in self.byweekday))
+        if self.occurrence_count is not None:
+            parts.append(f'COUNT={self.occurrence_count}')
+        if self.until is not None:
+            parts.append('UNTIL=' + from_epoch(self.until).strftime('%Y%m%dT%H%M%S'))
+        return ';'.join(parts)
+
+    @classmethod
+    def from_rrule(cls, rrule: str, customerName: str, start_date: dt.datetime,
+                   duration: Union[dt.time, dt.timedelta, int], exdates: Iterable[int] = ()) -> 'RecurrenceRule':
+        """
+        Create a rule of RRULE text (FREQ, INTERVAL, BYDAY, COUNT and UNTIL are supported)
+        Raises ValueError for unsupported text
+        """
+        values: Dict[str, str] = {}
+        rrule = rrule.strip()
+        if rrule.upper().startswith('RRULE:'):
+            rrule = rrule[len('RRULE:'):]
+        for part in rrule.split(';'):
+            if part:
+                key, _, value = part.partition('=')
+                values[key.strip().upper()] = value.strip().upper()
+        unknown = set(values) - {'FREQ', 'INTERVAL', 'BYDAY', 'COUNT', 'UNTIL'}
+        if unknown:
+            raise ValueError('Unsupported RRULE parts', sorted(unknown))
+        byweekday = [WEEKDAYS.index(day) for day in values['BYDAY'].split(',')] if 'BYDAY' in values else None
+        until = None
+        if 'UNTIL' in values:
+            text = values['UNTIL'].rstrip('Z')
+            until = dt.datetime.strptime(text, '%Y%m%dT%H%M%S' if 'T' in text else '%Y%m%d')
+            if 'T' not in text:
+                # Whole last day
+                until += dt.timedelta(days=1, seconds=-1)
+        return cls(customerName=customerName,
+                   start_date=start_date,
+                   duration=duration,
+                   freq=values.get('FREQ', WEEKLY),
+                   interval=int(values.get('INTERVAL', 1)),
+                   byweekday=byweekday,
+                   occurrence_count=int(values['COUNT']) if 'COUNT' in values else None,
+                   until=until,
+                   exdates=exdates)
+
+    # -Saved data-
+    def to_dict(self) -> dict:
+        return {
+            'customerName': self.customerName,
+            'start': self.start,
+            'length': self.length,
+            'rrule': self.to_rrule(),
+            'exdates': sorted(self.exdates),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'RecurrenceRule':
+        return cls.from_rrule(data['rrule'],
+                              customerName=data['customerName'],
+                              start_date=from_epoch(data['start']),
+                              duration=data['length'],
+                              exdates=data.get('exdates', ()))
+
+
+class RecurrenceSchedule:
+    """Recurrence rules of a station and the occurrences put into its queue
+
+    The occurrences starting before the horizon are expanded already,
+    the horizon is moved forward a day at a time, so the rules are only
+    looked at once a day (and the queue only holds the look-ahead window)
+
+    Paramaters:
+        rules(Iterable[RecurrenceRule]):
+            Rules of the station
+        lookahead(dt.timedelta):
+            How far ahead occurrences are put into the queue
+    """
+
+    def __init__(self, rules: Iterable[RecurrenceRule] = (), lookahead: dt.timedelta = LOOKAHEAD):
+        self.rules: List[RecurrenceRule] = list(rules)
+        self.lookahead = to_seconds(lookahead)
+        self.horizon: Union[int, None] = None
+        # sessionID -> (rule, start) of the occurrences put into the queue
+        self.occurrences: Dict[int, Tuple[RecurrenceRule, int]] = {}
+
+    def needs_expansion(self, now_seconds: int) -> bool:
+        return self.horizon is None or now_seconds + self.lookahead > self.horizon
+
+    def _expand(self, rules: Iterable[RecurrenceRule], window_start: int, window_end: int) -> List[Session]:
+        sessions = []
+        for rule in rules:
+            # Occurrences still running count as well
+            for start in rule.occurrences(window_start - rule.length + 1, window_end):
+                session = rule.create_session(start)
+                self.occurrences[session.sessionID] = (rule, start)
+                sessions.append(session)
+        return sessions
+
+    def expand(self, now_seconds: int) -> List[Session]:
+        """
+        Move the horizon forward
+
+        Returns(list):
+            Sessions of the occurrences between the old and the new horizon
+        """
+        # Finished occurrences can not be cancelled anymore
+        self.occurrences = {sessionID: (rule, start) for sessionID, (rule, start) in self.occurrences.items()
+                            if start + rule.length > now_seconds}
+        window_start = now_seconds if self.horizon is None else max(self.horizon, now_seconds)
+        # Rounded up to the next day
+        self.horizon = -(-(now_seconds + self.lookahead) // DAY) * DAY
+        if window_start >= self.horizon:
+            return []
+        return self._expand(self.rules, window_start, self.horizon)
+
+    def add(self, rule: RecurrenceRule, now_seconds: int) -> List[Session]:
+        """
+        Add a rule
+
+        Returns(list):
+            Sessions of its occurrences before the horizon
+        """
+        self.rules.append(rule)
+        if self.horizon is None:
+            return []
+        return self._expand((rule,), now_seconds, self.horizon)
+
+    def remove(self, rule: RecurrenceRule) -> List[int]:
+        """
+        Remove a rule
+
+        Returns(list):
+            sessionIDs of its occurrences put into the queue
+        """
+        self.rules.remove(rule)
+        sessionIDs = [sessionID for sessionID, (occurrence_rule, _) in self.occurrences.items()
+                      if occurrence_rule is rule]
+        for sessionID in sessionIDs:
+            del self.occurrences[sessionID]
+        return sessionIDs
+
+    def rule_of(self, session: Session) -> Union[RecurrenceRule, None]:
+        """Return the rule of the occurrence, None for other sessions"""
+        occurrence = self.occurrences.get(session.sessionID)
+        return occurrence[0] if occurrence is not None else None
+
+    def cancel(self, sessions: Iterable[Session]):
+        """
+        Cancel the occurrences of the sessions removed by the user,
+        so they are not put into the queue again (e.g. after a restart)
+        """
+        for session in sessions:
+            occurrence = self.occurrences.pop(session.sessionID, None)
+            if occurrence is not None:
+                rule, start = occurrence
+                rule.exdates.add(start)
+
+    def to_data(self, now_seconds: Union[int, None] = None) -> List[dict]:
+        """
+        Return the rules as saved data, cancelled occurrences
+        before the current time are left out
+        """
+        data = []
+        for rule in self.rules:
+            rule_data = rule.to_dict()
+            if now_seconds is not None:
+                rule_data['exdates'] = [start for start in rule_data['exdates'] if start >= now_seconds]
+            data.append(rule_data)
+        return data
+
+    @classmethod
+    def from_data(cls, data: Iterable[dict]) -> 'RecurrenceSchedule':
+        return cls(RecurrenceRule.from_dict(rule_data) for rule_data in data)
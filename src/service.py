@@ -0,0 +1,412 @@
+"""
+Headless station service
+
+Runs the stations without any window: the session queues, the history,
+the recurring sessions and the plugs of all stations. Used by the daemon
+(daemon.py), which serves it on a local HTTP/JSON API (see api.py).
+
+The service is not thread safe, all methods are called from the thread
+running the event loop. Only the plug commands run on other threads
+(run_command), so a slow plug never holds up the ticks or the requests
+"""
+# -Root imports-
+from .clock import clock as app_clock
+from .diagnostics import (diagnostics, DEVICE_COMMAND)
+from .metrics import metrics
+from .core import (Session, SessionHistory, StationCore, to_epoch)
+from .recurrence import (RecurrenceRule, RecurrenceSchedule)
+from .billing import revenue
+from .occupancy import occupancy
+# -Other-
+import datetime as dt
+# Code annotation
+from typing import (Callable, Dict, Iterable, List, Tuple, Union)
+
+
+class ConflictError(Exception):
+    """Raised for new sessions overlapping queued sessions (unless they replace them)
+
+    Paramaters:
+        conflicting(List[Session]):
+            Queued sessions overlapping the new sessions
+        accepted(List[Session]):
+            New sessions that would be added (imports)
+        rejected(List[Session]):
+            New sessions that can not be added (imports)
+    """
+
+    def __init__(self, conflicting: List[Session], accepted: List[Session] = (), rejected: List[Session] = ()):
+        super().__init__(f'{len(conflicting)} conflicting session(s)')
+        self.conflicting = list(conflicting)
+        self.accepted = list(accepted)
+        self.rejected = list(rejected)
+
+
+class ServiceStation:
+    """Station of the service
+
+    Paramaters:
+        stationID(int):
+            ID of the station
+        deviceID(str):
+            ID of the plug
+        deviceName(str):
+            Name of the plug
+        plug:
+            Plug with power_on and power_off methods (e.g. tplinkcloud HS100)
+        tracked_sessions(Iterable[Session]):
+            Saved history of the plug
+        recurrences(RecurrenceSchedule or None):
+            Saved recurring sessions of the plug
+        queued_sessions(Iterable[Session]):
+            Saved queue of the plug
+    """
+
+    def __init__(self, stationID: int, deviceID: str, deviceName: str, plug,
+                 tracked_sessions: Iterable[Session] = (), recurrences: Union[RecurrenceSchedule, None] = None,
+                 queued_sessions: Iterable[Session] = (), clock=None):
+        self.stationID = stationID
+        self.deviceID = deviceID
+        self.deviceName = deviceName
+        self.plug = plug
+        self.core = StationCore(tracked_sessions, clock=clock)
+        if recurrences is not None:
+            self.core.recurrences = recurrences
+        self.core.restore_sessions(queued_sessions)
+        # Last power state sent to the plug (None = unknown)
+        self.power: Union[bool, None] = None
+        # Sessions in the order they were added to the history,
+        # clients replay them from their last position on
+        self.history_log: List[Session] = list(self.core.history.tracked_sessions)
+        self.core.history.listeners.append(self._history_added)
+
+    def _history_added(self, session: Session, removed_sessions: List[Session]):
+        self.history_log.append(session)
+        revenue.invalidate(self.deviceID, [session] + removed_sessions)
+        occupancy.invalidate_device(self.deviceID)
+
+    @property
+    def tracked_sessions(self) -> List[Session]:
+        return self.core.history.tracked_sessions
+
+    def running_session(self) -> Union[Session, None]:
+        return self.core.running_session()
+
+
+class StationService:
+    """
+    Stations of all plugs, run without a display
+
+    Paramaters:
+        run_command(callable or None):
+            Called with a function sending a plug command, runs it
+            on another thread (e.g. an executor of the event loop).
+            Without it the commands run at once
+        clock(Clock or None):
+            Source of the current time, the application clock if None
+    """
+
+    def __init__(self, run_command: Union[Callable[[Callable[[], None]], None], None] = None, clock=None):
+        self.run_command = run_command if run_command is not None else (lambda command: command())
+        self.clock = app_clock if clock is None else clock
+        # Key: stationID (kept while the plug is found)
+        self.stations: Dict[int, ServiceStation] = {}
+        self.deviceID_to_stationID: Dict[str, int] = {}
+        # Saved data of the plugs that are not found (kept for when they reappear)
+        self.tracked_sessions: Dict[str, List[Session]] = {}
+        self.recurring_sessions: Dict[str, list] = {}
+        self.queued_sessions: Dict[str, List[Session]] = {}
+        # Set whenever the data to save changed
+        self.changed = False
+
+    # -Saved data-
+    def load(self, data: dict):
+        """
+        Take the histories, recurring sessions and queues of the saved data
+        """
+        self.tracked_sessions = dict(data.get('tracked_sessions', {}))
+        self.recurring_sessions = dict(data.get('recurring_sessions', {}))
+        self.queued_sessions = dict(data.get('queued_sessions', {}))
+
+    def snapshot(self) -> dict:
+        """
+        Return the histories, recurring sessions and queues to save
+        (The lists are copies, they can be written on another thread)
+        """
+        tracked_sessions = {deviceID: list(sessions) for deviceID, sessions in self.tracked_sessions.items()}
+        recurring_sessions = dict(self.recurring_sessions)
+        queued_sessions = {deviceID: list(sessions) for deviceID, sessions in self.queued_sessions.items()}
+        now_seconds = to_epoch(self.clock.now())
+        for station in self.stations.values():
+            tracked_sessions[station.deviceID] = list(station.tracked_sessions)
+            recurring_sessions[station.deviceID] = station.core.recurrences.to_data(now_seconds)
+            queued_sessions[station.deviceID] = station.core.booked_sessions()
+        self.changed = False
+        return {'tracked_sessions': tracked_sessions, 'recurring_sessions': recurring_sessions,
+                'queued_sessions': queued_sessions}
+
+    # -Plugs-
+    def set_plugs(self, plugs: Iterable[Tuple[str, str, object]]):
+        """
+        Add the stations of new plugs and remove the stations of plugs that went away
+        The stationIDs of the remaining stations stay the same, new plugs
+        get the lowest free stationIDs (in the order of the plug names)
+
+        Paramaters:
+            plugs(Iterable):
+                (deviceID, deviceName, plug) of the found plugs
+        """
+        found = {deviceID: (deviceName, plug) for deviceID, deviceName, plug in plugs}
+        # -Removed plugs-
+        for deviceID in [deviceID for deviceID in self.deviceID_to_stationID if deviceID not in found]:
+            station = self.stations.pop(self.deviceID_to_stationID.pop(deviceID))
+            self.tracked_sessions[deviceID] = station.tracked_sessions
+            self.recurring_sessions[deviceID] = station.core.recurrences.to_data(to_epoch(self.clock.now()))
+            self.queued_sessions[deviceID] = station.core.booked_sessions()
+            revenue.forget(deviceID)
+            self.changed = True
+        # -Found plugs-
+        for deviceID, (deviceName, plug) in sorted(found.items(), key=lambda item: (item[1][0], item[0])):
+            stationID = self.deviceID_to_stationID.get(deviceID)
+            if stationID is not None:
+                station = self.stations[stationID]
+                station.deviceName = deviceName
+                station.plug = plug
+                continue
+            stationID = min(set(range(len(self.stations) + 1)) - set(self.stations))
+            self.stations[stationID] = ServiceStation(
+                stationID, deviceID, deviceName, plug,
+                tracked_sessions=self.tracked_sessions.pop(deviceID, []),
+                recurrences=RecurrenceSchedule.from_data(self.recurring_sessions.pop(deviceID, [])),
+                queued_sessions=self.queued_sessions.pop(deviceID, []),
+                clock=self.clock)
+            self.deviceID_to_stationID[deviceID] = stationID
+
+    def station(self, stationID: int) -> ServiceStation:
+        """
+        Return the station
+        Raises KeyError if there is no station with that stationID
+        """
+        try:
+            return self.stations[stationID]
+        except KeyError:
+            raise KeyError('No station with id', stationID) from None
+
+    def _switch(self, station: ServiceStation, on: bool):
+        """
+        Send the power command to the plug of the station
+        (Only if the state changed, a failed command is sent again on the next tick)
+        """
+        if station.power == on or station.plug is None:
+            return
+        station.power = on
+        plug = station.plug
+
+        def command():
+            with diagnostics.measure(DEVICE_COMMAND):
+                try:
+                    plug.power_on() if on else plug.power_off()
+                except Exception as e:
+                    metrics.inc('gsm_device_command_failures_total', device=station.deviceName)
+                    diagnostics.log(f'Plug command of {station.deviceName} failed: {e!r}')
+                    station.power = None
+        self.run_command(command)
+
+    def tick(self, now: Union[dt.datetime, None] = None):
+        """
+        Move the finished sessions to the histories and switch the plugs
+        """
+        now = self.clock.now() if now is None else now
+        for station in self.stations.values():
+            history_length = len(station.history_log)
+            running_session = station.core.update_sessions(now=now)
+            if len(station.history_log) != history_length:
+                self.changed = True
+            if running_session is not None:
+                self._switch(station, True)
+            elif station.core.is_activated:
+                self._switch(station, False)
+
+    def power_off_all(self):
+        """Turn off all plugs (on shutdown)"""
+        for station in self.stations.values():
+            station.power = None
+            self._switch(station, False)
+
+    # -Stations-
+    def set_activated(self, stationID: int, value: bool):
+        """
+        Activate or deactivate the station, deactivating closes
+        the running session and clears the queue
+        """
+        station = self.station(stationID)
+        if value == station.core.is_activated:
+            return
+        if value:
+            station.core.is_activated = True
+        else:
+            station.core.deactivate()
+            self._switch(station, False)
+            self.changed = True
+        self.tick()
+
+    # -Sessions-
+    @staticmethod
+    def _confirm(replace: bool) -> Callable[[Session, List[Session]], bool]:
+        """
+        Confirm callback of the core: conflicting sessions
+        are deleted if replace is set, otherwise ConflictError is raised
+        """
+        def confirm(new_session: Session, conflicting_sessions: List[Session]) -> bool:
+            if not replace:
+                raise ConflictError(conflicting_sessions)
+            return True
+        return confirm
+
+    def add_session(self, stationID: int, customerName: str, start_date: Union[dt.datetime, None],
+                    duration: Union[dt.timedelta, int], replace: bool = False) -> Session:
+        """
+        Add a session to the queue of the station
+        Raises ConflictError if it overlaps queued sessions and replace is not set
+
+        Paramaters:
+            start_date(dt.datetime or None):
+                If None, the next free start from now on
+            replace(bool):
+                Delete the conflicting queued sessions
+
+        Returns(Session):
+            The added session
+        """
+        core = self.station(stationID).core
+        ids = {session.sessionID for session in core.sessions}
+        core.add_session(customerName=customerName, start_date=start_date, duration=duration,
+                         confirm=self._confirm(replace))
+        # Taken before the tick, a session that is already over goes to the history
+        session = next(session for session in core.sessions if session.sessionID not in ids)
+        self.changed = True
+        self.tick()
+        return session
+
+    def add_sessions(self, stationID: int, sessions: List[Session],
+                     replace: bool = False) -> Tuple[List[Session], List[Session]]:
+        """
+        Add many sessions at once (see StationCore.add_sessions)
+        Raises ConflictError if they overlap queued sessions and replace is not set
+
+        Returns(tuple):
+            Added and rejected sessions
+        """
+        def confirm(accepted: List[Session], conflicting: List[Session], rejected: List[Session]) -> bool:
+            if conflicting and not replace:
+                raise ConflictError(conflicting, accepted, rejected)
+            return True
+        added, rejected = self.station(stationID).core.add_sessions(sessions, confirm=confirm)
+        self.changed = True
+        self.tick()
+        return added, rejected
+
+    def replace_session(self, stationID: int, sessionID: int, replace: bool = False, **changes) -> Session:
+        """
+        Change a queued session
+        Raises KeyError if the session is not queued, ConflictError if
+        the changed session overlaps queued sessions and replace is not set
+
+        Paramaters:
+            **changes:
+                new_customerName, new_start_date, new_end_date and/or
+                new_duration (see StationCore.replace_session)
+        Returns(Session):
+            The changed session
+        """
+        core = self.station(stationID).core
+        core.replace_session(sessionID, confirm=self._confirm(replace), **changes)
+        session = core.find_session(sessionID)
+        self.changed = True
+        self.tick()
+        return session
+
+    def delete_session(self, stationID: int, sessionID: int):
+        """
+        Delete a queued session, a running session is tracked until now
+        Raises KeyError if the session is not queued
+        """
+        core = self.station(stationID).core
+        session = core.find_session(sessionID)
+        core.delete_sessions([session], track=None)
+        # Deleted occurrences are not queued again
+        core.recurrences.cancel([session])
+        self.changed = True
+        self.tick()
+
+    def delete_sessions(self, stationID: int, sessionIDs: Iterable[int]) -> List[int]:
+        """
+        Delete many queued sessions at once, a running session is tracked until now
+        (Sessions that are not queued any more are skipped)
+
+        Returns(list):
+            sessionIDs of the deleted sessions
+        """
+        core = self.station(stationID).core
+        sessionIDs = set(sessionIDs)
+        sessions = [session for session in core.sessions if session.sessionID in sessionIDs]
+        if sessions:
+            core.delete_sessions(sessions, track=None)
+            core.recurrences.cancel(sessions)
+            self.changed = True
+            self.tick()
+        return [session.sessionID for session in sessions]
+
+    def add_recurrence(self, stationID: int, customerName: str, start_date: dt.datetime,
+                       duration: Union[dt.timedelta, int], rrule: str,
+                       replace: bool = False) -> Tuple[RecurrenceRule, List[Session], List[Session]]:
+        """
+        Add a recurring session
+        Raises ConflictError if its first occurrence overlaps queued sessions and replace is not set
+        (Later occurrences overlapping queued sessions are skipped)
+
+        Returns(tuple):
+            The rule, its queued occurrences and its skipped occurrences
+        """
+        core = self.station(stationID).core
+        rule = RecurrenceRule.from_rrule(rrule, customerName=customerName, start_date=start_date, duration=duration)
+        first_session = rule.create_session(rule.start)
+        conflicting_sessions = core.conflicting_sessions(first_session)
+        if conflicting_sessions:
+            self._confirm(replace)(first_session, conflicting_sessions)
+            core.delete_sessions(conflicting_sessions, track=None)
+            core.recurrences.cancel(conflicting_sessions)
+        queued, skipped = core.add_recurrence(rule)
+        self.changed = True
+        self.tick()
+        return rule, queued, skipped
+
+    def remove_recurrence(self, stationID: int, ruleID: int):
+        """
+        Delete a recurring session and its queued occurrences (a running one is kept)
+        Raises KeyError if the station has no rule with that ruleID
+        """
+        core = self.station(stationID).core
+        for rule in core.recurrences.rules:
+            if rule.ruleID == ruleID:
+                break
+        else:
+            raise KeyError('No recurring session with id', ruleID)
+        core.remove_recurrence(rule)
+        self.changed = True
+        self.tick()
+
+    # -Stats-
+    def stats(self, stationID: int) -> dict:
+        """
+        Return the stats of the history of the station
+        (The times are dt.timedelta, see SessionHistory.calculate_stats)
+        """
+        station = self.station(stationID)
+        stats = SessionHistory.calculate_stats(station.tracked_sessions)
+        stats['revenue'], stats['tiers'] = revenue.total(station.deviceID, station.tracked_sessions)
+        return stats
+
+    def histories(self) -> Dict[str, List[Session]]:
+        """Return the tracked sessions by deviceID of all stations"""
+        return {station.deviceID: station.tracked_sessions for station in self.stations.values()}
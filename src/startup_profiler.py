@@ -0,0 +1,101 @@
+"""
+Measure the wall time of the startup phases
+
+Enabled with the environment variable GSM_PROFILE_STARTUP=1
+or the command line flag --profile-startup
+"""
+from contextlib import contextmanager
+import datetime as dt
+import os
+import sys
+import time
+# Code annotation
+from typing import (Dict, List, Union)
+
+ENV_VAR = 'GSM_PROFILE_STARTUP'
+CLI_FLAG = '--profile-startup'
+LOG_FILE = 'startup_profile.log'
+
+
+class StartupProfiler:
+    """
+    Record the duration of named startup phases
+
+    The report is printed (and appended to the log file in
+    log_folder) once all milestones have been reached
+
+    Paramaters:
+        enabled(bool):
+            Whether to record anything
+    """
+    MILESTONES = ('first paint', 'first _update_stations')
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.start_time = time.perf_counter()
+        self.log_folder: Union[str, None] = None
+        self.finished = False
+        # [depth, name, seconds]
+        self.phases: List[list] = []
+        # Milestone -> seconds since start
+        self.milestones: Dict[str, float] = {}
+        self._depth = 0
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Measure the wall time of the code run inside this context
+        Phases can be nested
+        """
+        if not self.enabled or self.finished:
+            yield
+            return
+        phase = [self._depth, name, None]
+        self.phases.append(phase)
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            phase[2] = time.perf_counter() - start
+
+    def milestone(self, name: str):
+        """
+        Record the time since start at which a milestone was
+        reached for the first time
+        """
+        if not self.enabled or self.finished or name in self.milestones:
+            return
+        self.milestones[name] = time.perf_counter() - self.start_time
+        if all(milestone in self.milestones for milestone in self.MILESTONES):
+            self.finish()
+
+    def report(self) -> str:
+        """
+        Return the recorded times as text
+        """
+        lines = [f"Startup profile ({dt.datetime.now().strftime('%d.%m.%Y %H:%M:%S')})"]
+        for depth, name, seconds in self.phases:
+            duration = 'unfinished' if seconds is None else f'{seconds * 1000:9.1f} ms'
+            lines.append(f"  {'  ' * depth}{name:<{40 - 2 * depth}} {duration}")
+        for name, seconds in sorted(self.milestones.items(), key=lambda item: item[1]):
+            lines.append(f"  {name + ' after':<40} {seconds * 1000:9.1f} ms")
+        return '\n'.join(lines)
+
+    def finish(self):
+        """
+        Stop recording and output the report
+        """
+        if not self.enabled or self.finished:
+            return
+        self.finished = True
+        text = self.report()
+        print(text)
+        if self.log_folder is not None:
+            os.makedirs(self.log_folder, exist_ok=True)
+            with open(os.path.join(self.log_folder, LOG_FILE), 'a') as log_file:
+                log_file.write(text + '\n\n')
+
+
+profiler = StartupProfiler(enabled=bool(os.environ.get(ENV_VAR)) or CLI_FLAG in sys.argv)
@@ -10,7 +10,7 @@ import datetime as dt
 # Debugging
 import sys
 import traceback
-NUM_DEVICES = 3  # MAX: 9
+NUM_DEVICES = 3
 PRINT_STATE_CHANGE = False
 DEVICE_0_HISTORY = [
     Session(customerName='Customer 1',
@@ -0,0 +1,144 @@
+"""
+Tests of the local API, served on a free port with fake plugs
+"""
+from src.api import (ApiError, ApiServer)
+from src.api_client import (ApiClient, RemoteStationCore)
+from src.core import Session
+from src.recurrence import RecurrenceRule
+from src.service import StationService
+import asyncio
+import datetime as dt
+import threading
+import pytest
+
+NOW = dt.datetime(2021, 6, 7, 10, 0)
+
+
+class FixedClock:
+    """Clock standing still at a date"""
+
+    def __init__(self, date: dt.datetime):
+        self.date = date
+
+    def now(self) -> dt.datetime:
+        return self.date
+
+    def today(self) -> dt.date:
+        return self.date.date()
+
+
+class FakePlug:
+    def __init__(self):
+        self.commands = []
+
+    def power_on(self):
+        self.commands.append('on')
+
+    def power_off(self):
+        self.commands.append('off')
+
+
+@pytest.fixture
+def daemon():
+    """Service with two fake plugs served on a free port"""
+    clock = FixedClock(NOW)
+    service = StationService(clock=clock)
+    service.set_plugs([('plug-a', 'Bay 1', FakePlug()), ('plug-b', 'Bay 2', FakePlug())])
+    server = ApiServer(service, port=0)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result(5)
+    yield service, ApiClient(f'http://127.0.0.1:{server.port}'), clock
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+def test_stations_are_listed(daemon):
+    service, client, _ = daemon
+    assert [(station['stationID'], station['deviceName']) for station in client.stations()] == \
+        [(0, 'Bay 1'), (1, 'Bay 2')]
+
+
+def test_conflicts_need_replace(daemon):
+    service, client, _ = daemon
+    client.set_activated(0, True)
+    first = client.add_session(0, 'Team A', NOW + dt.timedelta(hours=1), dt.timedelta(hours=1))
+    with pytest.raises(ApiError) as error:
+        client.add_session(0, 'Team B', NOW + dt.timedelta(minutes=90), dt.timedelta(hours=1))
+    assert error.value.status == 409
+    assert [session['sessionID'] for session in error.value.data['conflicting']] == [first.sessionID]
+    second = client.add_session(0, 'Team B', NOW + dt.timedelta(minutes=90), dt.timedelta(hours=1), replace=True)
+    assert [session.sessionID for session in client.sessions(0)] == [second.sessionID]
+
+
+def test_invalid_requests(daemon):
+    service, client, _ = daemon
+    with pytest.raises(ApiError) as error:
+        client.request('POST', '/stations/0/sessions', {'customerName': 'A', 'length': True})
+    assert error.value.status == 400
+    with pytest.raises(ApiError) as error:
+        client.station(7)
+    assert error.value.status == 404
+    with pytest.raises(ApiError) as error:
+        client.delete_recurrence(0, 99)
+    assert error.value.status == 404
+
+
+def test_delete_sessions_in_one_request(daemon):
+    service, client, _ = daemon
+    client.set_activated(1, True)
+    sessions = [client.add_session(1, f'Team {x}', NOW + dt.timedelta(hours=x), dt.timedelta(hours=1))
+                for x in range(1, 4)]
+    # A session that is gone already is skipped
+    deleted = client.delete_sessions(1, [sessions[0].sessionID, sessions[2].sessionID, 12345])
+    assert deleted == [sessions[0].sessionID, sessions[2].sessionID]
+    assert [session.sessionID for session in client.sessions(1)] == [sessions[1].sessionID]
+
+
+
+def test_recurrence_reports_skipped_occurrences(daemon):
+    service, client, _ = daemon
+    client.set_activated(0, True)
+    booking = client.add_session(0, 'Birthday', NOW + dt.timedelta(days=2), dt.timedelta(hours=1))
+    queued, skipped = client.add_recurrence(0, 'League', NOW + dt.timedelta(days=1), dt.timedelta(hours=2),
+                                            'FREQ=DAILY;INTERVAL=1')
+    assert [session.start_date for session in skipped] == [NOW + dt.timedelta(days=2)]
+    assert booking.sessionID in [session.sessionID for session in client.sessions(0)]
+    assert len(queued) == 6
+
+def test_remote_core_mirrors_the_station(daemon):
+    service, client, clock = daemon
+    core = RemoteStationCore(client, clock=clock)
+    assert core.attach(0) == []
+    core.is_activated = True
+    assert service.station(0).core.is_activated
+    assert core.add_session('Walk-in', None, dt.timedelta(hours=1))
+    assert [session.customerName for session in core.sessions] == ['Walk-in']
+    assert core.sessions[0].start_date == NOW
+    # Conflicts are confirmed like with the local core
+    asked = []
+
+    def confirm(new_session: Session, conflicting_sessions: list) -> bool:
+        asked.append(conflicting_sessions)
+        return False
+    assert not core.add_session('Team', NOW + dt.timedelta(minutes=30), dt.timedelta(hours=1), confirm=confirm)
+    assert [session.customerName for session in asked[0]] == ['Walk-in']
+    # Recurring sessions are deleted with all their occurrences
+    core.add_recurrence(RecurrenceRule.from_rrule('FREQ=DAILY;INTERVAL=1', customerName='League',
+                                                  start_date=NOW + dt.timedelta(days=1),
+                                                  duration=dt.timedelta(hours=2)))
+    rule = core.recurrences.rule_of(next(session for session in core.sessions if session.customerName == 'League'))
+    core.remove_recurrence(rule)
+    assert [session.customerName for session in core.sessions] == ['Walk-in']
+    core.delete_sessions(core.sessions)
+    assert core.sessions == [] and service.station(0).core.sessions == []
+
+
+def test_unreachable_daemon():
+    client = ApiClient('http://127.0.0.1:9', timeout=1)
+    with pytest.raises(ApiError) as error:
+        client.stations()
+    assert error.value.status == 503
@@ -0,0 +1,62 @@
+"""
+Tests of the rate tables and the revenue partitions
+"""
+from src.billing import (RateTable, RevenueEngine, PEAK, OFF_PEAK)
+from src.core import (Session, to_epoch)
+import datetime as dt
+
+# Monday
+NOW = dt.datetime(2021, 6, 7, 10, 0)
+
+
+def split(table: RateTable, start_date: dt.datetime, end_date: dt.datetime) -> dict:
+    return {tier: (seconds, round(amount, 2))
+            for tier, (seconds, amount) in table.split(to_epoch(start_date), to_epoch(end_date)).items()}
+
+
+def test_band_past_midnight():
+    table = RateTable(30.0, bands=[{'days': ['MO'], 'start': '22:00', 'end': '02:00', 'rate': 60.0}])
+    monday = dt.datetime(2021, 6, 7)
+    assert split(table, monday + dt.timedelta(hours=21), monday + dt.timedelta(hours=27)) == \
+        {OFF_PEAK: (2 * 3600, 60.0), PEAK: (4 * 3600, 240.0)}
+
+
+def test_band_from_sunday_into_monday():
+    table = RateTable(30.0, bands=[{'days': ['SU'], 'start': '22:00', 'end': '02:00', 'rate': 60.0}])
+    sunday = dt.datetime(2021, 6, 13)
+    assert split(table, sunday + dt.timedelta(hours=21), sunday + dt.timedelta(hours=27)) == \
+        {OFF_PEAK: (2 * 3600, 60.0), PEAK: (4 * 3600, 240.0)}
+    # The Monday morning of the first week is in the band as well
+    monday = dt.datetime(2021, 6, 7)
+    assert split(table, monday, monday + dt.timedelta(hours=1)) == {PEAK: (3600, 60.0)}
+
+
+def test_later_bands_take_precedence():
+    table = RateTable(30.0, bands=[{'days': ['MO'], 'start': '10:00', 'end': '14:00', 'rate': 40.0},
+                                   {'days': ['MO'], 'start': '12:00', 'end': '13:00', 'rate': 50.0, 'tier': 'lunch'}])
+    assert split(table, NOW, NOW + dt.timedelta(hours=4)) == {PEAK: (3 * 3600, 120.0), 'lunch': (3600, 50.0)}
+
+
+def test_invalidate_recalculates_only_changed_days():
+    engine = RevenueEngine()
+    engine.configure({'currency': '€', 'stations': {'default': {'rate': 30.0}}})
+    history = [Session('A', NOW, dt.timedelta(hours=1)),
+               Session('B', NOW + dt.timedelta(days=1), dt.timedelta(hours=1))]
+    days = engine.days('plug-a', history)
+    assert engine.total('plug-a', history)[0] == 60.0
+    monday, tuesday = days[to_epoch(NOW) // 86400], days[to_epoch(NOW) // 86400 + 1]
+    added = Session('C', NOW + dt.timedelta(days=1, hours=2), dt.timedelta(minutes=30))
+    history.append(added)
+    # Not marked yet, the cached partitions are returned
+    assert engine.total('plug-a', history)[0] == 60.0
+    engine.invalidate('plug-a', [added])
+    days = engine.days('plug-a', history)
+    assert days[to_epoch(NOW) // 86400] is monday
+    assert days[to_epoch(NOW) // 86400 + 1] is not tuesday
+    assert days[to_epoch(NOW) // 86400 + 1].sessions == 2
+    assert engine.total('plug-a', history)[0] == 75.0
+    # A replaced history is calculated again as a whole
+    history.pop(0)
+    engine.invalidate_device('plug-a')
+    assert engine.total('plug-a', history)[0] == 45.0
+    assert len(engine.days('plug-a', history)) == 1
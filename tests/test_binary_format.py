@@ -0,0 +1,65 @@
+"""
+Tests of the saved data format
+"""
+from src.core import Session
+from src.data import binary_format
+from src.data import data_manager
+from src.data.data_manager import DataManager
+import datetime as dt
+import io
+import pytest
+
+START = dt.datetime(2021, 6, 7, 18, 0)
+
+
+def round_trip(data: dict) -> dict:
+    file = io.BytesIO()
+    binary_format.encode(data, file)
+    file.seek(0)
+    return binary_format.decode(file)
+
+
+def test_queued_sessions_round_trip():
+    queued = [Session('League', START + dt.timedelta(days=14), dt.timedelta(hours=2)),
+              Session('Walk-in', START, dt.timedelta(minutes=45))]
+    data = round_trip({'username': 'user',
+                       'tracked_sessions': {'plug-1': [Session('Past', START - dt.timedelta(days=1), 3600)]},
+                       'queued_sessions': {'plug-1': queued}})
+    assert data['username'] == 'user'
+    assert [(s.customerName, s.start, s.length) for s in data['queued_sessions']['plug-1']] == \
+        [(s.customerName, s.start, s.length) for s in queued]
+    assert [s.customerName for s in data['tracked_sessions']['plug-1']] == ['Past']
+
+
+def test_device_keys_round_trip():
+    recurring_sessions = {'plug-1': [{'customerName': 'League'}], 7: []}
+    data = round_trip({'recurring_sessions': recurring_sessions, 'tracked_sessions': {7: []}})
+    assert data['recurring_sessions'] == recurring_sessions
+    assert list(data['tracked_sessions']) == [7]
+
+
+def test_corrupt_file_is_kept(tmp_path):
+    path = tmp_path / 'data.pkl'
+    file = io.BytesIO()
+    binary_format.encode({'username': 'user'}, file)
+    path.write_bytes(file.getvalue()[:-3])
+    dataManager = DataManager(default_data={'username': ''}, file_path=str(path))
+    assert dataManager.data['username'] == ''
+    assert (tmp_path / 'data.pkl.corrupt').read_bytes() == file.getvalue()[:-3]
+
+
+def test_newer_version_is_not_overwritten(tmp_path):
+    path = tmp_path / 'data.pkl'
+    content = binary_format.HEADER.pack(binary_format.MAGIC, binary_format.VERSION + 1, 0)
+    path.write_bytes(content)
+    with pytest.raises(binary_format.VersionError):
+        DataManager(default_data={'username': ''}, file_path=str(path))
+    assert path.read_bytes() == content
+
+
+def test_data_file_can_be_set_by_the_environment(tmp_path, monkeypatch):
+    path = tmp_path / 'simulation' / 'data.pkl'
+    monkeypatch.setenv(data_manager.FILE_ENV_VAR, str(path))
+    dataManager = DataManager(default_data={'username': ''})
+    assert dataManager.file_path == str(path) and dataManager.save_folder == str(path.parent)
+    assert path.exists()
@@ -0,0 +1,126 @@
+"""
+Tests of the Qt free session logic
+"""
+from src.core import (StationCore, Session, SessionHistoryIndex, reconcile_devices)
+from src.recurrence import RecurrenceRule
+import datetime as dt
+
+
+class FixedClock:
+    """Clock standing still at a date"""
+
+    def __init__(self, date: dt.datetime):
+        self.date = date
+
+    def now(self) -> dt.datetime:
+        return self.date
+
+    def today(self) -> dt.date:
+        return self.date.date()
+
+
+NOW = dt.datetime(2021, 6, 7, 10, 0)
+
+
+def test_add_session_without_start_ignores_later_occurrences():
+    core = StationCore(clock=FixedClock(NOW))
+    core.is_activated = True
+    # Daily league from tomorrow on, queued a week ahead
+    core.add_recurrence(RecurrenceRule.from_rrule('FREQ=DAILY;INTERVAL=1', customerName='League',
+                                                  start_date=NOW + dt.timedelta(days=1),
+                                                  duration=dt.timedelta(hours=2)))
+    assert core.sessions[-1].start_date.date() > NOW.date()
+    assert core.add_session('Walk-in', None, dt.timedelta(hours=1))
+    walk_in = next(session for session in core.sessions if session.customerName == 'Walk-in')
+    assert walk_in.start_date == NOW
+
+
+
+def test_add_recurrence_reports_skipped_occurrences():
+    core = StationCore(clock=FixedClock(NOW))
+    core.is_activated = True
+    booking = Session('Birthday', NOW + dt.timedelta(days=3, minutes=30), dt.timedelta(hours=1))
+    core.add_sessions([booking])
+    rule = RecurrenceRule.from_rrule('FREQ=DAILY;INTERVAL=1', customerName='League',
+                                     start_date=NOW + dt.timedelta(days=1),
+                                     duration=dt.timedelta(hours=2))
+    conflicting, skipped = core.recurrence_conflicts(rule)
+    assert conflicting == []
+    assert [session.start_date for session in skipped] == [NOW + dt.timedelta(days=3)]
+    queued, skipped = core.add_recurrence(rule)
+    assert [session.start_date for session in skipped] == [NOW + dt.timedelta(days=3)]
+    assert NOW + dt.timedelta(days=3) not in [session.start_date for session in queued]
+    # The skipped occurrence is not part of the schedule
+    assert core.recurrences.rule_of(skipped[0]) is None
+    assert booking in core.sessions
+
+def test_add_session_without_start_appends_to_running_sessions():
+    core = StationCore(clock=FixedClock(NOW))
+    core.is_activated = True
+    core.sessions = [Session('A', NOW - dt.timedelta(minutes=30), dt.timedelta(hours=1)),
+                     Session('B', NOW + dt.timedelta(minutes=30), dt.timedelta(hours=1)),
+                     Session('C', NOW + dt.timedelta(days=3), dt.timedelta(hours=1))]
+    assert core.next_free_start() == NOW + dt.timedelta(minutes=90)
+
+
+def test_restore_sessions_keeps_bookings_and_drops_occurrences():
+    core = StationCore(clock=FixedClock(NOW))
+    core.add_recurrence(RecurrenceRule.from_rrule('FREQ=DAILY;INTERVAL=1', customerName='League',
+                                                  start_date=NOW + dt.timedelta(days=1),
+                                                  duration=dt.timedelta(hours=2)))
+    booking = Session('Birthday', NOW + dt.timedelta(days=20), dt.timedelta(hours=3))
+    past = Session('Gone', NOW - dt.timedelta(days=1), dt.timedelta(hours=1))
+    core.add_sessions([booking])
+    assert core.booked_sessions() == [booking]
+
+    restored = StationCore(clock=FixedClock(NOW))
+    assert restored.restore_sessions(core.booked_sessions() + [past]) == [booking]
+
+
+def test_history_index_searches_dates_by_prefix():
+    index = SessionHistoryIndex()
+    index.add('1', Session('Anna Berg', NOW, dt.timedelta(hours=1)))
+    index.add('1', Session('Ben Kurz', NOW + dt.timedelta(days=30), dt.timedelta(hours=1)))
+    assert [index.sessions[key].customerName for key in index.search('07.06')] == ['Anna Berg']
+    assert [index.sessions[key].customerName for key in index.search('07.')] == ['Ben Kurz', 'Anna Berg']
+    assert index.search('08.06') == []
+
+
+def test_history_index_compacts_removed_entries():
+    index = SessionHistoryIndex()
+    sessions = [Session(f'Customer {x}', NOW + dt.timedelta(hours=x), dt.timedelta(hours=1))
+                for x in range(2 * index.COMPACT_MINIMUM)]
+    for session in sessions:
+        index.add('1', session)
+    for session in sessions[:index.COMPACT_MINIMUM]:
+        index.remove('1', session)
+    assert index.generation == 1
+    assert len(index.sessions) == index.COMPACT_MINIMUM and None not in index.sessions
+    found = index.search(f'customer {len(sessions) - 1}')
+    assert [index.sessions[key] for key in found] == [sessions[-1]]
+    index.remove_device('1')
+    assert index.search('') == []
+
+
+def test_add_session_without_start_skips_gaps_that_are_too_short():
+    core = StationCore(clock=FixedClock(NOW))
+    core.is_activated = True
+    booking = Session('B', NOW + dt.timedelta(hours=1), dt.timedelta(hours=1))
+    core.sessions = [Session('A', NOW - dt.timedelta(minutes=30), dt.timedelta(hours=1)), booking]
+    # 30 minute gap: fits a short session, not an hour
+    assert core.next_free_start(duration=dt.timedelta(minutes=30)) == NOW + dt.timedelta(minutes=30)
+    assert core.next_free_start(duration=dt.timedelta(hours=1)) == NOW + dt.timedelta(hours=2)
+    assert core.add_session('Walk-in', None, dt.timedelta(hours=1))
+    walk_in = next(session for session in core.sessions if session.customerName == 'Walk-in')
+    assert walk_in.start_date == NOW + dt.timedelta(hours=2)
+    assert booking in core.sessions
+
+
+def test_reconcile_devices_keeps_the_stations_of_remaining_devices():
+    placed = {'a': (0, 'Bay 02'), 'b': (1, 'Bay 03'), 'c': (2, 'Bay 04')}
+    # Bay 01 is new, Bay 03 went away, Bay 04 was renamed
+    changes = reconcile_devices(placed, [('a', 'Bay 02'), ('c', 'Bay 05'), ('n', 'Bay 01'), ('m', 'Bay 06')])
+    assert changes == {'add': [('n', 1), ('m', 3)],
+                       'remove': [('b', 1)],
+                       'rename': [('c', 2)],
+                       'keep': [('a', 0)]}
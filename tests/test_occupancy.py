@@ -0,0 +1,51 @@
+"""
+Tests of the occupancy sweep over all stations
+"""
+from src.core import Session
+from src.occupancy import OccupancyTimeline
+import datetime as dt
+
+NOW = dt.datetime(2021, 6, 7, 10, 0)
+
+
+def at(hours: float) -> dt.datetime:
+    return NOW + dt.timedelta(hours=hours)
+
+
+def test_end_and_start_in_the_same_second():
+    timeline = OccupancyTimeline()
+    histories = {
+        # Back to back sessions of a station
+        'plug-a': [Session('A', at(0), dt.timedelta(hours=2)), Session('B', at(2), dt.timedelta(hours=1))],
+        # Starts when the other station's first session ends
+        'plug-b': [Session('C', at(2), dt.timedelta(hours=2))],
+    }
+    result = timeline.occupancy(histories, at(-1), at(5))
+    assert [(start, end, count) for start, end, count in result.steps()] == \
+        [(at(-1), at(0), 0), (at(0), at(2), 1), (at(2), at(3), 2), (at(3), at(4), 1), (at(4), at(5), 0)]
+    assert result.peak == (2, at(2))
+    assert result.fully_booked() == [(at(2), at(3))]
+    assert result.value_at(at(2)) == 2
+
+
+def test_session_ending_when_another_starts_is_not_counted_twice():
+    timeline = OccupancyTimeline()
+    histories = {'plug-a': [Session('A', at(0), dt.timedelta(hours=1))],
+                 'plug-b': [Session('B', at(1), dt.timedelta(hours=1))]}
+    result = timeline.occupancy(histories, at(0), at(2))
+    assert result.counts == [1]
+    assert result.fully_booked() == []
+    assert result.average() == 1.0
+
+
+def test_changed_history_is_swept_again():
+    timeline = OccupancyTimeline()
+    histories = {'plug-a': [Session('A', at(0), dt.timedelta(hours=1))]}
+    assert timeline.occupancy(histories, at(0), at(2)).durations() == {1: 3600, 0: 3600}
+    version = timeline.version
+    histories['plug-a'].append(Session('B', at(1), dt.timedelta(hours=1)))
+    timeline.invalidate_device('plug-a')
+    assert timeline.version > version
+    assert timeline.occupancy(histories, at(0), at(2)).durations() == {1: 7200}
+    # A removed station is dropped from the sweep
+    assert timeline.occupancy({}, at(0), at(2)).counts == [0]
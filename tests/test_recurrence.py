@@ -0,0 +1,59 @@
+"""
+Tests of the recurrence rules and the look-ahead schedule
+"""
+from src.core import (Session, to_epoch)
+from src.recurrence import (RecurrenceRule, RecurrenceSchedule)
+import datetime as dt
+import pytest
+
+# Monday
+NOW = dt.datetime(2021, 6, 7, 10, 0)
+
+
+def starts(rule: RecurrenceRule, window_start: dt.datetime, window_end: dt.datetime) -> list:
+    return [session.start_date for session in
+            (rule.create_session(start) for start in rule.occurrences(to_epoch(window_start), to_epoch(window_end)))]
+
+
+def league(rrule: str, exdates=()) -> RecurrenceRule:
+    return RecurrenceRule.from_rrule(rrule, customerName='League', start_date=NOW,
+                                     duration=dt.timedelta(hours=2), exdates=exdates)
+
+
+def test_weekly_byday_count():
+    rule = league('FREQ=WEEKLY;INTERVAL=1;BYDAY=MO,WE;COUNT=5')
+    assert starts(rule, NOW, NOW + dt.timedelta(days=60)) == \
+        [NOW + dt.timedelta(days=days) for days in (0, 2, 7, 9, 14)]
+    # The count is kept for windows starting later
+    assert starts(rule, NOW + dt.timedelta(days=8), NOW + dt.timedelta(days=60)) == \
+        [NOW + dt.timedelta(days=days) for days in (9, 14)]
+
+
+def test_weekly_interval_until():
+    # UNTIL without a time includes the whole last day
+    rule = league('FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,FR;UNTIL=20210625')
+    assert starts(rule, NOW, NOW + dt.timedelta(days=60)) == \
+        [NOW + dt.timedelta(days=days) for days in (0, 4, 14, 18)]
+
+
+def test_exdates_and_rrule_text():
+    rule = league('FREQ=DAILY;INTERVAL=1', exdates=[to_epoch(NOW + dt.timedelta(days=1))])
+    assert starts(rule, NOW, NOW + dt.timedelta(days=3)) == [NOW, NOW + dt.timedelta(days=2)]
+    assert league('RRULE:FREQ=WEEKLY;BYDAY=WE,MO;COUNT=3').to_rrule() == 'FREQ=WEEKLY;INTERVAL=1;BYDAY=MO,WE;COUNT=3'
+    with pytest.raises(ValueError):
+        league('FREQ=WEEKLY;BYMONTH=1')
+
+
+def test_schedule_expands_up_to_the_horizon():
+    schedule = RecurrenceSchedule([league('FREQ=DAILY;INTERVAL=1')], lookahead=dt.timedelta(days=2))
+    now = to_epoch(NOW)
+    first = schedule.expand(now)
+    # Rounded up to the next day: today, tomorrow and the day after
+    assert [session.start_date for session in first] == [NOW + dt.timedelta(days=days) for days in range(3)]
+    assert not schedule.needs_expansion(now + 3600)
+    second = schedule.expand(now + 24 * 3600)
+    assert [session.start_date for session in second] == [NOW + dt.timedelta(days=3)]
+    # Cancelled occurrences are not queued again
+    schedule.cancel([Session.from_epoch('League', second[0].start, second[0].length, second[0].sessionID)])
+    assert schedule.rule_of(second[0]) is None
+    assert to_epoch(NOW + dt.timedelta(days=3)) in schedule.rules[0].exdates
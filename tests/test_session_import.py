@@ -0,0 +1,56 @@
+"""
+Tests of the session import
+"""
+from src.data.session_import import (read_sessions, SessionImportError)
+import datetime as dt
+import json
+import pytest
+
+DAY = dt.date(2021, 6, 7)
+
+
+def write(tmp_path, name: str, text: str) -> str:
+    path = tmp_path / name
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_csv_rows(tmp_path):
+    path = write(tmp_path, 'league.csv', 'customerName;start;duration;end\n'
+                                         'Team A;2021-06-04 18:00;1:30;\n'
+                                         'Team B;18:00;90;\n'
+                                         'Team C;22:30;;00:30\n')
+    sessions, skipped = read_sessions(path, DAY)
+    assert skipped == []
+    assert [(session.customerName, session.start_date, session.end_date) for session in sessions] == [
+        ('Team A', dt.datetime(2021, 6, 4, 18, 0), dt.datetime(2021, 6, 4, 19, 30)),
+        ('Team B', dt.datetime(2021, 6, 7, 18, 0), dt.datetime(2021, 6, 7, 19, 30)),
+        ('Team C', dt.datetime(2021, 6, 7, 22, 30), dt.datetime(2021, 6, 8, 0, 30)),
+    ]
+
+
+@pytest.mark.parametrize('duration', ['inf', '-inf', 'nan', '1e12', '99999999999999:00', '0', '-30', 'abc'])
+def test_invalid_durations_are_skipped(tmp_path, duration):
+    path = write(tmp_path, 'sessions.csv', f'customerName,start,duration\nTeam A,18:00,{duration}\nTeam B,20:00,60\n')
+    sessions, skipped = read_sessions(path, DAY)
+    assert [session.customerName for session in sessions] == ['Team B']
+    assert len(skipped) == 1 and skipped[0].startswith('Row 2:')
+
+
+def test_end_past_the_last_date_is_skipped(tmp_path):
+    path = write(tmp_path, 'sessions.json', json.dumps([{'customerName': 'A', 'start': '9999-12-31 23:00',
+                                                          'duration': 120}]))
+    sessions, skipped = read_sessions(path, DAY)
+    assert sessions == [] and len(skipped) == 1
+
+
+def test_json_needs_session_objects(tmp_path):
+    sessions, skipped = read_sessions(write(tmp_path, 'sessions.json', json.dumps(
+        {'sessions': [{'customerName': 'A', 'start': '18:00', 'end': '19:00'}]})), DAY)
+    assert len(sessions) == 1 and skipped == []
+    with pytest.raises(SessionImportError):
+        read_sessions(write(tmp_path, 'invalid.json', '[1, 2]'), DAY)
+    with pytest.raises(SessionImportError):
+        read_sessions(write(tmp_path, 'broken.json', '{'), DAY)
+    with pytest.raises(SessionImportError):
+        read_sessions(write(tmp_path, 'no_header.csv', 'A,18:00,60\n'), DAY)